@@ -0,0 +1,93 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from api.openaq import get_aqi_level
+from utils.env import load_env
+from utils.log import get_logger
+from utils.metrics import count_upstream_bytes
+
+load_env()
+
+log = get_logger('airnow')
+
+AIRNOW_API_KEY = os.getenv('AIRNOW_API_KEY')
+BASE_URL = os.getenv('AIRNOW_BASE_URL', "https://www.airnowapi.org")
+
+# AirNow parameter names -> the measurement keys OpenAQ uses
+PARAMETERS = {
+    'PM2.5': 'pm25',
+    'PM10': 'pm10',
+    'OZONE': 'o3',
+    'NO2': 'no2',
+    'CO': 'co',
+    'SO2': 'so2',
+}
+
+# Hourly data is published with a lag; look back this far for the latest hour
+LOOKBACK_HOURS = 2
+
+
+async def fetch_airnow_stations(client, bbox):
+    """
+    Latest hourly AirNow monitor data in bbox (min_lon, min_lat, max_lon,
+    max_lat) as station dicts; raises on upstream failure
+    """
+    now = datetime.now(timezone.utc)
+    params = {
+        'startDate': (now - timedelta(hours=LOOKBACK_HOURS)).strftime('%Y-%m-%dT%H'),
+        'endDate': now.strftime('%Y-%m-%dT%H'),
+        'parameters': 'PM25,PM10,OZONE,NO2',
+        'BBOX': ','.join(str(v) for v in bbox),
+        'dataType': 'B',
+        'format': 'application/json',
+        'verbose': 1,
+        'monitorType': 0,
+        'API_KEY': AIRNOW_API_KEY,
+    }
+    response = await client.get(f"{BASE_URL}/aq/data/", params=params)
+    count_upstream_bytes('airnow', response)
+    response.raise_for_status()
+
+    stations = process_airnow_rows(response.json() or [])
+    log.debug("Loaded AirNow stations", extra={'stations': len(stations)})
+    return stations
+
+
+def process_airnow_rows(rows):
+    """
+    One station per monitoring site from AirNow's per-parameter rows,
+    keeping each parameter's latest hour; the site's AQI is the highest
+    of its parameters' AQIs, as AirNow reports it
+    """
+    sites = {}
+    for row in rows:
+        latitude, longitude = row.get('Latitude'), row.get('Longitude')
+        parameter = PARAMETERS.get(str(row.get('Parameter', '')).upper())
+        if latitude is None or longitude is None or parameter is None:
+            continue
+        site_id = row.get('FullAQSCode') or row.get('IntlAQSCode') or f"{latitude},{longitude}"
+        site = sites.setdefault(site_id, {'row': row, 'latest': {}})
+        # Rows of one parameter arrive oldest first; the newest wins
+        latest = site['latest'].get(parameter)
+        if latest is None or row.get('UTC', '') >= latest.get('UTC', ''):
+            site['latest'][parameter] = row
+
+    stations = []
+    for site_id, site in sites.items():
+        row = site['row']
+        aqis = [r['AQI'] for r in site['latest'].values() if r.get('AQI') is not None and r['AQI'] >= 0]
+        aqi = max(aqis) if aqis else None
+        observed = max(r.get('UTC', '') for r in site['latest'].values())
+        stations.append({
+            'id': f"airnow:{site_id}",
+            'name': row.get('SiteName') or 'AirNow Monitor',
+            'lat': row['Latitude'],
+            'lng': row['Longitude'],
+            'aqi': aqi,
+            'level': get_aqi_level(aqi) if aqi is not None else None,
+            'timestamp': f"{observed}:00Z" if observed else None,
+            'measurements': {parameter: r.get('Value') for parameter, r in site['latest'].items()
+                             if r.get('Value') is not None and r['Value'] >= 0},
+            'source': 'AirNow'
+        })
+    return stations
@@ -0,0 +1,272 @@
+import asyncio
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from api.airnow import AIRNOW_API_KEY, fetch_airnow_stations
+from api.openaq import (fetch_latest_measurements, fetch_stations_in_bbox, generate_sample_data,
+                        latest_cache_key)
+from api.purpleair import PURPLEAIR_API_KEY, fetch_purpleair_stations
+from api.station_drops import STATION_DROP_DIR, drop_stations_in_bbox
+from utils.circuit_breaker import call_upstream_async
+from utils.geo import EARTH_RADIUS_KM, haversine_km, radius_bbox
+from utils.log import get_logger
+
+log = get_logger('connectors')
+
+# ========================================
+# Station connectors
+# ========================================
+# Every station source is a Connector whose fetchers return station
+# dicts in the OpenAQ client's schema. The hub runs all enabled
+# connectors concurrently on one event loop per process, sharing one
+# httpx connection pool, and every call goes through the source's circuit
+# breaker and request budget. A source adds one round trip in parallel
+# with the others, not one more in series.
+
+# A source slower than this is left out of the result (seconds)
+CONNECTOR_TIMEOUT = 10
+
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE_CONNECTIONS = 16
+
+# Stations kept per source for a point query (the OpenAQ client's limit)
+NEAR_STATIONS_PER_SOURCE = 5
+
+# Stations of different sources closer than this are one site
+DEDUP_DISTANCE_KM = 0.1
+
+
+class Connector:
+    """
+    One station source
+
+    fetch_bbox(client, bbox) returns every station in bbox. Point queries
+    use fetch_near(client, lat, lon, radius_km) when given, else the
+    nearest NEAR_STATIONS_PER_SOURCE stations of a bbox query around the
+    point. upstream names the breaker and budget the calls go through
+    (None for local sources).
+    """
+
+    def __init__(self, name, fetch_bbox, fetch_near=None, upstream=None, enabled=True):
+        self.name = name
+        self.fetch_bbox = fetch_bbox
+        self.fetch_near = fetch_near
+        self.upstream = upstream
+        self.enabled = enabled
+
+    async def _call(self, cache_key, fetch, *args):
+        if self.upstream is None:
+            return await fetch(*args)
+        stations, stale = await call_upstream_async(self.upstream, cache_key, fetch, *args)
+        if stale:
+            log.info("Serving cached stations (stale)", extra={'source': self.name, 'stations': len(stations)})
+        return stations
+
+    async def _nearest(self, client, lat, lon, radius_km):
+        stations = await self.fetch_bbox(client, radius_bbox(lat, lon, radius_km))
+        by_distance = sorted((haversine_km(lat, lon, s['lat'], s['lng']), i)
+                             for i, s in enumerate(stations))
+        return [stations[i] for distance, i in by_distance
+                if distance <= radius_km][:NEAR_STATIONS_PER_SOURCE]
+
+    async def near(self, client, lat, lon, radius_km):
+        fetch = self.fetch_near or self._nearest
+        return await self._call(latest_cache_key(lat, lon, radius_km), fetch, client, lat, lon, radius_km)
+
+    async def in_bbox(self, client, bbox):
+        return await self._call(('bbox',) + tuple(bbox), self.fetch_bbox, client, bbox)
+
+
+# The OpenAQ client is synchronous and spends its own per-station
+# tokens; it runs in a worker thread alongside the async sources
+async def _openaq_near(client, lat, lon, radius_km):
+    return await asyncio.to_thread(fetch_latest_measurements, lat, lon, radius_km)
+
+
+async def _openaq_bbox(client, bbox):
+    return await asyncio.to_thread(fetch_stations_in_bbox, bbox)
+
+
+async def _drops_bbox(client, bbox):
+    return await asyncio.to_thread(drop_stations_in_bbox, bbox)
+
+
+# In priority order: where stations of two sources coincide, the
+# earlier source's station is kept (reference monitors over sensors)
+CONNECTORS = [
+    Connector('OpenAQ', _openaq_bbox, fetch_near=_openaq_near, upstream='openaq'),
+    Connector('AirNow', fetch_airnow_stations, upstream='airnow', enabled=bool(AIRNOW_API_KEY)),
+    Connector('Local', _drops_bbox, enabled=bool(STATION_DROP_DIR)),
+    Connector('PurpleAir', fetch_purpleair_stations, upstream='purpleair',
+              enabled=bool(PURPLEAIR_API_KEY)),
+]
+
+
+def merge_stations(results):
+    """
+    Stations of every source, in source order, one per site
+
+    A station within DEDUP_DISTANCE_KM of a kept station from another
+    source is dropped; fresh stations are kept over stale ones, then
+    earlier sources over later ones.
+    """
+    if len(results) == 1:
+        return list(results[0])
+
+    candidates = [(rank, station) for rank, stations in enumerate(results) for station in stations]
+    located = [i for i, (_, s) in enumerate(candidates)
+               if s.get('lat') is not None and s.get('lng') is not None]
+    if not located:
+        return [station for _, station in candidates]
+
+    # Grid cells at least DEDUP_DISTANCE_KM wide, so duplicates are
+    # always in neighbouring cells
+    lat_step = math.degrees(DEDUP_DISTANCE_KM / EARTH_RADIUS_KM)
+    widest = min(max(abs(candidates[i][1]['lat']) for i in located), 89.0)
+    lon_step = lat_step / math.cos(math.radians(widest))
+
+    grid = {}
+    dropped = set()
+    for i in sorted(located, key=lambda i: (bool(candidates[i][1].get('stale')), candidates[i][0])):
+        rank, station = candidates[i]
+        x = math.floor(station['lng'] / lon_step)
+        y = math.floor(station['lat'] / lat_step)
+        if any(other_rank != rank and haversine_km(station['lat'], station['lng'],
+                                                   other['lat'], other['lng']) <= DEDUP_DISTANCE_KM
+               for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+               for other_rank, other in grid.get((x + dx, y + dy), ())):
+            dropped.add(i)
+            continue
+        grid.setdefault((x, y), []).append((rank, station))
+
+    if dropped:
+        log.debug("Merged duplicate stations", extra={'dropped': len(dropped)})
+    return [station for i, (_, station) in enumerate(candidates) if i not in dropped]
+
+
+class ConnectorHub:
+    """
+    Runs connector calls on a private event loop thread
+
+    Request threads submit a batch of calls and block until all are
+    done or CONNECTOR_TIMEOUT passes; sources that haven't answered by
+    then are cancelled and left out. The loop and its connection pool
+    are started on first use in each process.
+    """
+
+    def __init__(self, connectors, timeout=CONNECTOR_TIMEOUT):
+        self.connectors = connectors
+        self.timeout = timeout
+        self._loop = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return [c for c in self.connectors if c.enabled]
+
+    def _start(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                # Threads for the synchronous sources, one per concurrent call
+                loop.set_default_executor(ThreadPoolExecutor(MAX_CONNECTIONS, thread_name_prefix='connector'))
+                threading.Thread(target=loop.run_forever, name='connectors', daemon=True).start()
+                self._client = httpx.AsyncClient(timeout=self.timeout, limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS))
+                self._loop = loop
+            return self._loop, self._client
+
+    async def _gather(self, connectors, calls):
+        """Each connector's stations in order; [] for those that failed or timed out"""
+        tasks = [asyncio.ensure_future(call) for call in calls]
+        done, pending = await asyncio.wait(tasks, timeout=self.timeout)
+        for task in pending:
+            task.cancel()
+
+        results = []
+        for connector, task in zip(connectors, tasks):
+            if task in pending:
+                log.warning("Station source timed out", extra={'source': connector.name})
+            elif task.exception() is not None:
+                log.warning("Station source failed", extra={'source': connector.name,
+                                                            'error': str(task.exception())})
+            else:
+                results.append(task.result())
+                continue
+            results.append([])
+        return results
+
+    def _run(self, calls):
+        """
+        For each call, merge_stations of call(connector, client) over every
+        enabled connector; all calls run at once and share one deadline
+        """
+        connectors = self.enabled
+        if not connectors:
+            return [[] for _ in calls]
+        loop, client = self._start()
+        batch = [(connector, call(connector, client)) for call in calls for connector in connectors]
+        future = asyncio.run_coroutine_threadsafe(
+            self._gather([c for c, _ in batch], [coro for _, coro in batch]), loop)
+        results = future.result(self.timeout + 1)
+        n = len(connectors)
+        return [merge_stations(results[i:i + n]) for i in range(0, len(results), n)]
+
+    def stations_near(self, lat, lon, radius_km=25):
+        return self._run([lambda connector, client: connector.near(client, lat, lon, radius_km)])[0]
+
+    def stations_in_bbox(self, bbox):
+        return self.stations_in_bboxes([bbox])[0]
+
+    def stations_in_bboxes(self, bboxes):
+        """Stations for each bbox, fetched concurrently"""
+        return self._run([lambda connector, client, bbox=bbox: connector.in_bbox(client, bbox)
+                          for bbox in bboxes])
+
+    def status(self):
+        return [{'name': c.name, 'upstream': c.upstream, 'enabled': c.enabled} for c in self.connectors]
+
+    def reset(self):
+        # The loop thread does not survive a fork; start a new one on first use
+        self._loop = None
+        self._client = None
+        self._lock = threading.Lock()
+
+
+connector_hub = ConnectorHub(CONNECTORS)
+
+os.register_at_fork(after_in_child=connector_hub.reset)
+
+
+def get_station_measurements(lat, lon, radius_km=25):
+    """Stations near a point from every enabled source; sample data if none has any"""
+    try:
+        stations = connector_hub.stations_near(lat, lon, radius_km)
+    except Exception as e:
+        log.error("Station sources failed, using sample data: %s", e)
+        return generate_sample_data(lat, lon)
+
+    if not stations:
+        log.warning("No station source returned data, using sample data")
+        return generate_sample_data(lat, lon)
+    return stations
+
+
+def get_source_stations_in_bbox(bbox):
+    """Stations in bbox (min_lon, min_lat, max_lon, max_lat) from every enabled source"""
+    return get_source_stations_in_bboxes([bbox])[0]
+
+
+def get_source_stations_in_bboxes(bboxes):
+    """Stations in each bbox from every enabled source, all fetched at once"""
+    try:
+        return connector_hub.stations_in_bboxes(bboxes)
+    except Exception as e:
+        log.error("Station sources bbox error: %s", e)
+        return [[] for _ in bboxes]
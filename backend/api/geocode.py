@@ -0,0 +1,68 @@
+import os
+from utils.circuit_breaker import call_upstream
+from utils.env import load_env
+from utils.log import get_logger
+
+load_env()
+
+log = get_logger('geocode')
+
+OPENCAGE_API_KEY = os.getenv('OPENCAGE_API_KEY')
+
+try:
+    from opencage.geocoder import OpenCageGeocode
+    geocoder = OpenCageGeocode(OPENCAGE_API_KEY) if OPENCAGE_API_KEY else None
+except ImportError:
+    geocoder = None
+
+if geocoder is None:
+    log.warning("No OpenCage geocoder configured, search uses the local gazetteer only")
+
+
+def format_result(result):
+    """Trim an OpenCage result to what the map needs"""
+    components = result.get('components', {})
+    return {
+        'name': result.get('formatted', ''),
+        'lat': result['geometry']['lat'],
+        'lng': result['geometry']['lng'],
+        'type': components.get('_type', ''),
+        'country': components.get('country_code', '').upper(),
+        'source': 'OpenCage'
+    }
+
+
+def fetch_geocode(query, limit=5):
+    """Forward geocode a free-text query; raises on upstream failure"""
+    results = geocoder.geocode(query, limit=limit, no_annotations=1)
+    return [format_result(r) for r in results or []]
+
+
+def fetch_reverse_geocode(lat, lon):
+    """Reverse geocode a coordinate ({} if there's no place); raises on upstream failure"""
+    results = geocoder.reverse_geocode(lat, lon, no_annotations=1)
+    return format_result(results[0]) if results else {}
+
+
+def geocode_upstream(query, limit=5):
+    """Forward geocode through the breaker; None when unavailable"""
+    if geocoder is None:
+        return None
+    try:
+        results, _ = call_upstream('opencage', None, fetch_geocode, query, limit)
+        return results
+    except Exception as e:
+        log.error("OpenCage geocode error: %s", e)
+        return None
+
+
+def reverse_geocode_upstream(lat, lon):
+    """Reverse geocode through the breaker; {} when there's no place, None when unavailable"""
+    if geocoder is None:
+        return None
+    try:
+        result, _ = call_upstream('opencage', None, fetch_reverse_geocode, lat, lon)
+        return result
+    except Exception as e:
+        log.error("OpenCage reverse geocode error: %s", e)
+        return None
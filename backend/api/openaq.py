@@ -1,82 +1,192 @@
 import requests
 import os
-from dotenv import load_dotenv
 from datetime import datetime
+from utils.circuit_breaker import call_upstream, last_known_good, CircuitOpenError
+from utils.geo import snap_to_cell
+from utils.env import load_env
+from utils.log import get_logger
+from utils.metrics import count_upstream_bytes
+from utils.rate_limit import RateLimitExceeded, quota
 
-load_dotenv()
+load_env()
+
+log = get_logger('openaq')
 
 OPENAQ_API_KEY = os.getenv('OPENAQ_API_KEY')
-BASE_URL = "https://api.openaq.org/v3"
+BASE_URL = os.getenv('OPENAQ_BASE_URL', "https://api.openaq.org/v3")
+
+def latest_cache_key(lat, lon, radius_km=25):
+    """Circuit breaker cache key for a measurements lookup"""
+    return ('latest',) + snap_to_cell(lat, lon) + (radius_km,)
+
+
+def get_cached_measurements(lat, lon, radius_km=25):
+    """Last-known-good measurements for a location (marked stale), or None"""
+    return last_known_good('openaq', latest_cache_key(lat, lon, radius_km))
+
 
 def get_latest_measurements(lat, lon, radius_km=25):
     """Get latest air quality measurements using OpenAQ v3"""
-    print(f"🔍 Fetching OpenAQ data for ({lat}, {lon}) within {radius_km}km...")
-    
+    cache_key = latest_cache_key(lat, lon, radius_km)
+
+    try:
+        locations, stale = call_upstream(
+            'openaq', cache_key, fetch_latest_measurements, lat, lon, radius_km)
+    except CircuitOpenError:
+        log.warning("OpenAQ circuit open and nothing cached, using sample data")
+        return generate_sample_data(lat, lon)
+    except requests.Timeout:
+        log.warning("OpenAQ API timeout, using sample data")
+        return generate_sample_data(lat, lon)
+    except requests.RequestException as e:
+        log.warning("OpenAQ API request error, using sample data: %s", e)
+        return generate_sample_data(lat, lon)
+    except Exception as e:
+        log.error("OpenAQ error, using sample data: %s", e)
+        return generate_sample_data(lat, lon)
+
+    if stale:
+        log.info("Serving cached OpenAQ locations (stale)", extra={'locations': len(locations)})
+
+    if not locations:
+        log.warning("No locations could be processed, using sample data")
+        return generate_sample_data(lat, lon)
+
+    return locations
+
+
+def fetch_latest_measurements(lat, lon, radius_km=25):
+    """Fetch and process OpenAQ locations; raises on upstream failure"""
+    log.debug("Fetching OpenAQ locations", extra={'lat': lat, 'lon': lon, 'radius_km': radius_km})
+
     locations_url = f"{BASE_URL}/locations"
     params = {
         'limit': 20,
         'radius': radius_km * 1000,  # Convert to meters
         'coordinates': f"{lat},{lon}"
     }
-    
+
     headers = {}
     if OPENAQ_API_KEY:
         headers['X-API-Key'] = OPENAQ_API_KEY
-        print("🔑 Using OpenAQ API key")
-    else:
-        print("⚠️ No OpenAQ API key found, using public access")
-    
+
+    response = requests.get(locations_url, params=params, headers=headers, timeout=10)
+    count_upstream_bytes('openaq', response)
+    log.debug("OpenAQ locations response", extra={'status': response.status_code})
+
+    response.raise_for_status()
+    locations_data = response.json()
+
+    if not locations_data or 'results' not in locations_data:
+        log.warning("No results in OpenAQ response")
+        return []
+
+    log.debug("Found OpenAQ locations", extra={'locations': len(locations_data['results'])})
+
+    all_locations = []
+    for location in locations_data['results'][:5]:  # Limit to 5 stations
+        location_id = location['id']
+
+        # Each station is one more request against the shared budget;
+        # when it runs out, serve the stations fetched so far
+        try:
+            quota.acquire('openaq')
+        except RateLimitExceeded:
+            log.warning("OpenAQ budget exhausted after %d stations", len(all_locations))
+            break
+
+        # Fetch latest measurements
+        measurements_url = f"{BASE_URL}/locations/{location_id}/latest"
+        meas_response = requests.get(measurements_url, headers=headers, timeout=10)
+        count_upstream_bytes('openaq', meas_response)
+
+        if meas_response.status_code == 200:
+            latest_data = meas_response.json()
+            processed = process_location_with_measurements(location, latest_data)
+            if processed:
+                all_locations.append(processed)
+                log.debug("Processed station %s (AQI %s)", processed['name'], processed['aqi'])
+        elif meas_response.status_code == 429 or meas_response.status_code >= 500:
+            meas_response.raise_for_status()
+
+    log.info("Fetched OpenAQ measurements", extra={'locations': len(all_locations)})
+    return all_locations
+
+# OpenAQ v3 parameter id for PM2.5
+PM25_PARAMETER_ID = 2
+
+
+def get_stations_in_bbox(bbox):
+    """All OpenAQ stations in bbox (min_lon, min_lat, max_lon, max_lat)"""
     try:
-        response = requests.get(locations_url, params=params, headers=headers, timeout=10)
-        print(f"📡 OpenAQ API response status: {response.status_code}")
-        
-        response.raise_for_status()
-        locations_data = response.json()
-        
-        if not locations_data or 'results' not in locations_data:
-            print("⚠️ No results in OpenAQ response, using sample data")
-            return generate_sample_data(lat, lon)
-        
-        print(f"✅ Found {len(locations_data['results'])} locations from OpenAQ")
-        
-        all_locations = []
-        for location in locations_data['results'][:5]:  # Limit to 5 stations
-            location_id = location['id']
-            
-            # Fetch latest measurements
-            measurements_url = f"{BASE_URL}/locations/{location_id}/latest"
-            meas_response = requests.get(measurements_url, headers=headers, timeout=10)
-            
-            if meas_response.status_code == 200:
-                latest_data = meas_response.json()
-                processed = process_location_with_measurements(location, latest_data)
-                if processed:
-                    all_locations.append(processed)
-                    print(f"  ✓ Processed: {processed['name']} (AQI: {processed['aqi']})")
-        
-        if all_locations:
-            print(f"✅ Successfully processed {len(all_locations)} locations")
-            return all_locations
-        else:
-            print("⚠️ No locations could be processed, using sample data")
-            return generate_sample_data(lat, lon)
-            
-    except requests.Timeout:
-        print(f"⏱️ OpenAQ API timeout, using sample data")
-        return generate_sample_data(lat, lon)
-    except requests.RequestException as e:
-        print(f"🌐 OpenAQ API request error: {e}, using sample data")
-        return generate_sample_data(lat, lon)
+        stations, _ = call_upstream(
+            'openaq', ('bbox',) + tuple(bbox), fetch_stations_in_bbox, bbox)
+        return stations
     except Exception as e:
-        print(f"❌ OpenAQ Error: {e}, using sample data")
-        return generate_sample_data(lat, lon)
+        log.error("OpenAQ bbox error: %s", e)
+        return []
+
+
+def fetch_stations_in_bbox(bbox):
+    """
+    Fetch station locations in a bounding box plus their latest PM2.5
+
+    Two requests per box regardless of how many stations it holds,
+    instead of one /latest call per station. Raises on upstream failure.
+    """
+    bbox_param = ','.join(str(v) for v in bbox)
+    headers = {'X-API-Key': OPENAQ_API_KEY} if OPENAQ_API_KEY else {}
+
+    response = requests.get(f"{BASE_URL}/locations", params={
+        'bbox': bbox_param,
+        'limit': 1000
+    }, headers=headers, timeout=10)
+    count_upstream_bytes('openaq', response)
+    response.raise_for_status()
+    locations = response.json().get('results', [])
+
+    quota.acquire('openaq')
+    response = requests.get(f"{BASE_URL}/parameters/{PM25_PARAMETER_ID}/latest", params={
+        'bbox': bbox_param,
+        'limit': 1000
+    }, headers=headers, timeout=10)
+    count_upstream_bytes('openaq', response)
+    response.raise_for_status()
+    pm25_by_location = {
+        result.get('locationsId'): result.get('value')
+        for result in response.json().get('results', [])
+    }
+
+    stations = []
+    for location in locations:
+        coords = location.get('coordinates') or {}
+        if coords.get('latitude') is None or coords.get('longitude') is None:
+            continue
+
+        pm25 = pm25_by_location.get(location.get('id'))
+        aqi = pm25_to_aqi(pm25) if pm25 is not None and pm25 >= 0 else None
+        stations.append({
+            'id': location.get('id'),
+            'name': location.get('name', 'Unknown Station'),
+            'lat': coords['latitude'],
+            'lng': coords['longitude'],
+            'aqi': aqi,
+            'level': get_aqi_level(aqi) if aqi is not None else None,
+            'timestamp': (location.get('datetimeLast') or {}).get('utc'),
+            'measurements': {'pm25': pm25} if aqi is not None else {},
+            'source': 'OpenAQ'
+        })
+
+    log.info("Loaded OpenAQ stations", extra={'stations': len(stations), 'bbox': bbox_param})
+    return stations
+
 
 def process_location_with_measurements(location, latest_data):
     """Process a location with its measurements"""
     try:
         coords = location.get('coordinates', {})
         if not coords:
-            print(f"  ⚠️ No coordinates for location: {location.get('name', 'Unknown')}")
+            log.debug("No coordinates for location %s", location.get('name', 'Unknown'))
             return None
         
         measurements = {}
@@ -103,6 +213,7 @@ def process_location_with_measurements(location, latest_data):
             aqi_value = 65
         
         return {
+            'id': location.get('id'),
             'name': location.get('name', 'Unknown Station'),
             'lat': coords.get('latitude'),
             'lng': coords.get('longitude'),
@@ -113,7 +224,7 @@ def process_location_with_measurements(location, latest_data):
             'source': 'OpenAQ'
         }
     except Exception as e:
-        print(f"  ❌ Error processing location: {e}")
+        log.warning("Error processing location: %s", e)
         return None
 
 def pm25_to_aqi(pm25):
@@ -153,7 +264,7 @@ def get_aqi_level(aqi):
 
 def generate_sample_data(lat, lon):
     """Fallback sample data for testing"""
-    print("📋 Generating sample data...")
+    log.debug("Generating sample data")
     return [
         {
             'name': 'Philadelphia North Station',
@@ -0,0 +1,82 @@
+import os
+from datetime import datetime, timezone
+
+from api.openaq import get_aqi_level, pm25_to_aqi
+from utils.env import load_env
+from utils.log import get_logger
+from utils.metrics import count_upstream_bytes
+
+load_env()
+
+log = get_logger('purpleair')
+
+PURPLEAIR_API_KEY = os.getenv('PURPLEAIR_API_KEY')
+BASE_URL = os.getenv('PURPLEAIR_BASE_URL', "https://api.purpleair.com/v1")
+
+FIELDS = ('name', 'latitude', 'longitude', 'pm2.5_cf_1', 'humidity', 'last_seen')
+
+# Sensors not heard from for longer than this are left out (seconds)
+MAX_SENSOR_AGE = 3600
+
+
+def correct_pm25(pm25_cf1, humidity):
+    """
+    US EPA correction of a PurpleAir PM2.5 (CF=1) reading for humidity;
+    the raw sensors read high, so uncorrected values overstate the AQI
+    """
+    if humidity is None:
+        return pm25_cf1
+    return max(0.0, 0.524 * pm25_cf1 - 0.0862 * humidity + 5.75)
+
+
+async def fetch_purpleair_stations(client, bbox):
+    """
+    Outdoor PurpleAir sensors in bbox (min_lon, min_lat, max_lon, max_lat)
+    as station dicts; raises on upstream failure
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    params = {
+        'fields': ','.join(FIELDS),
+        'location_type': 0,
+        'max_age': MAX_SENSOR_AGE,
+        'nwlng': min_lon,
+        'nwlat': max_lat,
+        'selng': max_lon,
+        'selat': min_lat,
+    }
+    response = await client.get(f"{BASE_URL}/sensors", params=params,
+                                headers={'X-API-Key': PURPLEAIR_API_KEY})
+    count_upstream_bytes('purpleair', response)
+    response.raise_for_status()
+
+    stations = process_purpleair_sensors(response.json())
+    log.debug("Loaded PurpleAir sensors", extra={'stations': len(stations)})
+    return stations
+
+
+def process_purpleair_sensors(payload):
+    """Station dicts from a /sensors response (field names plus row arrays)"""
+    fields = payload.get('fields') or []
+    stations = []
+    for values in payload.get('data') or []:
+        sensor = dict(zip(fields, values))
+        pm25 = sensor.get('pm2.5_cf_1')
+        if sensor.get('latitude') is None or sensor.get('longitude') is None or pm25 is None:
+            continue
+
+        pm25 = round(correct_pm25(pm25, sensor.get('humidity')), 1)
+        aqi = pm25_to_aqi(pm25)
+        last_seen = sensor.get('last_seen')
+        stations.append({
+            'id': f"purpleair:{sensor.get('sensor_index')}",
+            'name': sensor.get('name') or 'PurpleAir Sensor',
+            'lat': sensor['latitude'],
+            'lng': sensor['longitude'],
+            'aqi': aqi,
+            'level': get_aqi_level(aqi),
+            'timestamp': datetime.fromtimestamp(last_seen, timezone.utc).isoformat().replace('+00:00', 'Z')
+            if last_seen else None,
+            'measurements': {'pm25': pm25},
+            'source': 'PurpleAir'
+        })
+    return stations
@@ -0,0 +1,127 @@
+import csv
+import json
+import math
+import os
+import threading
+
+from api.openaq import get_aqi_level, pm25_to_aqi
+from utils.env import load_env
+from utils.log import get_logger
+
+load_env()
+
+log = get_logger('station_drops')
+
+# ========================================
+# Local station drops
+# ========================================
+# CSV or JSON files of station readings dropped into one directory (a
+# partner's export, a field campaign, a test fixture). A file is parsed
+# again only when its modification time changes.
+#
+# CSV: a header row with lat, lng (or lon) and aqi and/or pm25; id, name,
+# timestamp, no2, o3 and pm10 are optional. JSON: a list of objects with
+# the same keys, or {"stations": [...]}.
+
+STATION_DROP_DIR = os.getenv('AIRCAST_STATION_DROP_DIR')
+
+DROP_EXTENSIONS = ('.csv', '.json')
+MEASUREMENT_KEYS = ('pm25', 'pm10', 'no2', 'o3')
+
+_parsed = {}
+_parsed_lock = threading.Lock()
+
+
+def _number(value):
+    if value is None or value == '':
+        return None
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"non-finite number: {value!r}")
+    return number
+
+
+def drop_station(row, file_id, index):
+    """Station dict for one CSV row or JSON object; None if it has no position or reading"""
+    lat = _number(row.get('lat', row.get('latitude')))
+    lng = _number(row.get('lng', row.get('lon', row.get('longitude'))))
+    measurements = {key: _number(row.get(key)) for key in MEASUREMENT_KEYS}
+    measurements = {key: value for key, value in measurements.items() if value is not None}
+    aqi = _number(row.get('aqi'))
+    if aqi is None and 'pm25' in measurements:
+        aqi = pm25_to_aqi(measurements['pm25'])
+    if lat is None or lng is None or aqi is None:
+        return None
+
+    aqi = int(aqi)
+    return {
+        'id': f"local:{file_id}:{row.get('id') or index}",
+        'name': row.get('name') or f"{file_id} #{index}",
+        'lat': lat,
+        'lng': lng,
+        'aqi': aqi,
+        'level': get_aqi_level(aqi),
+        'timestamp': row.get('timestamp') or None,
+        'measurements': measurements,
+        'source': 'Local'
+    }
+
+
+def parse_drop_file(path):
+    file_id = os.path.splitext(os.path.basename(path))[0]
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.endswith('.csv'):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = json.load(f)
+            if isinstance(rows, dict):
+                rows = rows.get('stations', [])
+
+    stations = []
+    for index, row in enumerate(rows):
+        try:
+            station = drop_station(row, file_id, index)
+        except (TypeError, ValueError, AttributeError):
+            station = None
+        if station is not None:
+            stations.append(station)
+    if len(stations) < len(rows):
+        log.warning("Skipped unreadable rows", extra={'file': path, 'skipped': len(rows) - len(stations)})
+    return stations
+
+
+def read_drop_stations(directory=STATION_DROP_DIR):
+    """Stations from every drop file, reusing files parsed since their last change"""
+    if not directory or not os.path.isdir(directory):
+        return []
+
+    stations = []
+    seen = set()
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+        if not entry.is_file() or not entry.name.endswith(DROP_EXTENSIONS):
+            continue
+        seen.add(entry.path)
+        mtime = entry.stat().st_mtime_ns
+        with _parsed_lock:
+            cached = _parsed.get(entry.path)
+        if cached is None or cached[0] != mtime:
+            try:
+                cached = (mtime, parse_drop_file(entry.path))
+            except (OSError, ValueError) as e:
+                log.warning("Could not read station drop %s: %s", entry.name, e)
+                continue
+            with _parsed_lock:
+                _parsed[entry.path] = cached
+            log.info("Loaded station drop", extra={'file': entry.name, 'stations': len(cached[1])})
+        stations.extend(cached[1])
+
+    with _parsed_lock:
+        for path in [p for p in _parsed if p not in seen]:
+            del _parsed[path]
+    return stations
+
+
+def drop_stations_in_bbox(bbox, directory=STATION_DROP_DIR):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return [s for s in read_drop_stations(directory)
+            if min_lat <= s['lat'] <= max_lat and min_lon <= s['lng'] <= max_lon]
@@ -1,22 +1,48 @@
 # backend/api/tempo.py
 
+import importlib.util
 import os
+import threading
+import time
+import numpy as np
 import requests
 from io import BytesIO
 from datetime import datetime
+from utils.circuit_breaker import call_upstream
+from utils.log import get_logger
+from utils.metrics import count_upstream_bytes
+from utils.raster import PixelLocator, SummedAreaGrid
 
-try:
-    import netCDF4 as nc
-    import numpy as np
-    TEMPO_AVAILABLE = True
-except ImportError:
-    TEMPO_AVAILABLE = False
-    print("⚠️ netCDF4 not installed - TEMPO satellite data disabled")
+log = get_logger('tempo')
+
+# netCDF4 is only imported when a granule is decoded; checking for it
+# here keeps it off the startup path
+TEMPO_AVAILABLE = importlib.util.find_spec('netCDF4') is not None
+if not TEMPO_AVAILABLE:
+    log.warning("netCDF4 not installed - TEMPO satellite data disabled")
 
 # Azure Blob Storage URL
 TEMPO_BLOB_URL = os.getenv('TEMPO_BLOB_URL',
                            'https://aircasttempo.blob.core.windows.net/tempo-data/TEMPO_NO2_L2_V04_20251004T164423Z_S007G03.nc')
 
+# Decoded granules are reused for this long (TEMPO is hourly)
+TEMPO_CACHE_SECONDS = 3600
+
+# Area averages are taken on a regular grid of this many degrees
+# (~2 km, TEMPO's native pixel size), keeping pixels whose
+# main_data_quality_flag is at most MAX_QUALITY_FLAG (0 = normal)
+TEMPO_GRID_RESOLUTION = 0.02
+MAX_QUALITY_FLAG = 0
+
+# Bucket size for nearest-pixel lookups; a few pixels per bucket
+TEMPO_LOCATOR_RESOLUTION = 0.05
+
+DEFAULT_AREA_RADIUS_KM = 5.0
+MAX_AREA_RADIUS_KM = 100.0
+
+_granule_cache = {'data': None, 'loaded_at': 0.0}
+_granule_lock = threading.Lock()
+
 # ========================================
 # NEW: Observation timestamp from filename
 # ========================================
@@ -94,76 +120,129 @@ def get_tempo_metadata():
 def explore_tempo_structure():
     """Explore TEMPO file structure from Azure Blob Storage"""
     if not TEMPO_AVAILABLE:
-        print("TEMPO unavailable - netCDF4 not installed")
+        log.warning("TEMPO unavailable - netCDF4 not installed")
         return
 
     try:
-        print(f"Downloading TEMPO file from Azure...")
+        log.info("Downloading TEMPO file from Azure")
         response = requests.get(TEMPO_BLOB_URL, timeout=30)
         response.raise_for_status()
 
+        import netCDF4 as nc
         file_data = BytesIO(response.content)
         dataset = nc.Dataset('tempo-memory', mode='r', memory=file_data.read())
 
-        print("=== ROOT VARIABLES ===")
-        print(list(dataset.variables.keys()))
-
-        print("\n=== GROUPS ===")
-        print(list(dataset.groups.keys()))
-
-        if 'geolocation' in dataset.groups:
-            print("\n=== GEOLOCATION GROUP ===")
-            print(list(dataset.groups['geolocation'].variables.keys()))
-
-        if 'product' in dataset.groups:
-            print("\n=== PRODUCT GROUP ===")
-            print(list(dataset.groups['product'].variables.keys()))
+        log.info("TEMPO structure", extra={
+            'root_variables': list(dataset.variables.keys()),
+            'groups': {name: list(group.variables.keys()) for name, group in dataset.groups.items()}
+        })
 
         dataset.close()
     except Exception as e:
-        print(f"⚠️ Error exploring TEMPO structure: {e}")
+        log.warning("Error exploring TEMPO structure: %s", e)
 
 
 def read_tempo_netcdf():
-    """Read and process TEMPO NetCDF file from Azure Blob Storage"""
+    """
+    Read and process TEMPO NetCDF file from Azure Blob Storage
+
+    One download per granule period instead of one per request. Once a
+    granule has expired, one caller refreshes it while everyone else
+    keeps getting the previous granule until the new one is swapped in;
+    only the very first load is waited for.
+    """
     if not TEMPO_AVAILABLE:
-        print("⚠️ netCDF4 not available")
+        log.debug("netCDF4 not available")
         return None
 
+    cached = _granule_cache['data']
+    if cached is not None and time.monotonic() - _granule_cache['loaded_at'] < TEMPO_CACHE_SECONDS:
+        return cached
+    if not _granule_lock.acquire(blocking=cached is None):
+        return cached
+
     try:
-        print(f"📡 Downloading TEMPO file from Azure Blob Storage...")
+        cached = _granule_cache['data']
+        if cached is not None and time.monotonic() - _granule_cache['loaded_at'] < TEMPO_CACHE_SECONDS:
+            return cached
+
+        try:
+            tempo_data, stale = call_upstream(
+                'tempo', TEMPO_BLOB_URL, fetch_tempo_netcdf)
+        except Exception as e:
+            log.error("Error reading TEMPO file from Azure: %s", e)
+            return cached
+
+        if stale:
+            log.info("Serving cached TEMPO granule (stale)")
+        else:
+            _granule_cache['data'] = tempo_data
+            _granule_cache['loaded_at'] = time.monotonic()
+
+        return tempo_data
+    finally:
+        _granule_lock.release()
+
+
+def fetch_tempo_netcdf():
+    """Download and decode the TEMPO granule; raises on failure"""
+    import netCDF4 as nc
 
-        # Download file from Azure Blob
-        response = requests.get(TEMPO_BLOB_URL, timeout=30)
-        response.raise_for_status()
+    log.info("Downloading TEMPO granule", extra={'url': TEMPO_BLOB_URL})
 
-        # Load into memory
-        file_data = BytesIO(response.content)
+    # Download file from Azure Blob
+    response = requests.get(TEMPO_BLOB_URL, timeout=30)
+    count_upstream_bytes('tempo', response)
+    response.raise_for_status()
 
-        print(f"📡 Opening TEMPO dataset...")
-        dataset = nc.Dataset('tempo-memory', mode='r', memory=file_data.read())
+    # Load into memory
+    file_data = BytesIO(response.content)
 
-        # TEMPO uses groups - geolocation is in a separate group
-        geoloc = dataset.groups['geolocation']
-        product = dataset.groups['product']
+    dataset = nc.Dataset('tempo-memory', mode='r', memory=file_data.read())
 
-        lat = geoloc.variables['latitude'][:]
-        lon = geoloc.variables['longitude'][:]
-        no2_column = product.variables['vertical_column_troposphere'][:]
+    # TEMPO uses groups - geolocation is in a separate group
+    geoloc = dataset.groups['geolocation']
+    product = dataset.groups['product']
 
-        dataset.close()
+    lat = geoloc.variables['latitude'][:]
+    lon = geoloc.variables['longitude'][:]
+    no2_column = product.variables['vertical_column_troposphere'][:]
+    quality = product.variables['main_data_quality_flag'][:] \
+        if 'main_data_quality_flag' in product.variables else None
 
-        print(f"✅ TEMPO data loaded successfully from Azure!")
+    dataset.close()
 
-        return {
-            'latitude': lat,
-            'longitude': lon,
-            'no2_column': no2_column,
-            'units': 'molecules/cm²'
-        }
-    except Exception as e:
-        print(f"❌ Error reading TEMPO file from Azure: {e}")
-        return None
+    # Built once per granule so area queries never touch the swath
+    valid = np.ones(no2_column.shape, dtype=bool) if quality is None else \
+        np.ma.filled(np.ma.asarray(quality), MAX_QUALITY_FLAG + 1) <= MAX_QUALITY_FLAG
+    area_grid = SummedAreaGrid(lat, lon, no2_column, valid,
+                               resolution=TEMPO_GRID_RESOLUTION, scale=1e15)
+    pixel_locator = PixelLocator(lat, lon, resolution=TEMPO_LOCATOR_RESOLUTION)
+
+    log.info("TEMPO granule loaded", extra={
+        'pixels': int(no2_column.size), 'grid': [area_grid.rows, area_grid.cols],
+        'index_mb': round((area_grid.nbytes + pixel_locator.nbytes) / 1e6, 1)})
+
+    return {
+        'latitude': lat,
+        'longitude': lon,
+        'no2_column': no2_column,
+        'quality_valid': valid,
+        'area_grid': area_grid,
+        'pixel_locator': pixel_locator,
+        'units': 'molecules/cm²',
+        'granule_id': TEMPO_BLOB_URL,
+        'loaded_at': time.time()
+    }
+
+
+def granule_key(tempo_data):
+    """
+    Identity of a decoded granule that survives stale copies (the
+    fallback path hands out a new dict per call): where it came from
+    and when it was decoded
+    """
+    return tempo_data.get('granule_id'), tempo_data.get('loaded_at')
 
 
 def get_tempo_value_at_location(lat, lon):
@@ -173,7 +252,7 @@ def get_tempo_value_at_location(lat, lon):
     NOW INCLUDES: Freshness metadata and data provenance information
     """
     if not TEMPO_AVAILABLE:
-        print("⚠️ TEMPO unavailable - netCDF4 not installed")
+        log.debug("TEMPO unavailable - netCDF4 not installed")
         return {
             'no2_column': None,
             'aqi': None,
@@ -199,20 +278,24 @@ def get_tempo_value_at_location(lat, lon):
             'metadata': None
         }
 
-    lats = tempo_data['latitude']
-    lons = tempo_data['longitude']
-    no2 = tempo_data['no2_column']
-
-    # Find nearest grid point
-    lat_diff = np.abs(lats - lat)
-    lon_diff = np.abs(lons - lon)
-    distance = lat_diff + lon_diff
-    idx = np.unravel_index(np.argmin(distance), distance.shape)
-
-    no2_value = float(no2[idx])
+    (idx,), (lat_found,), (lon_found,), (no2_value,) = _nearest_pixels(tempo_data, [lat], [lon])
+    if idx < 0 or not np.isfinite(no2_value):
+        # Outside the swath, or a fill value (cloud / no retrieval) at the nearest pixel
+        return {
+            'no2_column': None,
+            'aqi': None,
+            'latitude': float(lat_found) if idx >= 0 else lat,
+            'longitude': float(lon_found) if idx >= 0 else lon,
+            'source': 'NASA TEMPO',
+            'available': False,
+            'stale': tempo_data.get('stale', False),
+            'freshness': get_data_freshness(),
+            'metadata': get_tempo_metadata()
+        }
+    no2_value = float(no2_value)
     aqi = convert_no2_to_aqi(no2_value)
 
-    print(f"✅ TEMPO value at ({lat}, {lon}): NO2={no2_value:.2e}, AQI={aqi}")
+    log.debug("TEMPO value at (%s, %s): NO2=%.2e, AQI=%s", lat, lon, no2_value, aqi)
 
     # ========================================
     # NEW: Return enhanced data with metadata
@@ -220,15 +303,158 @@ def get_tempo_value_at_location(lat, lon):
     return {
         'no2_column': no2_value,
         'aqi': aqi,
-        'latitude': float(lats[idx]),
-        'longitude': float(lons[idx]),
+        'latitude': float(lat_found),
+        'longitude': float(lon_found),
         'source': 'NASA TEMPO',
         'available': True,
+        'stale': tempo_data.get('stale', False),
         'freshness': get_data_freshness(),      # ← NEW: Freshness info
         'metadata': get_tempo_metadata()        # ← NEW: Product metadata
     }
 
 
+def _nearest_pixels(tempo_data, lats, lons):
+    """
+    (pixel index or -1, pixel lat, pixel lon, NO2) arrays for each point,
+    from the granule's PixelLocator; lat/lon/NO2 are NaN where there is
+    no pixel near the point
+    """
+    idx, _ = tempo_data['pixel_locator'].nearest(lats, lons)
+    found = idx >= 0
+    safe = np.where(found, idx, 0)
+
+    def at_pixels(values):
+        # Gather first so only the picked pixels are copied, not the swath
+        picked = np.ma.filled(np.ma.asarray(values).ravel()[safe].astype(float), np.nan)
+        return np.where(found, picked, np.nan)
+
+    return (idx, at_pixels(tempo_data['latitude']), at_pixels(tempo_data['longitude']),
+            at_pixels(tempo_data['no2_column']))
+
+
+def get_tempo_values_at_locations(points):
+    """
+    Extract TEMPO NO2 values for many (lat, lon) points at once
+
+    Reads the granule once and finds every point's nearest pixel through
+    its PixelLocator in one vectorized call. Returns (results, meta)
+    where meta holds the freshness/metadata shared by all points.
+    """
+    if not TEMPO_AVAILABLE:
+        return [_unavailable_point(lat, lon, 'NASA TEMPO (Unavailable - netCDF4 not installed)')
+                for lat, lon in points], {'available': False}
+
+    tempo_data = read_tempo_netcdf()
+    if not tempo_data:
+        return [_unavailable_point(lat, lon, 'NASA TEMPO (Data Error)')
+                for lat, lon in points], {'available': False}
+
+    query = np.asarray(points, dtype=float).reshape(-1, 2)
+    nearest, pixel_lat, pixel_lon, no2 = _nearest_pixels(tempo_data, query[:, 0], query[:, 1])
+
+    results = []
+    for i, idx in enumerate(nearest):
+        if idx < 0:
+            results.append(_unavailable_point(float(query[i, 0]), float(query[i, 1]), 'NASA TEMPO'))
+            continue
+        no2_value = no2[i]
+        valid = bool(np.isfinite(no2_value))
+        results.append({
+            'no2_column': float(no2_value) if valid else None,
+            'aqi': convert_no2_to_aqi(no2_value) if valid else None,
+            'latitude': float(pixel_lat[i]),
+            'longitude': float(pixel_lon[i]),
+            'available': valid
+        })
+
+    meta = {
+        'available': True,
+        'source': 'NASA TEMPO',
+        'stale': tempo_data.get('stale', False),
+        'freshness': get_data_freshness(),
+        'metadata': get_tempo_metadata()
+    }
+    return results, meta
+
+
+def get_tempo_area_average(lat, lon, radius_km=DEFAULT_AREA_RADIUS_KM, bbox=None):
+    """
+    Mean, spread and count of quality-filtered TEMPO NO2 over an area
+
+    The area is bbox (min_lon, min_lat, max_lon, max_lat) if given, else
+    the square with the same area as the radius_km circle around the
+    point. Flagged and fill pixels are left out; `coverage` is the
+    fraction of pixels in the area that passed.
+    """
+    area = {'bbox': list(bbox)} if bbox is not None else {
+        'latitude': lat, 'longitude': lon, 'radius_km': radius_km}
+
+    if not TEMPO_AVAILABLE:
+        return _unavailable_area(area, 'NASA TEMPO (Unavailable - netCDF4 not installed)')
+
+    tempo_data = read_tempo_netcdf()
+    if not tempo_data or tempo_data.get('area_grid') is None:
+        return _unavailable_area(area, 'NASA TEMPO (Data Error)')
+
+    grid = tempo_data['area_grid']
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        stats = grid.box_stats(min_lat, min_lon, max_lat, max_lon)
+    else:
+        stats = grid.radius_stats(lat, lon, radius_km)
+
+    available = stats['count'] > 0
+    return {
+        'no2_mean': stats['mean'],
+        'no2_std': stats['std'],
+        'count': stats['count'],
+        'coverage': round(stats['count'] / stats['pixels'], 3) if stats['pixels'] else 0.0,
+        'aqi': convert_no2_to_aqi(stats['mean']) if available else None,
+        'area': area,
+        'source': 'NASA TEMPO',
+        'available': available,
+        'stale': tempo_data.get('stale', False),
+        'freshness': get_data_freshness(),
+        'metadata': dict(get_tempo_metadata(), max_quality_flag=MAX_QUALITY_FLAG,
+                         grid_resolution_deg=TEMPO_GRID_RESOLUTION)
+    }
+
+
+def _unavailable_area(area, source):
+    return {
+        'no2_mean': None,
+        'no2_std': None,
+        'count': 0,
+        'coverage': 0.0,
+        'aqi': None,
+        'area': area,
+        'source': source,
+        'available': False,
+        'freshness': None,
+        'metadata': None
+    }
+
+
+def _unavailable_point(lat, lon, source):
+    return {
+        'no2_column': None,
+        'aqi': None,
+        'latitude': lat,
+        'longitude': lon,
+        'source': source,
+        'available': False
+    }
+
+
+def convert_no2_to_aqi_array(no2_column):
+    """Vectorized convert_no2_to_aqi; NaN in gives NaN out"""
+    ppb = np.asarray(no2_column, dtype=float) / 1e15 * 50
+    aqi = np.where(ppb <= 53, ppb * (50/53),
+                   np.where(ppb <= 100, 50 + (ppb - 53) * 50/(100-53),
+                            100 + np.minimum((ppb - 100) * 50/260, 150)))
+    return np.trunc(aqi)
+
+
 def convert_no2_to_aqi(no2_column):
     """Convert TEMPO NO2 to AQI estimate"""
     surface_no2_ppb = no2_column / 1e15 * 50
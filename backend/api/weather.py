@@ -1,32 +1,41 @@
 import requests
 import os
-from dotenv import load_dotenv
+from utils.circuit_breaker import call_upstream
+from utils.geo import snap_to_cell
+from utils.env import load_env
+from utils.log import get_logger
+from utils.metrics import count_upstream_bytes
 
-load_dotenv()
+load_env()
+
+log = get_logger('weather')
 
 WEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY')
-BASE_URL = "https://api.openweathermap.org/data/2.5"
+BASE_URL = os.getenv('OPENWEATHER_BASE_URL', "https://api.openweathermap.org/data/2.5")
 
-# Debug: Print API key status
-if WEATHER_API_KEY:
-    print(f"Weather API Key loaded: {WEATHER_API_KEY[:10]}...")
-else:
-    print("WARNING: No OpenWeather API Key found!")
+if not WEATHER_API_KEY:
+    log.warning("No OpenWeather API key found, using fallback weather")
 
 
 def get_current_weather(lat, lon):
     """Get current weather conditions"""
     if not WEATHER_API_KEY:
-        print("No API key - returning fallback weather data")
-        return {
-            'temperature': 72,
-            'humidity': 65,
-            'wind_speed': 8,
-            'wind_direction': 180,
-            'pressure': 1013,
-            'description': 'partly cloudy'
-        }
+        log.debug("No API key - returning fallback weather data")
+        return generate_fallback_weather()
+
+    cache_key = ('current',) + snap_to_cell(lat, lon)
 
+    try:
+        current, _ = call_upstream(
+            'openweather', cache_key, fetch_current_weather, lat, lon)
+        return current
+    except Exception as e:
+        log.error("Error fetching weather: %s", e)
+        return generate_fallback_weather()
+
+
+def fetch_current_weather(lat, lon):
+    """Fetch current weather from OpenWeather; raises on upstream failure"""
     url = f"{BASE_URL}/weather"
     params = {
         'lat': lat,
@@ -35,37 +44,42 @@ def get_current_weather(lat, lon):
         'units': 'imperial'
     }
 
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-
-        return {
-            'temperature': data['main']['temp'],
-            'humidity': data['main']['humidity'],
-            'wind_speed': data['wind']['speed'],
-            'wind_direction': data['wind'].get('deg', 0),
-            'pressure': data['main']['pressure'],
-            'description': data['weather'][0]['description']
-        }
-    except Exception as e:
-        print(f"Error fetching weather: {e}")
-        return {
-            'temperature': 72,
-            'humidity': 65,
-            'wind_speed': 8,
-            'wind_direction': 180,
-            'pressure': 1013,
-            'description': 'partly cloudy'
-        }
+    response = requests.get(url, params=params, timeout=10)
+    count_upstream_bytes('openweather', response)
+    response.raise_for_status()
+    data = response.json()
+
+    return {
+        'temperature': data['main']['temp'],
+        'humidity': data['main']['humidity'],
+        'wind_speed': data['wind']['speed'],
+        'wind_direction': data['wind'].get('deg', 0),
+        'pressure': data['main']['pressure'],
+        'precipitation': data.get('rain', {}).get('1h', 0),
+        'description': data['weather'][0]['description'],
+        'observed_at': data.get('dt')
+    }
 
 
 def get_weather_forecast(lat, lon):
     """Get 24-hour weather forecast"""
     if not WEATHER_API_KEY:
-        print("No API key - returning fallback forecast data")
+        log.debug("No API key - returning fallback forecast data")
+        return generate_fallback_forecast()
+
+    cache_key = ('forecast',) + snap_to_cell(lat, lon)
+
+    try:
+        forecast, _ = call_upstream(
+            'openweather', cache_key, fetch_weather_forecast, lat, lon)
+        return forecast
+    except Exception as e:
+        log.error("Error fetching forecast: %s", e)
         return generate_fallback_forecast()
 
+
+def fetch_weather_forecast(lat, lon):
+    """Fetch the forecast from OpenWeather; raises on upstream failure"""
     url = f"{BASE_URL}/forecast"
     params = {
         'lat': lat,
@@ -75,25 +89,35 @@ def get_weather_forecast(lat, lon):
         'cnt': 8
     }
 
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-
-        forecast = []
-        for item in data['list']:
-            forecast.append({
-                'time': item['dt_txt'],
-                'temperature': item['main']['temp'],
-                'wind_speed': item['wind']['speed'],
-                'humidity': item['main']['humidity'],
-                'precipitation': item.get('rain', {}).get('3h', 0)
-            })
+    response = requests.get(url, params=params, timeout=10)
+    count_upstream_bytes('openweather', response)
+    response.raise_for_status()
+    data = response.json()
 
-        return forecast
-    except Exception as e:
-        print(f"Error fetching forecast: {e}")
-        return generate_fallback_forecast()
+    forecast = []
+    for item in data['list']:
+        forecast.append({
+            'time': item['dt_txt'],
+            'temperature': item['main']['temp'],
+            'wind_speed': item['wind']['speed'],
+            'humidity': item['main']['humidity'],
+            'precipitation': item.get('rain', {}).get('3h', 0)
+        })
+
+    return forecast
+
+
+def generate_fallback_weather():
+    """Static current conditions used when the API is unavailable"""
+    return {
+        'temperature': 72,
+        'humidity': 65,
+        'wind_speed': 8,
+        'wind_direction': 180,
+        'pressure': 1013,
+        'description': 'partly cloudy',
+        'fallback': True
+    }
 
 
 def generate_fallback_forecast():
@@ -108,7 +132,8 @@ def generate_fallback_forecast():
             'temperature': 72 - (i * 2),
             'wind_speed': 8 + (i * 0.5),
             'humidity': 65 + (i * 2),
-            'precipitation': 0
+            'precipitation': 0,
+            'fallback': True
         })
 
     return forecast
@@ -1,45 +1,108 @@
-from api.tempo import get_tempo_value_at_location
-from api.weather import get_current_weather, get_weather_forecast
-from api.openaq import get_latest_measurements
-from flask import Flask, jsonify, request, send_from_directory
+from api.connectors import connector_hub
+from api.openaq import get_cached_measurements, generate_sample_data
+from api.tempo import (DEFAULT_AREA_RADIUS_KM, MAX_AREA_RADIUS_KM, get_tempo_area_average,
+                       get_tempo_values_at_locations)
+from flask import Flask, Response, jsonify, request, send_from_directory, stream_with_context
 from flask_cors import CORS
-from models.forecast import forecast_air_quality
-from openai import OpenAI
+from utils.admission import admission, admission_limited, current_tier, init_app as init_admission
+from utils.circuit_breaker import call_upstream, breaker_status, last_known_good
+from utils.data_context import get_request_context, shared_cache
+from utils.http_cache import http_cached, response_cache
+from utils.compression import compress_json_response, send_precompressed
+from utils.serialization import (NDJSON_MIMETYPE, RecordJSONProvider, format_ndjson, format_sse,
+                                 negotiate_format, render)
+from utils.pubsub import RESYNC, pubsub
+from utils.rate_limit import quota
+from utils.geo import cell_id, parse_cell_id, snap_to_cell
+from utils.log import get_logger, init_app as init_logging
+from utils.metrics import PROMETHEUS_CONTENT_TYPE, count_tokens, init_app as init_metrics, render_metrics
+from models.stations import load_stations, parse_bbox, snap_bbox, query_stations, station_index
+from models.heatmap import DEFAULT_RES, build_heatmap, clamp_res
+from models.live_updates import live_refresher
+from models.warmup import warmer
+from models.collocation import collocation
+from models.export import (EXPORT_DATASETS, EXPORT_FORMATS, MAX_EXPORT_RANGE, PARQUET_AVAILABLE,
+                           export_stream)
+from models.batch import MAX_BATCH_POINTS, forecast_batch, parse_points, safety_batch
+from models.user_groups import safety_reports
+from models.history import ROLLUP_TABLES, history_store, parse_time
+from models.geocoding import (
+    MAX_GEOCODE_RESULTS, REVERSE_PRECISION, autocomplete, geocode, geocode_cache, normalize_query,
+    reverse_geocode
+)
 from datetime import datetime
 import sys
 import os
-import traceback
+import math
+import threading
 
 # Add api folder to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'api'))
 
 
+log = get_logger('app')
+
 app = Flask(__name__)
+app.json = RecordJSONProvider(app)
 CORS(app)
+init_logging(app)
+init_metrics(app)
+init_admission(app)
+
+# OpenAI client, built on first use: importing openai is the slowest part
+# of startup, and its connection pool must not be shared across forked
+# workers (so it is dropped in every child)
+_openai_client = None
+_openai_lock = threading.Lock()
+
+
+def get_openai_client():
+    global _openai_client
+    with _openai_lock:
+        if _openai_client is None:
+            from openai import OpenAI
+            _openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+            log.info("OpenAI client initialized")
+        return _openai_client
+
+
+def _drop_openai_client():
+    global _openai_client, _openai_lock
+    _openai_client = None
+    _openai_lock = threading.Lock()
+
 
-# Initialize OpenAI client
-try:
-    openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-    print("✅ OpenAI client initialized successfully")
-except Exception as e:
-    print(f"⚠️ OpenAI client failed to initialize: {e}")
-    openai_client = None
+os.register_at_fork(after_in_child=_drop_openai_client)
 
 # Get absolute path to frontend folder
 FRONTEND_DIR = os.path.join(os.path.dirname(
     os.path.dirname(os.path.abspath(__file__))), 'frontend')
 
 
+# Content-hashed, precompressed assets written by build_assets.py
+DIST_DIR = os.path.join(FRONTEND_DIR, 'dist')
+
+
+@app.after_request
+def compress_response(response):
+    return compress_json_response(response)
+
+
 @app.route('/')
 def home():
+    if os.path.isfile(os.path.join(DIST_DIR, 'index.html')):
+        return send_precompressed(DIST_DIR, 'index.html')
     return send_from_directory(FRONTEND_DIR, 'index.html')
 
 
 @app.route('/<path:path>')
 def serve_static(path):
     if path and '.' in path:
+        if os.path.isfile(os.path.join(DIST_DIR, path)):
+            # Hashed filenames never change content, so cache forever
+            return send_precompressed(DIST_DIR, path, immutable=True)
         return send_from_directory(FRONTEND_DIR, path)
-    return send_from_directory(FRONTEND_DIR, 'index.html')
+    return home()
 
 
 @app.route('/api/')
@@ -50,64 +113,87 @@ def api_home():
         "endpoints": [
             "/api/air-quality?lat=39.95&lon=-75.16",
             "/api/weather?lat=39.95&lon=-75.16",
-            "/api/tempo?lat=39.95&lon=-75.16"
+            "/api/tempo?lat=39.95&lon=-75.16",
+            "/api/tempo/area?lat=39.95&lon=-75.16&radius_km=5"
         ]
     })
 
 
+@app.route('/api/upstreams')
+def get_upstreams():
+    """Circuit breaker state for each upstream data source"""
+    return jsonify({
+        "status": "success",
+        "upstreams": breaker_status(),
+        "station_sources": connector_hub.status(),
+        "response_cache": response_cache.stats(),
+        "geocode_cache": geocode_cache.stats(),
+        "source_cache": shared_cache.stats(),
+        "quotas": quota.status(),
+        "admission": admission.status(),
+        "warmup": warmer.status()
+    })
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus scrape endpoint (per worker process)"""
+    quota.status()  # refresh the shared budget gauges
+    return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
 @app.route('/api/air-quality')
+@http_cached('air-quality')
 def get_air_quality():
+    lat, lon = 39.9526, -75.1652
     try:
         lat = float(request.args.get('lat', 39.9526))
         lon = float(request.args.get('lon', -75.1652))
 
-        print(f"✅ Received air quality request for: {lat}, {lon}")
+        log.info("Air quality request", extra={'lat': lat, 'lon': lon})
 
-        locations = get_latest_measurements(lat, lon, radius_km=25)
+        locations = get_request_context().stations(lat, lon)
 
-        print(f"📊 Retrieved {len(locations) if locations else 0} locations")
+        log.debug("Retrieved %d locations", len(locations) if locations else 0)
 
         if not locations or len(locations) == 0:
-            print("⚠️ No locations found, using sample data")
-            from openaq import generate_sample_data
+            log.warning("No locations found, using sample data")
             locations = generate_sample_data(lat, lon)
 
-        return jsonify({
+        # Bundle per-station forecasts so marker clicks need no refetch
+        if request.args.get('include_forecast') in ('1', 'true'):
+            locations = get_request_context().with_forecasts(locations)
+
+        return render({
             "status": "success",
-            "locations": locations
-        })
+            "locations": locations,
+            "stale": any(loc.get('stale', False) for loc in locations)
+        }, tables=('locations',))
 
     except Exception as e:
-        print(f"❌ ERROR in air quality endpoint: {str(e)}")
-        print(traceback.format_exc())
-
-        sample_locations = [{
-            'name': 'Philadelphia Center Station',
-            'lat': 39.9526,
-            'lng': -75.1652,
-            'aqi': 65,
-            'level': 'Moderate',
-            'timestamp': '2024-10-04T19:00:00Z',
-            'measurements': {'pm25': 12.5, 'no2': 35.0, 'o3': 45.0},
-            'source': 'Sample Data'
-        }]
+        log.exception("Air quality endpoint failed")
 
-        return jsonify({
+        locations = get_cached_measurements(lat, lon) or generate_sample_data(lat, lon)
+
+        return render({
             "status": "success",
-            "locations": sample_locations
-        })
+            "locations": locations,
+            "stale": True
+        }, tables=('locations',))
 
 
 @app.route('/api/weather')
+@http_cached('weather')
 def get_weather():
     try:
         lat = float(request.args.get('lat', 39.9526))
         lon = float(request.args.get('lon', -75.1652))
 
-        print(f"✅ Received weather request for: {lat}, {lon}")
+        log.info("Weather request", extra={'lat': lat, 'lon': lon})
 
-        current = get_current_weather(lat, lon)
-        forecast = get_weather_forecast(lat, lon)
+        ctx = get_request_context()
+        current = ctx.current_weather(lat, lon)
+        forecast = ctx.weather_forecast(lat, lon)
 
         return jsonify({
             "status": "success",
@@ -115,193 +201,563 @@ def get_weather():
             "forecast": forecast
         })
     except Exception as e:
-        print(f"❌ ERROR in weather endpoint: {str(e)}")
+        log.error("Weather endpoint failed: %s", e)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
 @app.route('/api/tempo')
+@http_cached('tempo')
+@admission_limited('standard')
 def get_tempo():
     try:
         lat = float(request.args.get('lat', 39.9526))
         lon = float(request.args.get('lon', -75.1652))
 
-        print(f"✅ Received TEMPO request for: {lat}, {lon}")
+        log.info("TEMPO request", extra={'lat': lat, 'lon': lon})
 
-        tempo_data = get_tempo_value_at_location(lat, lon)
+        tempo_data = get_request_context().tempo(lat, lon)
 
         return jsonify({
             "status": "success",
             "tempo": tempo_data
         })
     except Exception as e:
-        print(f"❌ ERROR in TEMPO endpoint: {str(e)}")
+        log.error("TEMPO endpoint failed: %s", e)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
-@app.route('/api/forecast')
-def get_forecast():
+@app.route('/api/tempo/area')
+@http_cached('tempo')
+@admission_limited('standard')
+def get_tempo_area():
+    """Area-averaged TEMPO NO2: ?lat&lon[&radius_km] or ?bbox=min_lon,min_lat,max_lon,max_lat"""
     try:
-        lat = float(request.args.get('lat', 39.9526))
-        lon = float(request.args.get('lon', -75.1652))
+        if 'bbox' in request.args:
+            lat = lon = radius_km = None
+            bbox = parse_bbox(request.args['bbox'])
+        else:
+            lat = float(request.args.get('lat', 39.9526))
+            lon = float(request.args.get('lon', -75.1652))
+            radius_km = float(request.args.get('radius_km', DEFAULT_AREA_RADIUS_KM))
+            bbox = None
+            if not 0 < radius_km <= MAX_AREA_RADIUS_KM:
+                return jsonify({
+                    "status": "error",
+                    "message": f"radius_km must be in (0, {MAX_AREA_RADIUS_KM:g}]"
+                }), 400
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Invalid area: {e}"}), 400
 
-        print(f"✅ Received forecast request for: {lat}, {lon}")
+    try:
+        log.info("TEMPO area request", extra={'lat': lat, 'lon': lon, 'radius_km': radius_km, 'bbox': bbox})
 
-        locations = get_latest_measurements(lat, lon, radius_km=25)
-        current_aqi = locations[0]['aqi'] if locations and len(
-            locations) > 0 else 65
+        return jsonify({
+            "status": "success",
+            "tempo": get_tempo_area_average(lat, lon, radius_km=radius_km, bbox=bbox)
+        })
+    except Exception as e:
+        log.error("TEMPO area endpoint failed: %s", e)
+        return jsonify({"status": "error", "message": str(e)}), 500
 
-        weather_data = get_weather_forecast(lat, lon)
-        limited_weather = weather_data[:6] if weather_data else []
-        forecast_result = forecast_air_quality(
-            current_aqi, limited_weather, hours_ahead=6)
 
-        if isinstance(forecast_result, dict):
-            forecast_data = forecast_result.get('predictions', [])
-            weather_impacts = forecast_result.get('weather_impacts', [])
+@app.route('/api/tempo/collocation')
+@http_cached('stations')
+@admission_limited('standard')
+def get_tempo_collocation():
+    """
+    Ground station vs TEMPO pairs and bias statistics for the stations
+    in ?bbox=min_lon,min_lat,max_lon,max_lat (every known station if omitted)
+    """
+    try:
+        bbox = parse_bbox(request.args['bbox']) if 'bbox' in request.args else None
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Invalid bbox: {e}"}), 400
+
+    try:
+        if bbox is None:
+            stations = station_index.all_stations()
         else:
-            forecast_data = forecast_result
-            weather_impacts = []
+            load_stations(bbox)
+            stations = station_index.stations_in_bbox(bbox, limit=math.inf)
+
+        result = collocation.pairs(stations)
+        if result is None:
+            return jsonify({"status": "error", "message": "TEMPO data unavailable"}), 503
+
+        log.info("Collocation request", extra={'stations': result['stations'],
+                                               'collocated': result['collocated']})
+
+        return render(dict(result, status="success", bbox=bbox), tables=('pairs',))
+    except Exception as e:
+        log.exception("Collocation endpoint failed")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+# Upper bound on points per TEMPO batch request
+MAX_TEMPO_BATCH_POINTS = 500
+
+
+@app.route('/api/tempo/batch', methods=['POST'])
+@admission_limited('batch')
+def get_tempo_batch():
+    """TEMPO values for many points: {"points": [[lat, lon], ...]}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        points = [(lat, lon) for lat, lon, _ in parse_points(data.get('points', []))]
+
+        if not points:
+            return jsonify({"status": "error", "message": "No points provided"}), 400
+        if len(points) > MAX_TEMPO_BATCH_POINTS:
+            return jsonify({
+                "status": "error",
+                "message": f"At most {MAX_TEMPO_BATCH_POINTS} points per request"
+            }), 400
+
+        log.info("TEMPO batch request", extra={'points': len(points)})
+
+        results, meta = get_tempo_values_at_locations(points)
+
+        return render(dict(meta, status="success", results=results), tables=('results',))
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Invalid points: {e}"}), 400
+    except Exception as e:
+        log.error("TEMPO batch endpoint failed: %s", e)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def stations_cache_key():
+    """Viewport requests share a cache entry per grid-snapped bbox"""
+    zoom = int(request.args.get('zoom', 10))
+    bbox = snap_bbox(parse_bbox(request.args['bbox']), zoom)
+    include_forecast = request.args.get('include_forecast') in ('1', 'true')
+    return 'bbox=%.5f,%.5f,%.5f,%.5f|zoom=%d|forecast=%d' % (bbox + (zoom, include_forecast))
+
+
+@app.route('/api/stations')
+@http_cached('stations', key_func=stations_cache_key)
+def get_stations():
+    """Viewport-bounded stations (clustered when zoomed out)"""
+    try:
+        zoom = int(request.args.get('zoom', 10))
+        bbox = snap_bbox(parse_bbox(request.args['bbox']), zoom)
+    except (KeyError, ValueError) as e:
+        return jsonify({
+            "status": "error",
+            "message": "bbox=min_lon,min_lat,max_lon,max_lat and integer zoom required"
+        }), 400
+
+    try:
+        result = query_stations(bbox, zoom)
+
+        if request.args.get('include_forecast') in ('1', 'true') and not result['clustered']:
+            result['features'] = get_request_context().with_forecasts(result['features'])
+
+        log.info("Stations request", extra={'zoom': zoom, 'features': len(result['features'])})
+
+        return render(dict(result, status="success", bbox=bbox), tables=('features',))
+    except Exception as e:
+        log.exception("Stations endpoint failed")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def heatmap_cache_key():
+    res = clamp_res(request.args.get('res', DEFAULT_RES))
+    bbox = parse_bbox(request.args['bbox'])
+    return 'bbox=%.4f,%.4f,%.4f,%.4f|res=%g' % (bbox + (res,))
+
+
+@app.route('/api/heatmap')
+@http_cached('heatmap', key_func=heatmap_cache_key)
+@admission_limited('standard')
+def get_heatmap():
+    """AQI raster fusing station readings with the TEMPO NO2 field"""
+    try:
+        res = clamp_res(request.args.get('res', DEFAULT_RES))
+        bbox = parse_bbox(request.args['bbox'])
+    except (KeyError, ValueError):
+        return jsonify({
+            "status": "error",
+            "message": "bbox=min_lon,min_lat,max_lon,max_lat required"
+        }), 400
+
+    try:
+        # Make sure stations under the viewport are loaded
+        query_stations(bbox, zoom=10)
+        heatmap = build_heatmap(bbox, res, binary=negotiate_format() == 'msgpack')
+
+        log.info("Heatmap request", extra={'width': heatmap['width'], 'height': heatmap['height'], 'bbox': bbox})
+
+        return render(dict(heatmap, status="success"))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        log.exception("Heatmap endpoint failed")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def geocode_cache_key():
+    """Searches differing only in case, accents or spacing share an entry"""
+    return '%s|q=%s|limit=%s' % (request.path, normalize_query(request.args.get('q', '')),
+                                 request.args.get('limit', ''))
+
+
+def reverse_geocode_cache_key():
+    return 'cell=%s' % cell_id(float(request.args['lat']), float(request.args['lon']),
+                               REVERSE_PRECISION)
+
+
+@app.route('/api/geocode')
+@http_cached('geocode', key_func=geocode_cache_key)
+def get_geocode():
+    """Forward geocode ?q= (cached, gazetteer first, then OpenCage)"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"status": "error", "message": "q required"}), 400
+
+    try:
+        limit = min(int(request.args.get('limit', 5)), MAX_GEOCODE_RESULTS)
+        results, source = geocode(query, limit)
+        log.info("Geocode request", extra={'query': query, 'results': len(results), 'source': source})
+        return render({"status": "success", "query": query, "source": source,
+                       "results": results}, tables=('results',))
+    except Exception as e:
+        log.exception("Geocode endpoint failed")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route('/api/geocode/autocomplete')
+@http_cached('geocode', key_func=geocode_cache_key)
+def get_geocode_autocomplete():
+    """Place-name suggestions for a ?q= prefix from the local gazetteer"""
+    try:
+        limit = min(int(request.args.get('limit', 8)), MAX_GEOCODE_RESULTS)
+        return render({"status": "success",
+                       "suggestions": autocomplete(request.args.get('q', ''), limit)},
+                      tables=('suggestions',))
+    except Exception as e:
+        log.error("Autocomplete endpoint failed: %s", e)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route('/api/geocode/reverse')
+@http_cached('geocode', key_func=reverse_geocode_cache_key)
+def get_reverse_geocode():
+    """Place name for ?lat=&lon=, memoized per ~100 m"""
+    try:
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+    except (KeyError, ValueError):
+        return jsonify({"status": "error", "message": "lat and lon required"}), 400
 
+    try:
+        result, source = reverse_geocode(lat, lon)
+        return render({"status": "success", "source": source, "result": result})
+    except Exception as e:
+        log.exception("Reverse geocode endpoint failed")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+# Cells per stream, and seconds between keep-alive comments
+MAX_STREAM_CELLS = 20
+STREAM_HEARTBEAT_SECONDS = 15
+
+
+@app.route('/api/stream')
+@admission_limited('stream')
+def stream_updates():
+    """
+    Server-Sent Events for ?cells=lat,lon;lat,lon
+
+    Sends a snapshot per cell, then only the fields that change when the
+    background refresh picks up new OpenAQ, TEMPO or forecast values. A
+    client too slow to keep up gets fresh snapshots instead of deltas.
+    Each open stream holds a worker thread, so the number of streams per
+    worker is capped (503 with Retry-After past the cap).
+    """
+    try:
+        cells = [cell_id(*parse_cell_id(c))
+                 for c in request.args.get('cells', '').split(';') if c.strip()]
+    except ValueError:
+        cells = None
+
+    if not cells or len(cells) > MAX_STREAM_CELLS:
         return jsonify({
+            "status": "error",
+            "message": f"cells=lat,lon;lat,lon with 1-{MAX_STREAM_CELLS} cells required"
+        }), 400
+
+    log.info("Stream opened", extra={'cells': len(cells)})
+
+    live_refresher.ensure_started()
+    subscription = pubsub.subscribe(cells)
+
+    def events():
+        try:
+            for cell in cells:
+                yield format_sse('snapshot', {'cell': cell, 'values': live_refresher.snapshot(cell)})
+            while True:
+                item = subscription.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                if item is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is RESYNC:
+                    # Deltas were dropped while this client lagged; start over
+                    log.info("Stream lagged, resending snapshots", extra={'cells': len(cells)})
+                    for cell in cells:
+                        yield format_sse('snapshot', {'cell': cell, 'values': live_refresher.snapshot(cell)})
+                    continue
+                cell, changes = item
+                yield format_sse('delta', {'cell': cell, 'changes': changes})
+        finally:
+            pubsub.unsubscribe(subscription)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@app.route('/api/forecast')
+@http_cached('forecast')
+@admission_limited('standard')
+def get_forecast():
+    try:
+        lat = float(request.args.get('lat', 39.9526))
+        lon = float(request.args.get('lon', -75.1652))
+
+        log.info("Forecast request", extra={'lat': lat, 'lon': lon})
+
+        ctx = get_request_context()
+        current_aqi = ctx.current_aqi(lat, lon)
+        forecast_result = ctx.forecast(lat, lon)
+
+        return render({
             "status": "success",
             "current_aqi": current_aqi,
             "forecast": forecast_result['predictions'],
             "weather_impacts": forecast_result['weather_impacts']
-        })
+        }, tables=('forecast', 'weather_impacts'))
     except Exception as e:
-        print(f"❌ ERROR in forecast endpoint: {str(e)}")
-        print(traceback.format_exc())
+        log.exception("Forecast endpoint failed")
         return jsonify({
             "status": "error",
             "message": str(e)
         }), 500
 
 
+# Widest range served per resolution (seconds)
+MAX_HISTORY_RANGE = {'raw': 31 * 86400, 'hour': 180 * 86400, 'day': 5 * 365 * 86400}
+DEFAULT_HISTORY_RANGE = 7 * 86400
+
+
+def history_range():
+    """(start, end) epoch seconds from ?start=&end= (ISO or epoch)"""
+    end = parse_time(request.args.get('end'), int(datetime.now().timestamp()))
+    start = parse_time(request.args.get('start'), end - DEFAULT_HISTORY_RANGE)
+    return start, end
+
+
+@app.route('/api/history')
+@http_cached('history')
+def get_history():
+    """Readings for ?station= over [start, end] at raw, hour or day resolution"""
+    try:
+        station = request.args['station']
+        if ':' not in station:
+            station = f"openaq:{station}"
+        resolution = request.args.get('resolution', 'hour')
+        start, end = history_range()
+        if resolution != 'raw' and resolution not in ROLLUP_TABLES:
+            raise ValueError("resolution must be raw, hour or day")
+        if not 0 <= end - start <= MAX_HISTORY_RANGE[resolution]:
+            raise ValueError(f"range must be at most {MAX_HISTORY_RANGE[resolution] // 86400} days")
+    except KeyError:
+        return jsonify({"status": "error", "message": "station required"}), 400
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    try:
+        points = history_store.query_readings(station, start, end, resolution)
+        return render({
+            "status": "success",
+            "station": station,
+            "resolution": resolution,
+            "start": start,
+            "end": end,
+            "points": points
+        }, tables=('points',))
+    except Exception as e:
+        log.exception("History endpoint failed")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route('/api/history/forecasts')
+@http_cached('history')
+def get_forecast_history():
+    """Forecasts issued for the cell at ?lat=&lon= with targets in [start, end]"""
+    try:
+        lat = float(request.args.get('lat', 39.9526))
+        lon = float(request.args.get('lon', -75.1652))
+        start, end = history_range()
+        if not 0 <= end - start <= MAX_HISTORY_RANGE['hour']:
+            raise ValueError(f"range must be at most {MAX_HISTORY_RANGE['hour'] // 86400} days")
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    try:
+        cell = cell_id(lat, lon)
+        forecasts = history_store.query_forecasts(cell, start, end)
+        return render({
+            "status": "success",
+            "cell": cell,
+            "start": start,
+            "end": end,
+            "forecasts": forecasts
+        }, tables=('forecasts',))
+    except Exception as e:
+        log.exception("Forecast history endpoint failed")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route('/api/export/<dataset>')
+@admission_limited('batch')
+def get_export(dataset):
+    """
+    Stream a dataset (readings, forecasts or tempo) for ?bbox= over
+    [start, end] as ?format=csv (default), ndjson or parquet
+    """
+    if dataset not in EXPORT_DATASETS:
+        return jsonify({
+            "status": "error",
+            "message": f"dataset must be one of {', '.join(EXPORT_DATASETS)}"
+        }), 404
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"status": "error", "message": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    if fmt == 'parquet' and not PARQUET_AVAILABLE:
+        return jsonify({"status": "error", "message": "Parquet export needs pyarrow installed"}), 501
+
+    try:
+        bbox = parse_bbox(request.args['bbox'])
+        start, end = history_range()
+        if not 0 <= end - start <= MAX_EXPORT_RANGE:
+            raise ValueError(f"range must be at most {MAX_EXPORT_RANGE // 86400} days")
+    except KeyError:
+        return jsonify({"status": "error", "message": "bbox=min_lon,min_lat,max_lon,max_lat required"}), 400
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    log.info("Export request", extra={'dataset': dataset, 'format': fmt, 'bbox': bbox,
+                                      'start': start, 'end': end})
+
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"aircast-{dataset}-{start}-{end}.{extension}"
+    return Response(stream_with_context(export_stream(dataset, fmt, bbox, start, end)),
+                    mimetype=mimetype, headers={
+                        'Content-Disposition': f'attachment; filename="{filename}"',
+                        'X-Accel-Buffering': 'no'
+                    })
+
+
 @app.route('/api/safety-groups')
+@http_cached('safety-groups')
+@admission_limited('standard')
 def get_safety_groups():
     try:
         lat = float(request.args.get('lat', 39.9526))
         lon = float(request.args.get('lon', -75.1652))
 
-        print(f"✅ Received safety groups request for: {lat}, {lon}")
+        log.info("Safety groups request", extra={'lat': lat, 'lon': lon})
+
+        ctx = get_request_context()
 
         # Get current AQI
-        locations = get_latest_measurements(lat, lon, radius_km=25)
-        current_aqi = locations[0]['aqi'] if locations and len(
-            locations) > 0 else 65
+        current_aqi = ctx.current_aqi(lat, lon)
 
         # Get 6-hour forecast
-        weather_data = get_weather_forecast(lat, lon)
-        forecast_result = forecast_air_quality(
-            current_aqi, weather_data if weather_data else [], hours_ahead=6)
+        forecast_result = ctx.forecast(lat, lon)
 
         # Extract predictions from the new dictionary structure
         forecast = forecast_result.get('predictions', []) if isinstance(
             forecast_result, dict) else forecast_result
 
-        # Import user groups function
-        from models.user_groups import get_safety_by_user_group
-
-        # Calculate safety for current hour
-        current_safety = get_safety_by_user_group(current_aqi)
-
-        # Calculate safety for each forecast hour
-        forecast_safety = []
-        for f in forecast:
-            forecast_safety.append({
-                'hour': f['hour'],
-                'aqi': f['aqi'],
-                'groups': get_safety_by_user_group(f['aqi'])
-            })
-
-        # Find best and worst times for each group
-        # Find best and worst times for each group
-        group_keys = ['children', 'adults',
-                      'seniors', 'athletes', 'facilities']
-        best_worst_times = {}
-
-        # Only calculate if we have forecast data
-        if forecast_safety and len(forecast_safety) > 0:
-            for group_key in group_keys:
-                # Find safest hour (lowest AQI where status is 'safe' or lowest overall)
-                safe_hours = [f for f in forecast_safety if f['groups']
-                              [group_key]['status'] == 'safe']
-                best_hour = min(safe_hours, key=lambda x: x['aqi']) if safe_hours else min(
-                    forecast_safety, key=lambda x: x['aqi'])
-
-                # Find worst hour (highest AQI)
-                worst_hour = max(forecast_safety, key=lambda x: x['aqi'])
-
-                best_worst_times[group_key] = {
-                    'best': {
-                        'hour': best_hour['hour'],
-                        'aqi': best_hour['aqi'],
-                        'status': best_hour['groups'][group_key]['status']
-                    },
-                    'worst': {
-                        'hour': worst_hour['hour'],
-                        'aqi': worst_hour['aqi'],
-                        'status': worst_hour['groups'][group_key]['status']
-                    }
-                }
-        else:
-            # Provide default values if no forecast available
-            for group_key in group_keys:
-                best_worst_times[group_key] = {
-                    'best': {'hour': 0, 'aqi': current_aqi, 'status': 'caution'},
-                    'worst': {'hour': 0, 'aqi': current_aqi, 'status': 'caution'}
-                }
+        # Current hour, each forecast hour and best/worst times per group
+        report = safety_reports([current_aqi], [forecast])[0]
 
-        return jsonify({
-            "status": "success",
-            "current_aqi": current_aqi,
-            "current_safety": current_safety,
-            "forecast_safety": forecast_safety,
-            "best_worst_times": best_worst_times
-        })
+        return jsonify(dict(report, status="success"))
     except Exception as e:
-        print(f"❌ ERROR in safety groups endpoint: {str(e)}")
-        print(traceback.format_exc())
+        log.exception("Safety groups endpoint failed")
         return jsonify({
             "status": "error",
             "message": str(e)
         }), 500
-    
+
+
+def batch_response(name, evaluate):
+    """
+    NDJSON response for a {"points": [...]} batch request: one line per
+    point as its cell completes, then a summary line
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        points = parse_points(data.get('points', []))
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Invalid points: {e}"}), 400
+
+    if not points:
+        return jsonify({"status": "error", "message": "No points provided"}), 400
+    if len(points) > MAX_BATCH_POINTS:
+        return jsonify({
+            "status": "error",
+            "message": f"At most {MAX_BATCH_POINTS} points per request"
+        }), 400
+
+    log.info("%s batch request", name, extra={'points': len(points)})
+
+    records = evaluate(get_request_context(), points)
+    return Response(stream_with_context(format_ndjson(record) for record in records),
+                    mimetype=NDJSON_MIMETYPE, headers={'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/forecast/batch', methods=['POST'])
+@admission_limited('batch')
+def get_forecast_batch():
+    """Forecasts for many points: {"points": [[lat, lon] | {"lat", "lon", "id"}, ...]}"""
+    return batch_response('Forecast', forecast_batch)
+
+
+@app.route('/api/safety-groups/batch', methods=['POST'])
+@admission_limited('batch')
+def get_safety_groups_batch():
+    """Safety by user group for many points, same body as /api/forecast/batch"""
+    return batch_response('Safety groups', safety_batch)
+
 
 @app.route('/api/ai-summary')
+@http_cached('ai-summary')
+@admission_limited('ai')
 def ai_summary():
     """Generate automatic daily air quality summary using AI"""
     try:
         lat = float(request.args.get('lat', 39.9526))
         lon = float(request.args.get('lon', -75.1652))
-        
-        print(f"🤖 Generating AI summary for: {lat}, {lon}")
-        
-        # Gather all data sources
-        locations = get_latest_measurements(lat, lon, radius_km=25)
-        current_aqi = locations[0]['aqi'] if locations and len(locations) > 0 else 65
-        measurements = locations[0]['measurements'] if locations and len(locations) > 0 else {}
-        location_name = locations[0]['name'] if locations and len(locations) > 0 else 'your area'
-        
-        # Get weather data
-        weather_data = get_weather_forecast(lat, lon)
-        current_weather = get_current_weather(lat, lon)
-        
-        # Get forecast
-        forecast_result = forecast_air_quality(
-            current_aqi, 
-            weather_data[:6] if weather_data else [], 
-            hours_ahead=6
-        )
-        forecast = forecast_result.get('predictions', []) if isinstance(forecast_result, dict) else forecast_result
-        
-        # Get TEMPO satellite data
-        tempo_data = get_tempo_value_at_location(lat, lon)
-        
+
+        log.info("AI summary request", extra={'lat': lat, 'lon': lon})
+
+        # Gather all data sources (shared with the other routes this session)
+        summary_data = get_request_context().location_summary(lat, lon)
+        current_aqi = summary_data['current_aqi']
+        measurements = summary_data['measurements']
+        location_name = summary_data['location_name']
+        current_weather = summary_data['current_weather']
+        forecast = summary_data['forecast']
+        tempo_data = summary_data['tempo']
+
         # Build comprehensive context
         current_time = datetime.now().strftime("%I:%M %p")
         current_day = datetime.now().strftime("%A")
-        
+
         # Find peak and best times
         if forecast and len(forecast) > 0:
             peak = max(forecast, key=lambda x: x['aqi'])
@@ -309,7 +765,12 @@ def ai_summary():
         else:
             peak = {'hour': 0, 'aqi': current_aqi, 'reason': 'stable conditions'}
             best = {'hour': 0, 'aqi': current_aqi, 'reason': 'stable conditions'}
-        
+
+        # Under load, reuse the last generated summary or fill in a
+        # template instead of holding a slot for a new generation
+        if current_tier() >= 1:
+            return jsonify(degraded_summary(lat, lon, summary_data, peak, best, current_time))
+
         # Build context for AI
         context = f"""
 Location: {location_name}
@@ -357,10 +818,10 @@ Your daily briefs should:
 Avoid technical jargon unless you immediately explain it in simple terms."""
 
         # Call OpenAI
-        if openai_client is None:
-            raise Exception("OpenAI client not initialized")
-        
-        response = openai_client.chat.completions.create(
+        response, stale = call_upstream(
+            'openai',
+            ('ai-summary',) + snap_to_cell(lat, lon),
+            get_openai_client().chat.completions.create,
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -369,24 +830,25 @@ Avoid technical jargon unless you immediately explain it in simple terms."""
             max_tokens=300,
             temperature=0.8
         )
-        
+
         summary = response.choices[0].message.content
         tokens_used = response.usage.total_tokens
-        
-        print(f"✅ AI summary generated ({tokens_used} tokens)")
-        
+        count_tokens('ai-summary', tokens_used)
+
+        log.info("AI summary generated", extra={'tokens': tokens_used})
+
         return jsonify({
             "status": "success",
             "summary": summary,
             "current_aqi": current_aqi,
             "timestamp": current_time,
-            "tokens_used": tokens_used
+            "tokens_used": tokens_used,
+            "stale": stale
         })
-        
+
     except Exception as e:
-        print(f"❌ AI Summary Error: {str(e)}")
-        traceback.print_exc()
-        
+        log.exception("AI summary failed")
+
         # Fallback response
         current_aqi = 65
         fallback_summary = f"""Good day! 👋 
@@ -396,7 +858,7 @@ The air quality right now is moderate.
 Our AI analysis is temporarily offline, but we'll have detailed insights for you soon. In the meantime, check the map and forecast for current conditions.
 
 Stay safe and breathe easy! 🌬️"""
-        
+
         return jsonify({
             "status": "partial",
             "summary": fallback_summary,
@@ -406,6 +868,44 @@ Stay safe and breathe easy! 🌬️"""
         }), 200
 
 
+# One line of advice per AQI level for templated summaries
+LEVEL_ADVICE = {
+    "Good": "It's a great time to be outside.",
+    "Moderate": "Fine for most people; unusually sensitive folks may want to take it easy.",
+    "Unhealthy for Sensitive Groups": "Kids, seniors and anyone with asthma should limit long outdoor exertion.",
+    "Unhealthy": "Consider moving workouts and outdoor plans indoors.",
+    "Very Unhealthy": "Stay indoors where you can and keep windows closed.",
+    "Hazardous": "Avoid going outside; run air filtration if you have it.",
+}
+
+
+def degraded_summary(lat, lon, summary_data, peak, best, current_time):
+    """ai-summary payload without a new generation: the last one, or a template"""
+    cached = last_known_good('openai', ('ai-summary',) + snap_to_cell(lat, lon))
+    current_aqi = summary_data['current_aqi']
+
+    if cached is not None:
+        summary = cached.choices[0].message.content
+    else:
+        level = get_aqi_level(current_aqi)
+        summary = (f"Air quality near {summary_data['location_name']} is {level.lower()} "
+                   f"right now (AQI {current_aqi}). {LEVEL_ADVICE[level]}\n\n"
+                   f"Best outdoor window: in {best['hour']} hours (AQI {best['aqi']}). "
+                   f"Worst: in {peak['hour']} hours (AQI {peak['aqi']}).\n\n"
+                   "Detailed AI insights are paused while we're busy; check the map and "
+                   "forecast for current conditions.")
+
+    return {
+        "status": "success",
+        "summary": summary,
+        "current_aqi": current_aqi,
+        "timestamp": current_time,
+        "tokens_used": 0,
+        "stale": cached is not None,
+        "degraded": True
+    }
+
+
 def get_aqi_level(aqi):
     """Helper function to get AQI level name"""
     if aqi <= 50:
@@ -425,6 +925,7 @@ def get_aqi_level(aqi):
 chat_sessions = {}
 
 @app.route('/api/ai-chat', methods=['POST'])
+@admission_limited('ai')
 def ai_chat():
     """Interactive chatbot for air quality questions"""
     try:
@@ -432,38 +933,29 @@ def ai_chat():
         user_message = data.get('message', '').strip()
         session_id = data.get('session_id', 'default')
         lat = float(data.get('lat', 39.9526))
-        lon = float(data.get('lon', -75.1652))
-        
+        lon = float(data.get('lon', data.get('lng', -75.1652)))
+
         if not user_message:
             return jsonify({
                 "status": "error",
                 "message": "No message provided"
             }), 400
-        
-        print(f"💬 Chat message: '{user_message}' (session: {session_id})")
-        
+
+        log.info("Chat message", extra={'session_id': session_id, 'chars': len(user_message)})
+
         # Initialize session if new
         if session_id not in chat_sessions:
             chat_sessions[session_id] = []
-        
-        # Gather current air quality context
-        locations = get_latest_measurements(lat, lon, radius_km=25)
-        current_aqi = locations[0]['aqi'] if locations and len(locations) > 0 else 65
-        measurements = locations[0]['measurements'] if locations and len(locations) > 0 else {}
-        location_name = locations[0]['name'] if locations and len(locations) > 0 else 'your area'
-        
-        weather_data = get_weather_forecast(lat, lon)
-        current_weather = get_current_weather(lat, lon)
-        
-        forecast_result = forecast_air_quality(
-            current_aqi, 
-            weather_data[:6] if weather_data else [], 
-            hours_ahead=6
-        )
-        forecast = forecast_result.get('predictions', []) if isinstance(forecast_result, dict) else forecast_result
-        
-        tempo_data = get_tempo_value_at_location(lat, lon)
-        
+
+        # Gather current air quality context (reused across chat messages)
+        summary_data = get_request_context().location_summary(lat, lon)
+        current_aqi = summary_data['current_aqi']
+        measurements = summary_data['measurements']
+        location_name = summary_data['location_name']
+        current_weather = summary_data['current_weather']
+        forecast = summary_data['forecast']
+        tempo_data = summary_data['tempo']
+
         # Build context
         context = f"""
 CURRENT AIR QUALITY DATA ({location_name}):
@@ -481,7 +973,7 @@ CURRENT AIR QUALITY DATA ({location_name}):
 SATELLITE DATA:
 - NASA TEMPO AQI: {tempo_data.get('aqi', 'N/A')}
 """
-        
+
         # Build conversation history (last 5 messages for context)
         messages = [
             {
@@ -504,51 +996,53 @@ Guidelines:
 """
             }
         ]
-        
+
         # Add recent conversation history
         for msg in chat_sessions[session_id][-4:]:  # Last 4 messages (2 exchanges)
             messages.append({"role": "user", "content": msg['user']})
             messages.append({"role": "assistant", "content": msg['assistant']})
-        
+
         # Add current question with context
         messages.append({
             "role": "user",
             "content": f"Current air quality data:\n{context}\n\nUser question: {user_message}"
         })
-        
+
         # Call OpenAI
-        if openai_client is None:
-            raise Exception("OpenAI client not initialized")
-        
-        response = openai_client.chat.completions.create(
+        # Chat answers are never replayed from cache; an open breaker
+        # fails fast into the fallback message below
+        response, _ = call_upstream(
+            'openai',
+            None,
+            get_openai_client().chat.completions.create,
             model="gpt-4o-mini",
             messages=messages,
             max_tokens=200,
             temperature=0.7
         )
-        
+
         ai_response = response.choices[0].message.content
         tokens_used = response.usage.total_tokens
-        
+        count_tokens('ai-chat', tokens_used)
+
         # Store in session history
         chat_sessions[session_id].append({
             'user': user_message,
             'assistant': ai_response,
             'timestamp': datetime.now().isoformat()
         })
-        
-        print(f"✅ AI response generated ({tokens_used} tokens)")
-        
+
+        log.info("AI chat response generated", extra={'tokens': tokens_used})
+
         return jsonify({
             "status": "success",
             "response": ai_response,
             "tokens_used": tokens_used
         })
-        
+
     except Exception as e:
-        print(f"❌ Chat Error: {str(e)}")
-        traceback.print_exc()
-        
+        log.exception("AI chat failed")
+
         return jsonify({
             "status": "error",
             "response": "I'm having trouble right now. Please try asking again!",
@@ -558,9 +1052,6 @@ Guidelines:
 
 
 if __name__ == '__main__':
-    print("�� Starting AirCast API on http://localhost:5000")
-    print("=" * 50)
-    print("📍 Frontend: http://localhost:5000")
-    print("📡 API: http://localhost:5000/api/")
-    print("=" * 50)
+    log.info("Starting AirCast API", extra={'url': 'http://localhost:8000', 'api': 'http://localhost:8000/api/'})
+    warmer.ensure_started(warm_first=True)
     app.run(debug=True, port=8000, host='0.0.0.0')
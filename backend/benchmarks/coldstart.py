@@ -0,0 +1,175 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import requests
+
+from benchmarks.run import BACKEND_DIR, free_port
+from benchmarks.standins import StandinServer
+
+# ========================================
+# Cold-start measurement
+# ========================================
+# python -m benchmarks.coldstart (from backend/)
+#
+# Reports, with and without gunicorn preloading:
+#   import     seconds to import app.py in a fresh interpreter
+#   first      gunicorn launch to first successful /api/ response
+#   respawn    worker killed to a replacement serving again
+#   worker MB  private (unshared) memory per worker after start
+
+STARTUP_TIMEOUT = 120
+
+
+def import_seconds(env, runs=5):
+    """Median wall time of `import app` in a fresh interpreter"""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import app'], cwd=BACKEND_DIR, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings))
+
+
+def slowest_imports(env, top=8):
+    """(module, cumulative ms) of the slowest top-level imports under app"""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # Direct imports of app.py are indented by exactly three spaces
+        if name.startswith('   ') and not name.startswith('    '):
+            modules.append((name.strip(), int(cumulative) / 1000))
+    return sorted(modules, key=lambda m: -m[1])[:top]
+
+
+def nested_import_ms(env, modules=('numpy', 'netCDF4', 'httpx')):
+    """
+    {module: cumulative ms} under `import app` for modules imported at
+    any depth; numpy stays on the import path on purpose (the gazetteer,
+    raster and user-group tables are built with it at import, and with
+    preload_app that happens once in the master), so this shows what it
+    costs. A module missing from the result is not imported at startup.
+    """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True).stderr
+    found = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if name.strip() in modules:
+            found[name.strip()] = int(cumulative) / 1000
+    return found
+
+
+def wait_ready(url, process, since):
+    deadline = since + STARTUP_TIMEOUT
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}")
+        try:
+            if requests.get(url, timeout=1).ok:
+                return time.perf_counter() - since
+        except requests.RequestException:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError("app did not start in time")
+
+
+def worker_pids(master_pid):
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                if int(f.read().rsplit(')', 1)[1].split()[1]) == master_pid:
+                    pids.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return pids
+
+
+def private_mb(pid):
+    """Private_Clean + Private_Dirty of a process, in MB"""
+    total = 0
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                total += int(line.split()[1])
+    return total / 1024
+
+
+def measure_gunicorn(env, preload, workers):
+    port = free_port()
+    url = f'http://127.0.0.1:{port}/api/'
+    env = dict(env, AIRCAST_PRELOAD='1' if preload else '0')
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+         '--bind', f'127.0.0.1:{port}', '--workers', str(workers), 'app:app'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        first = wait_ready(url, process, started)
+
+        # Let every worker finish booting before measuring them
+        deadline = time.perf_counter() + STARTUP_TIMEOUT
+        while len(worker_pids(process.pid)) < workers and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        for _ in range(workers * 4):
+            requests.get(url, timeout=10)
+        pids = worker_pids(process.pid)
+        memory = float(np.mean([private_mb(pid) for pid in pids])) if pids else None
+
+        # Kill every worker at once so no warm sibling can answer
+        killed = time.perf_counter()
+        for pid in pids:
+            os.kill(pid, signal.SIGKILL)
+        time.sleep(0.05)
+        respawn = wait_ready(url, process, killed)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    return {'first_s': round(first, 3), 'respawn_s': round(respawn, 3),
+            'worker_private_mb': round(memory, 1) if memory is not None else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure AirCast cold-start time")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--runs', type=int, default=5, help="fresh imports to time")
+    args = parser.parse_args()
+
+    standins = StandinServer(latency_ms=0).start()
+    env = dict(os.environ, **standins.env(), LOG_LEVEL='WARNING',
+               AIRCAST_DATA_DIR=tempfile.mkdtemp(prefix='aircast-bench-'))
+    try:
+        print(f"⏱️  import app: {import_seconds(env, args.runs):.3f}s (median of {args.runs})")
+        for name, ms in slowest_imports(env):
+            print(f"   {name:<24} {ms:>8.1f} ms")
+        for name, ms in nested_import_ms(env).items():
+            print(f"   {name + ' (nested)':<24} {ms:>8.1f} ms")
+
+        print(f"\n{'mode':<12} {'first s':>9} {'respawn s':>10} {'worker MB':>10}")
+        for preload in (False, True):
+            result = measure_gunicorn(env, preload, args.workers)
+            print(f"{'preload' if preload else 'per-worker':<12} {result['first_s']:>9} "
+                  f"{result['respawn_s']:>10} {result['worker_private_mb']!s:>10}")
+    finally:
+        standins.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+# ========================================
+# Route load tests
+# ========================================
+# Every /api/* route needs an entry here (or in SKIPPED_ROUTES); the
+# runner fails if the app grows a route the suite does not cover.
+# Requests rotate through POINTS so the response caches see a mix of
+# hits and misses, as they do with real map traffic.
+
+POINTS = [(39.9526 + 0.05 * i, -75.1652 + 0.05 * j) for i in range(-2, 2) for j in range(-2, 2)]
+
+
+def _point_params(i):
+    lat, lon = POINTS[i % len(POINTS)]
+    return {'lat': lat, 'lon': lon}
+
+
+def _bbox(i, span=0.3):
+    lat, lon = POINTS[i % len(POINTS)]
+    return f"{lon - span},{lat - span},{lon + span},{lat + span}"
+
+
+ROUTES = {
+    '/api/': lambda i: ('GET', '/api/', None, None),
+    '/api/upstreams': lambda i: ('GET', '/api/upstreams', None, None),
+    '/api/air-quality': lambda i: ('GET', '/api/air-quality', _point_params(i), None),
+    '/api/weather': lambda i: ('GET', '/api/weather', _point_params(i), None),
+    '/api/tempo': lambda i: ('GET', '/api/tempo', _point_params(i), None),
+    '/api/tempo/area': lambda i: ('GET', '/api/tempo/area', dict(_point_params(i), radius_km=5 + i % 20), None),
+    '/api/tempo/collocation': lambda i: ('GET', '/api/tempo/collocation', {'bbox': _bbox(i)}, None),
+    '/api/export/<dataset>': lambda i: ('GET', '/api/export/' + ('readings', 'forecasts', 'tempo')[i % 3],
+                                        {'bbox': _bbox(i), 'format': ('csv', 'ndjson')[i % 2]}, None),
+    '/api/tempo/batch': lambda i: ('POST', '/api/tempo/batch', None, {
+        'points': [[lat + 0.001 * i, lon] for lat, lon in POINTS]}),
+    '/api/stations': lambda i: ('GET', '/api/stations', {'bbox': _bbox(i), 'zoom': 11}, None),
+    '/api/heatmap': lambda i: ('GET', '/api/heatmap', {'bbox': _bbox(i)}, None),
+    '/api/geocode': lambda i: ('GET', '/api/geocode', {
+        'q': ['Philadelphia', 'Camden, NJ', 'Wilmington', 'Trenton'][i % 4]}, None),
+    '/api/geocode/autocomplete': lambda i: ('GET', '/api/geocode/autocomplete', {
+        'q': ['Phi', 'Pit', 'Cam', 'Wil', 'New', 'Bal'][i % 6]}, None),
+    '/api/geocode/reverse': lambda i: ('GET', '/api/geocode/reverse', _point_params(i), None),
+    '/api/forecast': lambda i: ('GET', '/api/forecast', _point_params(i), None),
+    '/api/forecast/batch': lambda i: ('POST', '/api/forecast/batch', None, {
+        'points': [[lat + 0.001 * i, lon] for lat, lon in POINTS]}),
+    '/api/history': lambda i: ('GET', '/api/history', {
+        'station': 'openaq:2333', 'resolution': ['raw', 'hour', 'day'][i % 3]}, None),
+    '/api/history/forecasts': lambda i: ('GET', '/api/history/forecasts', _point_params(i), None),
+    '/api/safety-groups': lambda i: ('GET', '/api/safety-groups', _point_params(i), None),
+    '/api/safety-groups/batch': lambda i: ('POST', '/api/safety-groups/batch', None, {
+        'points': [{'lat': lat, 'lon': lon, 'id': f"site-{n}"} for n, (lat, lon) in enumerate(POINTS)]}),
+    '/api/ai-summary': lambda i: ('GET', '/api/ai-summary', _point_params(i), None),
+    '/api/ai-chat': lambda i: ('POST', '/api/ai-chat', None, dict(
+        _point_params(i), message="Is it safe to go running this evening?",
+        session_id=f"bench-{i % 8}")),
+}
+
+SKIPPED_ROUTES = {
+    '/api/stream': "long-lived SSE stream; latency is not per request",
+}
+
+
+# Pause before a client retries after a 503
+SHED_BACKOFF = 0.2
+
+
+def percentile_ms(latencies, q):
+    return round(float(np.percentile(latencies, q)) * 1000, 2) if latencies else None
+
+
+def run_route(base_url, route, duration=5.0, concurrency=16, warmup=0.5):
+    """
+    Hammer one route from `concurrency` client threads for `duration` s
+
+    Returns throughput (requests/s), p50/p99 latency (ms) and the error
+    count. Requests shed by admission control (503) are counted apart
+    and left out of throughput and latency. Requests during the warm-up
+    window are not measured.
+    """
+    build = ROUTES[route]
+    counter = itertools.count()
+    latencies = []
+    errors = [0]
+    shed = [0]
+    lock = threading.Lock()
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def client():
+        session = requests.Session()
+        local, local_errors, local_shed = [], 0, 0
+        while True:
+            method, path, params, body = build(next(counter))
+            t0 = time.perf_counter()
+            if t0 >= stop_at:
+                break
+            status = None
+            try:
+                response = session.request(method, base_url + path, params=params,
+                                           json=body, timeout=30)
+                status = response.status_code
+            except requests.RequestException:
+                pass
+            t1 = time.perf_counter()
+            if status == 503:
+                local_shed += t0 >= measure_from
+                # Back off like a client honouring Retry-After would, so
+                # shed retries don't starve the admitted requests of CPU
+                time.sleep(SHED_BACKOFF)
+            elif t0 >= measure_from:
+                local.append(t1 - t0)
+                local_errors += status is None or status >= 400
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+            shed[0] += local_shed
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(client) for _ in range(concurrency)]:
+            future.result()
+
+    return {
+        'requests': len(latencies),
+        'throughput': round(len(latencies) / duration, 1),
+        'p50_ms': percentile_ms(latencies, 50),
+        'p99_ms': percentile_ms(latencies, 99),
+        'errors': errors[0],
+        'shed': shed[0]
+    }
@@ -0,0 +1,121 @@
+import time
+
+import numpy as np
+
+from benchmarks.load import POINTS
+
+# ========================================
+# Microbenchmarks
+# ========================================
+# Hot functions timed in-process. Calls are timed in blocks so the timer
+# overhead does not swamp sub-microsecond functions; p50/p99 are per call
+# (in microseconds) averaged within each block.
+
+BLOCK_SECONDS = 0.002
+
+
+def _weather_forecast():
+    """The recorded forecast in the shape fetch_weather_forecast returns"""
+    from benchmarks.standins import load_fixture
+    return [{
+        'time': item['dt_txt'],
+        'temperature': item['main']['temp'],
+        'wind_speed': item['wind']['speed'],
+        'humidity': item['main']['humidity'],
+        'precipitation': item.get('rain', {}).get('3h', 0)
+    } for item in load_fixture('openweather_forecast.json')['list']]
+
+
+def _source_stations(bbox=(-76.0, 39.0, -74.0, 41.0)):
+    """Normalized AirNow and PurpleAir stand-in stations for one area"""
+    from api.airnow import process_airnow_rows
+    from api.purpleair import process_purpleair_sensors
+    from benchmarks.standins import SyntheticFeeds
+    feeds = SyntheticFeeds()
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return [
+        process_airnow_rows(feeds.airnow_data({'BBOX': [f"{min_lon},{min_lat},{max_lon},{max_lat}"]})),
+        process_purpleair_sensors(feeds.purpleair_sensors({
+            'nwlng': [min_lon], 'nwlat': [max_lat], 'selng': [max_lon], 'selat': [min_lat]})),
+    ]
+
+
+def benchmarks():
+    """name -> zero-argument callable; imported lazily so env overrides apply"""
+    from api.connectors import merge_stations
+    from api.openaq import pm25_to_aqi
+    from api.tempo import get_tempo_area_average, get_tempo_value_at_location
+    from models.forecast import forecast_air_quality
+    from models.user_groups import get_safety_by_user_group
+
+    weather = _weather_forecast()
+    sources = _source_stations()
+    pm25_values = np.random.default_rng(0).gamma(2.0, 8.0, 1024).tolist()
+    aqi_values = list(range(0, 500, 7))
+    cycle = {'i': 0}
+
+    def next_index():
+        cycle['i'] += 1
+        return cycle['i']
+
+    def tempo():
+        lat, lon = POINTS[next_index() % len(POINTS)]
+        return get_tempo_value_at_location(lat, lon)
+
+    def tempo_area():
+        lat, lon = POINTS[next_index() % len(POINTS)]
+        return get_tempo_area_average(lat, lon, radius_km=25)
+
+    def forecast():
+        return forecast_air_quality(40 + next_index() % 120, weather, hours_ahead=6)
+
+    def pm25():
+        return pm25_to_aqi(pm25_values[next_index() % len(pm25_values)])
+
+    def safety():
+        return get_safety_by_user_group(aqi_values[next_index() % len(aqi_values)])
+
+    def merge():
+        return merge_stations(sources)
+
+    return {
+        'get_tempo_value_at_location': tempo,
+        'get_tempo_area_average': tempo_area,
+        'forecast_air_quality': forecast,
+        'pm25_to_aqi': pm25,
+        'get_safety_by_user_group': safety,
+        'merge_stations': merge,
+    }
+
+
+def run_micro(func, duration=1.0):
+    """Per-call ops/s and p50/p99 latency of func over `duration` seconds"""
+    func()  # warm caches (e.g. the TEMPO granule download)
+
+    # Size blocks so each takes roughly BLOCK_SECONDS
+    t0 = time.perf_counter()
+    calls = 0
+    while time.perf_counter() - t0 < BLOCK_SECONDS:
+        func()
+        calls += 1
+    block = max(calls, 1)
+
+    per_call = []
+    stop_at = time.perf_counter() + duration
+    total_calls = 0
+    total_time = 0.0
+    while time.perf_counter() < stop_at:
+        t0 = time.perf_counter()
+        for _ in range(block):
+            func()
+        elapsed = time.perf_counter() - t0
+        per_call.append(elapsed / block)
+        total_calls += block
+        total_time += elapsed
+
+    return {
+        'calls': total_calls,
+        'throughput': round(total_calls / total_time, 1),
+        'p50_us': round(float(np.percentile(per_call, 50)) * 1e6, 3),
+        'p99_us': round(float(np.percentile(per_call, 99)) * 1e6, 3),
+    }
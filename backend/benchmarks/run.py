@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import requests
+
+from benchmarks.load import ROUTES, SKIPPED_ROUTES, run_route
+from benchmarks.micro import benchmarks, run_micro
+from benchmarks.standins import DEFAULT_LATENCY_MS, StandinServer
+
+# ========================================
+# Benchmark runner
+# ========================================
+# python -m benchmarks.run (from backend/)
+#
+# Starts the stand-in upstreams, serves the app with gunicorn the way
+# startup.sh does, load-tests every /api/* route, runs the
+# microbenchmarks and compares everything against baseline.json. Exits
+# non-zero when a result regresses past the tolerance.
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Allowed slowdown relative to the baseline; p99 is noisier and gets double.
+# Shared or single-core CI machines need the generous default.
+DEFAULT_TOLERANCE = 0.5
+
+APP_STARTUP_TIMEOUT = 60
+
+LIST_ROUTES = ("import json; from app import app; "
+               "print(json.dumps(sorted({r.rule for r in app.url_map.iter_rules()})))")
+
+
+def calibrate(rounds=5):
+    """
+    Seconds for a fixed CPU workload (median of rounds)
+
+    Stored with the baseline so a run on a slower or busier machine
+    scales its thresholds instead of failing everywhere.
+    """
+    payload = {'stations': [{'id': i, 'lat': 39.9 + i * 1e-3, 'aqi': i % 300} for i in range(2000)]}
+    grid = np.random.default_rng(0).random((400, 600))
+    timings = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for _ in range(10):
+            json.loads(json.dumps(payload))
+            np.abs(grid - 0.5).argmin()
+        timings.append(time.perf_counter() - t0)
+    return float(np.median(timings))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def app_routes(env):
+    """The app's /api/* routes, read from a throwaway import of app.py"""
+    output = subprocess.run([sys.executable, '-c', LIST_ROUTES], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    rules = json.loads(output.strip().splitlines()[-1])
+    return [rule for rule in rules if rule.startswith('/api/')]
+
+
+def start_app(env, port, workers, threads):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+         '--bind', f'127.0.0.1:{port}', '--threads', str(threads), '--workers', str(workers),
+         'app:app'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + APP_STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}")
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/api/', timeout=1).ok:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("app did not start in time")
+
+
+def compare(results, baseline, tolerance, speed=1.0):
+    """
+    Regression messages for every metric worse than the baseline by more
+    than the tolerance, after scaling by speed (this machine's calibration
+    time over the baseline's)
+    """
+    regressions = []
+    for group, entries in results.items():
+        for name, result in entries.items():
+            if result.get('errors'):
+                regressions.append(f"{group}/{name}: {result['errors']} failed requests")
+            base = baseline.get(group, {}).get(name)
+            if not base:
+                continue
+            for metric, value in result.items():
+                if metric not in base or value is None or not base[metric]:
+                    continue
+                if metric.startswith(('p50_', 'p99_')):
+                    allowed = base[metric] * speed * (1 + tolerance * (2 if metric.startswith('p99_') else 1))
+                    if value > allowed:
+                        regressions.append(f"{group}/{name}: {metric} {value} > {round(allowed, 3)} "
+                                           f"(baseline {base[metric]})")
+                elif metric == 'throughput':
+                    allowed = base[metric] / speed / (1 + tolerance)
+                    if value < allowed:
+                        regressions.append(f"{group}/{name}: throughput {value} < {round(allowed, 1)} "
+                                           f"(baseline {base[metric]})")
+    return regressions
+
+
+def run_load(standins, args):
+    env = dict(os.environ, **standins.env(), LOG_LEVEL='WARNING',
+               AIRCAST_DATA_DIR=tempfile.mkdtemp(prefix='aircast-bench-'))
+
+    routes = app_routes(env)
+    uncovered = [r for r in routes if r not in ROUTES and r not in SKIPPED_ROUTES]
+    if uncovered:
+        raise SystemExit(f"❌ No benchmark for {', '.join(uncovered)} (add it to benchmarks/load.py)")
+
+    port = free_port()
+    process = start_app(env, port, args.workers, args.threads)
+    results = {}
+    try:
+        print(f"{'route':<28} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7} {'shed':>6}")
+        for route in routes:
+            if route in SKIPPED_ROUTES or (args.only and args.only not in route):
+                continue
+            result = run_route(f'http://127.0.0.1:{port}', route,
+                               duration=args.duration, concurrency=args.concurrency)
+            results[route] = result
+            print(f"{route:<28} {result['throughput']:>9} {result['p50_ms']!s:>9} "
+                  f"{result['p99_ms']!s:>9} {result['errors']:>7} {result['shed']:>6}")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return results
+
+
+def run_micros(standins, args):
+    # Imports happen inside benchmarks(), after the overrides are in place
+    os.environ.update(standins.env(), LOG_LEVEL='WARNING',
+                      AIRCAST_DATA_DIR=tempfile.mkdtemp(prefix='aircast-bench-'))
+    results = {}
+    print(f"\n{'function':<28} {'calls/s':>12} {'p50 µs':>10} {'p99 µs':>10}")
+    for name, func in benchmarks().items():
+        if args.only and args.only not in name:
+            continue
+        result = run_micro(func, duration=args.micro_duration)
+        results[name] = result
+        print(f"{name:<28} {result['throughput']:>12} {result['p50_us']:>10} {result['p99_us']:>10}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the AirCast backend hot paths")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds of load per route")
+    parser.add_argument('--concurrency', type=int, default=16, help="concurrent clients per route")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers")
+    parser.add_argument('--threads', type=int, default=8, help="threads per gunicorn worker")
+    parser.add_argument('--micro-duration', type=float, default=1.0)
+    parser.add_argument('--latency-ms', type=float, default=DEFAULT_LATENCY_MS,
+                        help="simulated upstream round trip")
+    parser.add_argument('--only', help="run only routes/functions containing this string")
+    parser.add_argument('--skip-load', action='store_true')
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="write these results as the new baseline")
+    args = parser.parse_args()
+
+    calibration = calibrate()
+    standins = StandinServer(latency_ms=args.latency_ms).start()
+    results = {}
+    try:
+        if not args.skip_load:
+            results['load'] = run_load(standins, args)
+        if not args.skip_micro:
+            results['micro'] = run_micros(standins, args)
+    finally:
+        standins.stop()
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        for group, entries in results.items():
+            baseline.setdefault(group, {}).update(entries)
+        baseline['meta'] = {
+            'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'machine': f"{platform.machine()} {os.cpu_count()} cpus, Python {platform.python_version()}",
+            'calibration_s': round(calibration, 5),
+            'settings': {'duration': args.duration, 'concurrency': args.concurrency,
+                         'workers': args.workers, 'threads': args.threads,
+                         'latency_ms': args.latency_ms}
+        }
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\n✅ Wrote baseline {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("\n⚠️  No baseline to compare against (run with --update-baseline)")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    speed = calibration / baseline.get('meta', {}).get('calibration_s', calibration)
+    print(f"\nMachine speed vs baseline: x{speed:.2f} (thresholds scaled)")
+    regressions = compare(results, baseline, args.tolerance, speed)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s):")
+        for message in regressions:
+            print(f"   {message}")
+        sys.exit(1)
+    print("\n✅ No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
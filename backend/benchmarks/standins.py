@@ -0,0 +1,284 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+# ========================================
+# Stand-in upstream servers
+# ========================================
+# One local HTTP server replays recorded OpenAQ / OpenWeather / OpenAI
+# responses and serves a synthetic TEMPO granule and synthetic AirNow /
+# PurpleAir feeds (plus a local station drop), so benchmarks never
+# touch the network. The app reaches it through the *_BASE_URL overrides
+# returned by StandinServer.env().
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Simulated network round trip added to every upstream response
+DEFAULT_LATENCY_MS = 20
+
+# Synthetic granule covering the mid-Atlantic at ~2 km
+GRANULE_BOUNDS = (36.0, 44.0, -82.0, -70.0)   # lat_min, lat_max, lon_min, lon_max
+GRANULE_SHAPE = (400, 600)
+
+# Synthetic station feeds over the granule area: AirNow monitors (some
+# at the OpenAQ fixture sites, as the real networks overlap), PurpleAir
+# sensors clustered on the cities, and a local drop file
+AIRNOW_SITES = 40
+PURPLEAIR_SENSORS = 600
+DROP_STATIONS = 50
+CITIES = ((39.95, -75.17), (40.71, -74.01), (38.91, -77.04), (39.29, -76.61))
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def synthetic_granule(shape=GRANULE_SHAPE, bounds=GRANULE_BOUNDS, seed=0):
+    """NetCDF bytes laid out like a TEMPO NO2 L2 granule (geolocation/product groups)"""
+    import netCDF4 as nc
+
+    rng = np.random.default_rng(seed)
+    rows, cols = shape
+    lat_min, lat_max, lon_min, lon_max = bounds
+    lat, lon = np.meshgrid(np.linspace(lat_max, lat_min, rows),
+                           np.linspace(lon_min, lon_max, cols), indexing='ij')
+    # Urban plumes over a smooth background, a few cloudy (fill) pixels
+    no2 = 2e15 + rng.gamma(2.0, 1.5e15, shape)
+    for city_lat, city_lon in ((39.95, -75.17), (40.71, -74.01), (38.91, -77.04), (39.29, -76.61)):
+        no2 += 1.2e16 * np.exp(-((lat - city_lat) ** 2 + (lon - city_lon) ** 2) / 0.05)
+    no2[rng.random(shape) < 0.05] = -1e30
+    quality = np.where(no2 < 0, 2, (rng.random(shape) < 0.1).astype(np.int16))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'granule.nc')
+        dataset = nc.Dataset(path, 'w')
+        dataset.createDimension('mirror_step', rows)
+        dataset.createDimension('xtrack', cols)
+        dims = ('mirror_step', 'xtrack')
+
+        geolocation = dataset.createGroup('geolocation')
+        geolocation.createVariable('latitude', 'f4', dims)[:] = lat
+        geolocation.createVariable('longitude', 'f4', dims)[:] = lon
+
+        product = dataset.createGroup('product')
+        column = product.createVariable('vertical_column_troposphere', 'f8', dims, fill_value=-1e30)
+        column.units = 'molecules/cm^2'
+        column[:] = no2
+        product.createVariable('main_data_quality_flag', 'i2', dims)[:] = quality
+        dataset.close()
+
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+def synthetic_sites(count, rng, bounds=GRANULE_BOUNDS, clustered=0.5):
+    """(lat, lon) arrays: a share near the cities, the rest spread over bounds"""
+    lat_min, lat_max, lon_min, lon_max = bounds
+    near = int(count * clustered)
+    city = np.array(CITIES)[rng.integers(0, len(CITIES), near)]
+    lat = np.concatenate([city[:, 0] + rng.normal(0, 0.15, near),
+                          rng.uniform(lat_min, lat_max, count - near)])
+    lon = np.concatenate([city[:, 1] + rng.normal(0, 0.15, near),
+                          rng.uniform(lon_min, lon_max, count - near)])
+    return np.round(lat, 4), np.round(lon, 4)
+
+
+def _pm25_aqi(pm25):
+    breakpoints = ((0.0, 12.0, 0, 50), (12.1, 35.4, 51, 100), (35.5, 55.4, 101, 150),
+                   (55.5, 150.4, 151, 200), (150.5, 250.4, 201, 300), (250.5, 500.4, 301, 500))
+    for low, high, aqi_low, aqi_high in breakpoints:
+        if pm25 <= high:
+            return int(round(aqi_low + (aqi_high - aqi_low) * (max(pm25, low) - low) / (high - low)))
+    return 500
+
+
+class SyntheticFeeds:
+    """Deterministic AirNow and PurpleAir responses filtered by the request's bbox"""
+
+    def __init__(self, seed=0):
+        rng = np.random.default_rng(seed)
+        openaq = [(r['coordinates']['latitude'], r['coordinates']['longitude'])
+                  for r in load_fixture('openaq_locations.json')['results']]
+        lat, lon = synthetic_sites(AIRNOW_SITES - len(openaq), rng)
+        self.airnow = [{
+            'lat': la, 'lon': lo, 'code': f"8400{n:05d}", 'name': f"Monitor {n}",
+            'pm25': round(float(rng.gamma(3.0, 3.0)), 1), 'ozone': int(rng.integers(20, 60)),
+        } for n, (la, lo) in enumerate(openaq + list(zip(lat.tolist(), lon.tolist())))]
+
+        lat, lon = synthetic_sites(PURPLEAIR_SENSORS, rng, clustered=0.8)
+        now = int(time.time())
+        self.purpleair = [[100000 + n, f"Sensor {n}", la, lo, round(float(rng.gamma(3.0, 4.0)), 1),
+                           int(rng.integers(20, 90)), now - int(rng.integers(0, 600))]
+                          for n, (la, lo) in enumerate(zip(lat.tolist(), lon.tolist()))]
+
+        lat, lon = synthetic_sites(DROP_STATIONS, rng)
+        self.drop_rows = [(f"drop-{n}", f"Campaign site {n}", la, lo, round(float(rng.gamma(3.0, 3.0)), 1))
+                          for n, (la, lo) in enumerate(zip(lat.tolist(), lon.tolist()))]
+
+    @staticmethod
+    def _inside(lat, lon, min_lon, min_lat, max_lon, max_lat):
+        return min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+
+    def airnow_data(self, query):
+        bbox = [float(v) for v in query['BBOX'][0].split(',')]
+        hour = time.strftime('%Y-%m-%dT%H:00', time.gmtime())
+        rows = []
+        for site in self.airnow:
+            if not self._inside(site['lat'], site['lon'], *bbox):
+                continue
+            common = {'Latitude': site['lat'], 'Longitude': site['lon'], 'UTC': hour,
+                      'SiteName': site['name'], 'AgencyName': 'Stand-in Agency',
+                      'FullAQSCode': site['code'], 'IntlAQSCode': site['code']}
+            rows.append(dict(common, Parameter='PM2.5', Unit='UG/M3', Value=site['pm25'],
+                             AQI=_pm25_aqi(site['pm25']), Category=1))
+            rows.append(dict(common, Parameter='OZONE', Unit='PPB', Value=site['ozone'],
+                             AQI=site['ozone'] - 10, Category=1))
+        return rows
+
+    def purpleair_sensors(self, query):
+        bbox = [float(query[k][0]) for k in ('nwlng', 'selat', 'selng', 'nwlat')]
+        return {
+            'api_version': 'standin',
+            'time_stamp': int(time.time()),
+            'fields': ['sensor_index', 'name', 'latitude', 'longitude', 'pm2.5_cf_1', 'humidity', 'last_seen'],
+            'data': [row for row in self.purpleair if self._inside(row[2], row[3], *bbox)],
+        }
+
+    def write_drop(self, directory):
+        with open(os.path.join(directory, 'campaign.csv'), 'w', encoding='utf-8') as f:
+            f.write('id,name,lat,lng,pm25\n')
+            f.writelines(f"{row[0]},{row[1]},{row[2]},{row[3]},{row[4]}\n" for row in self.drop_rows)
+
+
+class StandinServer:
+    """Threaded HTTP server answering for every upstream the app calls"""
+
+    ROUTES = [
+        (re.compile(r'^/openaq/v3/locations$'), 'openaq_locations'),
+        (re.compile(r'^/openaq/v3/locations/(\d+)/latest$'), 'openaq_latest'),
+        (re.compile(r'^/openaq/v3/parameters/\d+/latest$'), 'openaq_pm25_latest'),
+        (re.compile(r'^/openweather/weather$'), 'openweather_weather'),
+        (re.compile(r'^/openweather/forecast$'), 'openweather_forecast'),
+        (re.compile(r'^/openai/chat/completions$'), 'openai_chat_completion'),
+        (re.compile(r'^/tempo/granule\.nc$'), 'tempo_granule'),
+        (re.compile(r'^/airnow/aq/data/$'), 'airnow_data'),
+        (re.compile(r'^/purpleair/v1/sensors$'), 'purpleair_sensors'),
+    ]
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=DEFAULT_LATENCY_MS):
+        self.latency = latency_ms / 1000
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._bodies = {
+            name: json.dumps(load_fixture(f'{name}.json'), ensure_ascii=False).encode('utf-8')
+            for name in ('openaq_locations', 'openaq_pm25_latest', 'openweather_weather',
+                         'openweather_forecast', 'openai_chat_completion')
+        }
+        self._latest = {
+            location_id: json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            for location_id, payload in load_fixture('openaq_latest.json').items()
+        }
+        self._granule = synthetic_granule()
+        self._feeds = SyntheticFeeds()
+        self._drop_dir = tempfile.mkdtemp(prefix='aircast-drop-')
+        self._feeds.write_drop(self._drop_dir)
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = None
+
+    def env(self):
+        """Environment overrides pointing the app at this server"""
+        return {
+            'OPENAQ_BASE_URL': f"{self.url}/openaq/v3",
+            'OPENAQ_API_KEY': 'standin',
+            'OPENWEATHER_BASE_URL': f"{self.url}/openweather",
+            'OPENWEATHER_API_KEY': 'standin',
+            'OPENAI_BASE_URL': f"{self.url}/openai",
+            'OPENAI_API_KEY': 'standin',
+            'TEMPO_BLOB_URL': f"{self.url}/tempo/granule.nc",
+            'AIRNOW_BASE_URL': f"{self.url}/airnow",
+            'AIRNOW_API_KEY': 'standin',
+            'PURPLEAIR_BASE_URL': f"{self.url}/purpleair/v1",
+            'PURPLEAIR_API_KEY': 'standin',
+            'AIRCAST_STATION_DROP_DIR': self._drop_dir,
+            # The stand-ins have no quotas; measure the app, not the limiter
+            'AIRCAST_RATE_LIMITS': '0',
+        }
+
+    def respond(self, path, method, query=None):
+        """(status, content type, body) for a request path and its parsed query"""
+        for pattern, name in self.ROUTES:
+            match = pattern.match(path)
+            if not match:
+                continue
+            with self._lock:
+                self.requests[name] = self.requests.get(name, 0) + 1
+            if name == 'tempo_granule':
+                return 200, 'application/x-netcdf', self._granule
+            if name == 'openaq_latest':
+                body = self._latest.get(match.group(1))
+                if body is None:
+                    return 404, 'application/json', b'{"detail": "Location not found"}'
+                return 200, 'application/json', body
+            if name in ('airnow_data', 'purpleair_sensors'):
+                try:
+                    payload = getattr(self._feeds, name)(query or {})
+                except (KeyError, ValueError):
+                    return 400, 'application/json', b'{"detail": "Bad bounding box"}'
+                return 200, 'application/json', json.dumps(payload).encode('utf-8')
+            if (name == 'openai_chat_completion') != (method == 'POST'):
+                return 405, 'application/json', b'{"detail": "Method not allowed"}'
+            return 200, 'application/json', self._bodies[name]
+        return 404, 'application/json', b'{"detail": "Not found"}'
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                url = urlparse(self.path)
+                status, content_type, body = server.respond(url.path, method, parse_qs(url.query))
+                if server.latency:
+                    time.sleep(server.latency)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._reply('GET')
+
+            def do_POST(self):
+                self._reply('POST')
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        shutil.rmtree(self._drop_dir, ignore_errors=True)
@@ -0,0 +1,75 @@
+"""
+Build content-hashed, precompressed frontend assets
+
+Writes frontend/dist/ with:
+  - css/style.<hash>.css, js/map.<hash>.js (plus .gz / .br variants)
+  - index.html rewritten to reference the hashed files
+  - manifest.json mapping original paths to hashed paths
+
+Run from the repo root or backend/:  python backend/build_assets.py
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+from utils.compression import BROTLI_AVAILABLE, brotli_bytes, gzip_bytes
+
+FRONTEND_DIR = os.path.join(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))), 'frontend')
+DIST_DIR = os.path.join(FRONTEND_DIR, 'dist')
+
+# Assets referenced from index.html that get hashed filenames
+HASHED_ASSETS = ['css/style.css', 'js/map.js']
+
+
+def write_variants(path, data):
+    """Write data plus its gzip (and brotli, if available) variants"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip_bytes(data, level=9))
+    if BROTLI_AVAILABLE:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli_bytes(data))
+
+
+def hashed_name(path, data):
+    root, ext = os.path.splitext(path)
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    return f"{root}.{digest}{ext}"
+
+
+def build():
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+
+    manifest = {}
+    for asset in HASHED_ASSETS:
+        with open(os.path.join(FRONTEND_DIR, asset), 'rb') as f:
+            data = f.read()
+        target = hashed_name(asset, data)
+        write_variants(os.path.join(DIST_DIR, target), data)
+        manifest[asset] = target
+        print(f"{asset} -> {target} ({len(data)} bytes)")
+
+    with open(os.path.join(FRONTEND_DIR, 'index.html'), encoding='utf-8') as f:
+        html = f.read()
+    for asset, target in manifest.items():
+        html = html.replace(f'"{asset}"', f'"{target}"')
+    write_variants(os.path.join(DIST_DIR, 'index.html'), html.encode('utf-8'))
+
+    with open(os.path.join(DIST_DIR, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    if not BROTLI_AVAILABLE:
+        print("warning: brotli not installed, only gzip variants were written", file=sys.stderr)
+    print(f"Assets built in {DIST_DIR}")
+    return manifest
+
+
+if __name__ == '__main__':
+    build()
@@ -0,0 +1,48 @@
+import os
+import time
+
+# ========================================
+# Gunicorn settings (startup.sh runs from backend/)
+# ========================================
+# AIRCAST_PRELOAD=0 imports the app in each worker instead of once in
+# the master (slower worker starts, no shared memory, but reloadable
+# code with HUP).
+
+_started = time.monotonic()
+
+bind = '0.0.0.0:8000'
+timeout = 600
+
+# Threaded workers. Every open /api/stream holds one thread for as long
+# as the client stays connected, so each worker gets max_streams threads
+# on top of the ones serving requests; streams past the limit get a 503.
+# WEB_CONCURRENCY adds workers (and with them stream slots).
+worker_class = 'gthread'
+request_threads = 8
+max_streams = int(os.getenv('AIRCAST_MAX_STREAMS', '8'))
+threads = request_threads + max_streams
+
+preload_app = os.getenv('AIRCAST_PRELOAD', '1') != '0'
+
+
+def when_ready(server):
+    if preload_app:
+        from utils.startup import preload_shared_state
+        preload_shared_state()
+    server.log.info("Master ready in %.2fs (preload_app=%s)", time.monotonic() - _started, preload_app)
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+
+
+def post_worker_init(worker):
+    # Load is measured against the threads not held by streams
+    from utils.admission import admission
+    admission.configure(worker.cfg.threads, max_streams)
+
+    # Without preload the master never warmed the cache, so warm it now
+    from models.warmup import warmer
+    warmer.ensure_started(warm_first=not worker.cfg.preload_app)
+    worker.log.info("Worker %s ready in %.0f ms after fork", worker.pid,
+                    (time.monotonic() - worker.forked_at) * 1000)
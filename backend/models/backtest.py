@@ -0,0 +1,309 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from models.forecast import (
+    FORECAST_MULTIPLIERS, FORECAST_RULES, HEAT_F, HUMID_PERCENT, NIGHT_END_HOUR,
+    NIGHT_START_HOUR, RUSH_HOURS, WARM_F, WEATHER_CELL_PRECISION, WIND_LIGHT_MPH,
+    WIND_MODERATE_MPH, WIND_STRONG_MPH
+)
+from utils.geo import cell_id
+
+# ========================================
+# Forecast backtesting
+# ========================================
+# A dataset is a set of aligned hourly series, one row per location:
+#   aqi, wind_speed, temperature, precipitation, humidity  (locations, hours)
+#   hour                                                    (hours,) local hour of day
+# NaN marks a missing hour. Every hour of every row is used as a forecast
+# origin and scored against the observed AQI 1..horizons hours later,
+# replaying the observed weather as the "forecast" weather.
+
+WEATHER_FIELDS = ('wind_speed', 'temperature', 'precipitation', 'humidity')
+DEFAULT_HORIZONS = 6
+
+# Locations per worker task
+CHUNK_LOCATIONS = 64
+
+# Pulls fitted log-multipliers toward the current table when data is thin
+FIT_RIDGE = 25.0
+
+AQI_BREAKPOINTS = np.array([50, 100, 150, 200, 300])
+
+
+def rule_indicators(dataset):
+    """(rules, locations, hours) 0/1 array mirroring forecast.active_rules"""
+    wind = dataset['wind_speed']
+    temp = dataset['temperature']
+    precip = dataset['precipitation']
+    humidity = dataset['humidity']
+    hour = np.broadcast_to(dataset['hour'], wind.shape)
+
+    rush = np.zeros(hour.shape, dtype=bool)
+    for start, end in RUSH_HOURS:
+        rush |= (hour >= start) & (hour <= end)
+
+    rules = {
+        'wind_strong': wind > WIND_STRONG_MPH,
+        'wind_moderate': (wind > WIND_MODERATE_MPH) & (wind <= WIND_STRONG_MPH),
+        'wind_light': (wind > WIND_LIGHT_MPH) & (wind <= WIND_MODERATE_MPH),
+        'heat': temp > HEAT_F,
+        'warm': (temp > WARM_F) & (temp <= HEAT_F),
+        'rain': precip > 0,
+        'humid': humidity > HUMID_PERCENT,
+        'rush_hour': rush,
+        'night': ~rush & ((hour >= NIGHT_START_HOUR) | (hour <= NIGHT_END_HOUR)),
+    }
+    return np.stack([rules[name] for name in FORECAST_RULES]).astype(np.float32)
+
+
+def _window_sum(cumulative, h):
+    """Sum over t+1..t+h for every origin t, given a cumulative sum along the last axis"""
+    return cumulative[..., h:] - cumulative[..., :-h]
+
+
+def evaluate_chunk(dataset, multipliers, horizons=DEFAULT_HORIZONS, fit=False):
+    """
+    Error sums per horizon for one block of locations
+
+    Returns a dict of arrays indexed by horizon - 1; when fit is set also
+    the log-space normal equations (xtx, xty) for refitting multipliers.
+    """
+    aqi = dataset['aqi'].astype(float)
+    indicators = rule_indicators(dataset)
+    log_m = np.log([multipliers[name] for name in FORECAST_RULES])
+    log_decay = np.log(multipliers['decay'])
+
+    weather_ok = np.all([np.isfinite(dataset[f]) for f in WEATHER_FIELDS], axis=0)
+    cum_step = np.cumsum(np.tensordot(log_m, indicators, axes=1), axis=-1)
+    cum_bad = np.cumsum(~weather_ok, axis=-1)
+    if fit:
+        cum_rules = np.cumsum(indicators, axis=-1)
+
+    n_features = len(FORECAST_RULES) + 1
+    sums = {key: np.zeros(horizons) for key in
+            ('n', 'abs_err', 'sq_err', 'err', 'level_hits', 'persistence_abs_err')}
+    xtx = np.zeros((n_features, n_features))
+    xty = np.zeros(n_features)
+
+    for h in range(1, horizons + 1):
+        if aqi.shape[-1] <= h:
+            break
+        origin = aqi[..., :-h]
+        observed = aqi[..., h:]
+        valid = (np.isfinite(origin) & np.isfinite(observed) &
+                 (_window_sum(cum_bad, h) == 0))
+
+        log_factor = _window_sum(cum_step, h) + (h - 1) * log_decay
+        predicted = np.floor(np.maximum(origin * np.exp(log_factor), 0))
+
+        p, o, base = predicted[valid], observed[valid], origin[valid]
+        err = p - o
+        sums['n'][h - 1] = err.size
+        sums['abs_err'][h - 1] = np.abs(err).sum()
+        sums['sq_err'][h - 1] = (err * err).sum()
+        sums['err'][h - 1] = err.sum()
+        sums['level_hits'][h - 1] = (np.digitize(p, AQI_BREAKPOINTS, right=True) ==
+                                     np.digitize(o, AQI_BREAKPOINTS, right=True)).sum()
+        sums['persistence_abs_err'][h - 1] = np.abs(base - o).sum()
+
+        if fit:
+            positive = valid & (origin > 0) & (observed > 0)
+            counts = _window_sum(cum_rules, h)[:, positive]
+            x = np.vstack([counts, np.full(counts.shape[1], h - 1.0)])
+            y = np.log(observed[positive]) - np.log(origin[positive])
+            xtx += x @ x.T
+            xty += x @ y
+
+    if fit:
+        sums['xtx'] = xtx
+        sums['xty'] = xty
+    return sums
+
+
+def _evaluate_task(args):
+    return evaluate_chunk(*args)
+
+
+def summarize(sums):
+    """Per-horizon MAE, RMSE, bias, AQI-level accuracy and skill vs persistence"""
+    metrics = []
+    for i, n in enumerate(sums['n']):
+        if not n:
+            continue
+        mae = sums['abs_err'][i] / n
+        persistence = sums['persistence_abs_err'][i] / n
+        metrics.append({
+            'horizon': i + 1,
+            'points': int(n),
+            'mae': round(mae, 2),
+            'rmse': round(float(np.sqrt(sums['sq_err'][i] / n)), 2),
+            'bias': round(sums['err'][i] / n, 2),
+            'level_accuracy': round(sums['level_hits'][i] / n, 3),
+            'persistence_mae': round(persistence, 2),
+            'skill': round(1 - mae / persistence, 3) if persistence else None
+        })
+    return metrics
+
+
+def fit_multipliers(xtx, xty, multipliers, ridge=FIT_RIDGE):
+    """
+    Least-squares multipliers in log space
+
+    log(observed / origin) is linear in the log-multipliers (rule hit
+    counts over the window, plus h - 1 decay steps), so the fit is one
+    ridge-regularized solve of the accumulated normal equations.
+    """
+    names = FORECAST_RULES + ('decay',)
+    prior = np.log([multipliers[name] for name in names])
+    beta = np.linalg.solve(xtx + ridge * np.eye(len(names)), xty + ridge * prior)
+    return {name: round(float(np.exp(b)), 4) for name, b in zip(names, beta)}
+
+
+def run_backtest(dataset, multipliers=None, horizons=DEFAULT_HORIZONS, workers=None, fit=False):
+    """
+    Score (and optionally refit) the forecast rules on a dataset
+
+    Locations are split into blocks evaluated in a process pool; pass
+    workers=1 to run in-process.
+    """
+    multipliers = dict(multipliers or FORECAST_MULTIPLIERS)
+    locations = dataset['aqi'].shape[0]
+    tasks = []
+    for i in range(0, locations, CHUNK_LOCATIONS):
+        block = {field: dataset[field][i:i + CHUNK_LOCATIONS] for field in ('aqi',) + WEATHER_FIELDS}
+        block['hour'] = dataset['hour']
+        tasks.append((block, multipliers, horizons, fit))
+
+    started = time.perf_counter()
+    if workers == 1 or len(tasks) <= 1:
+        results = [_evaluate_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_evaluate_task, tasks))
+
+    totals = {}
+    for result in results:
+        for key, value in result.items():
+            totals[key] = totals[key] + value if key in totals else value.copy()
+    elapsed = time.perf_counter() - started
+
+    report = {
+        'locations': locations,
+        'hours': int(dataset['aqi'].shape[1]),
+        'points': int(totals['n'].sum()) if totals else 0,
+        'seconds': round(elapsed, 3),
+        'multipliers': multipliers,
+        'horizons': summarize(totals) if totals else []
+    }
+    if fit and totals:
+        report['fitted_multipliers'] = fit_multipliers(totals['xtx'], totals['xty'], multipliers)
+    return report
+
+
+# ========================================
+# Datasets
+# ========================================
+def load_history_dataset(store, start, end):
+    """
+    Aligned dataset from the history store
+
+    Station hourly AQI is paired with the weather recorded for the
+    station's weather cell; hours with either missing stay NaN.
+    """
+    start, end = start - start % 3600, end - end % 3600
+    hours = (end - start) // 3600 + 1
+    positions = store.station_positions()
+    stations = sorted(positions)
+    row_of = {station: i for i, station in enumerate(stations)}
+
+    dataset = {'aqi': np.full((len(stations), hours), np.nan)}
+    for field in WEATHER_FIELDS:
+        dataset[field] = np.full((len(stations), hours), np.nan)
+
+    for station, bucket, aqi in store.hourly_series(start, end):
+        if station in row_of:
+            dataset['aqi'][row_of[station], (bucket - start) // 3600] = aqi
+
+    rows_by_cell = {}
+    for station in stations:
+        cell = cell_id(*positions[station], WEATHER_CELL_PRECISION)
+        rows_by_cell.setdefault(cell, []).append(row_of[station])
+    for cell, ts, *values in store.weather_series(start, end):
+        rows = rows_by_cell.get(cell)
+        if rows:
+            for field, value in zip(WEATHER_FIELDS, values):
+                dataset[field][rows, (ts - start) // 3600] = np.nan if value is None else value
+
+    utc_offset = time.localtime().tm_gmtoff
+    dataset['hour'] = ((start + utc_offset + np.arange(hours) * 3600) // 3600) % 24
+    dataset['stations'] = np.array(stations)
+    return dataset
+
+
+def synthetic_dataset(locations, hours, seed=0):
+    """Random but plausible series for timing the harness"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(hours)
+    daily = np.sin((t % 24) / 24 * 2 * np.pi)
+    return {
+        'aqi': np.clip(55 + 20 * daily + rng.normal(0, 12, (locations, hours)).cumsum(axis=1) * 0.1
+                       + rng.normal(0, 5, (locations, hours)), 0, 500).round(),
+        'wind_speed': np.abs(rng.normal(8, 5, (locations, hours))),
+        'temperature': 70 + 12 * daily + rng.normal(0, 4, (locations, hours)),
+        'precipitation': np.where(rng.random((locations, hours)) < 0.08, rng.random((locations, hours)), 0),
+        'humidity': np.clip(rng.normal(60, 15, (locations, hours)), 0, 100),
+        'hour': t % 24
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the AQI forecast rules")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--days', type=int, default=30, help="history window to replay")
+    source.add_argument('--npz', help="dataset saved with numpy.savez")
+    source.add_argument('--synthetic', metavar='LOCATIONSxHOURS', help="e.g. 2000x720")
+    parser.add_argument('--horizons', type=int, default=DEFAULT_HORIZONS)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--fit', action='store_true', help="refit the multipliers")
+    parser.add_argument('--write', help="save fitted multipliers as JSON (AIRCAST_FORECAST_MULTIPLIERS)")
+    args = parser.parse_args()
+
+    if args.npz:
+        with np.load(args.npz) as data:
+            dataset = {key: data[key] for key in data.files}
+    elif args.synthetic:
+        locations, hours = (int(v) for v in args.synthetic.lower().split('x'))
+        dataset = synthetic_dataset(locations, hours)
+    else:
+        from models.history import history_store
+        end = int(time.time())
+        dataset = load_history_dataset(history_store, end - args.days * 86400, end)
+
+    report = run_backtest(dataset, horizons=args.horizons, workers=args.workers, fit=args.fit)
+    print(f"{report['points']:,} forecast points from {report['locations']} locations "
+          f"in {report['seconds']}s")
+    print(f"{'h':>3} {'points':>10} {'mae':>7} {'rmse':>7} {'bias':>7} {'level':>6} {'skill':>6}")
+    for m in report['horizons']:
+        print(f"{m['horizon']:>3} {m['points']:>10,} {m['mae']:>7} {m['rmse']:>7} "
+              f"{m['bias']:>7} {m['level_accuracy']:>6} {m['skill']!s:>6}")
+
+    if 'fitted_multipliers' in report:
+        fitted = run_backtest(dataset, report['fitted_multipliers'], args.horizons, args.workers)
+        print("\nFitted multipliers:")
+        for name, value in report['fitted_multipliers'].items():
+            print(f"   {name:<14} {report['multipliers'][name]:.3f} -> {value:.3f}")
+        print("   MAE by horizon: " + ', '.join(
+            f"{old['mae']}->{new['mae']}" for old, new in zip(report['horizons'], fitted['horizons'])))
+        if args.write:
+            with open(args.write, 'w') as f:
+                json.dump(report['fitted_multipliers'], f, indent=2)
+            print(f"Wrote {args.write}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from models.user_groups import safety_reports
+from utils.geo import cell_id, snap_to_cell
+from utils.log import get_logger
+
+log = get_logger('batch')
+
+# ========================================
+# Multi-location requests
+# ========================================
+# Points are grouped by geo-cell so each cell's stations, weather and
+# forecast are fetched once however many points share it. Cells load in
+# parallel and their points are emitted as soon as the cell is ready.
+
+MAX_BATCH_POINTS = 500
+
+# Cells loaded concurrently per batch request
+BATCH_FETCH_WORKERS = 8
+
+
+def parse_points(items):
+    """
+    [(lat, lon, id)] from [[lat, lon], ...] or [{"lat", "lon"|"lng", "id"?}, ...]
+
+    Raises KeyError, IndexError, TypeError or ValueError on bad input.
+    """
+    points = []
+    for item in items:
+        if isinstance(item, dict):
+            points.append((float(item['lat']), float(item.get('lon', item.get('lng'))), item.get('id')))
+        else:
+            points.append((float(item[0]), float(item[1]), None))
+    return points
+
+
+def group_by_cell(points):
+    """cell -> indexes of the points in it, in first-seen order"""
+    cells = {}
+    for index, (lat, lon, _) in enumerate(points):
+        cells.setdefault(snap_to_cell(lat, lon), []).append(index)
+    return cells
+
+
+def completed_cells(cells, load, workers=BATCH_FETCH_WORKERS):
+    """
+    Run load(lat, lon) for every cell in parallel, yielding lists of
+    (cell, result, error) as they finish; cells that finish together
+    share a list
+
+    Each load runs in its own copy of the caller's context, so upstream
+    calls keep the request id, sampling decision and timing spans.
+    """
+    pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(cells))),
+                              thread_name_prefix='batch')
+    futures = {pool.submit(contextvars.copy_context().run, load, *cell): cell for cell in cells}
+    try:
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            finished = []
+            for future in done:
+                error = future.exception()
+                finished.append((futures[future], None if error else future.result(), error))
+            yield finished
+    finally:
+        # The client may disconnect mid-stream; don't fetch for nobody
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _stream(points, load, evaluate):
+    """
+    Records for every point, one cell batch at a time, then a summary
+
+    evaluate(results) maps the successful load results of a batch of
+    cells to one payload per cell.
+    """
+    cells = group_by_cell(points)
+    failed = 0
+
+    for finished in completed_cells(cells, load):
+        ok = [(cell, result) for cell, result, error in finished if error is None]
+        payloads = dict(zip([cell for cell, _ in ok], evaluate([result for _, result in ok]))) if ok else {}
+
+        for cell, _, error in finished:
+            if error is not None:
+                log.warning("Batch cell %s failed: %s", cell_id(*cell), error)
+            for index in cells[cell]:
+                lat, lon, point_id = points[index]
+                record = {'index': index, 'lat': lat, 'lon': lon, 'cell': cell_id(*cell)}
+                if point_id is not None:
+                    record['id'] = point_id
+                if error is None:
+                    record.update(payloads[cell], status='success')
+                else:
+                    failed += 1
+                    record.update(status='error', message=str(error))
+                yield record
+
+    yield {'status': 'complete', 'points': len(points), 'cells': len(cells), 'failed': failed}
+
+
+def _current_and_forecast(context):
+    def load(lat, lon):
+        return context.current_aqi(lat, lon), context.forecast(lat, lon)
+    return load
+
+
+def forecast_batch(context, points):
+    """The /api/forecast payload for every point, streamed by cell"""
+    def evaluate(results):
+        return [{
+            'current_aqi': current_aqi,
+            'forecast': forecast_result['predictions'],
+            'weather_impacts': forecast_result['weather_impacts']
+        } for current_aqi, forecast_result in results]
+    return _stream(points, _current_and_forecast(context), evaluate)
+
+
+def safety_batch(context, points):
+    """The /api/safety-groups payload for every point, streamed by cell"""
+    def evaluate(results):
+        return safety_reports([current_aqi for current_aqi, _ in results],
+                              [forecast_result.get('predictions', []) for _, forecast_result in results])
+    return _stream(points, _current_and_forecast(context), evaluate)
@@ -0,0 +1,189 @@
+import math
+import threading
+
+import numpy as np
+
+from api.tempo import (DEFAULT_AREA_RADIUS_KM, MAX_QUALITY_FLAG, convert_no2_to_aqi_array,
+                       get_data_freshness, get_tempo_metadata, granule_key, read_tempo_netcdf)
+from models.stations import station_key
+from utils.log import get_logger
+from utils.raster import KM_PER_DEGREE_LAT
+
+log = get_logger('collocation')
+
+# ========================================
+# Ground station / TEMPO collocation
+# ========================================
+# Every station is matched to its nearest TEMPO pixel and the
+# quality-filtered pixel mean around it, once per granule. The mapping
+# only grows as new stations are seen, so serving pairs for all
+# stations is array indexing plus the current ground readings.
+
+# Stations farther than this from any pixel are outside the granule
+MAX_PIXEL_DISTANCE_KM = 10.0
+
+# Neighbourhood averaged around each station
+COLLOCATION_RADIUS_KM = DEFAULT_AREA_RADIUS_KM
+
+# Fewer pairs than this give no correlation
+MIN_CORRELATION_PAIRS = 3
+
+_COLUMNS = ('pixel', 'distance_km', 'pixel_lat', 'pixel_lon', 'pixel_no2',
+            'area_no2', 'area_std', 'area_count')
+_INT_COLUMNS = ('pixel', 'area_count')
+
+
+def _empty_columns():
+    return {name: np.empty(0, dtype=np.int64 if name in _INT_COLUMNS else float)
+            for name in _COLUMNS}
+
+
+def bias_stats(ground, satellite):
+    """
+    Agreement of satellite against ground AQI over the pairs where both
+    are known: bias is satellite - ground
+    """
+    ground = np.asarray(ground, dtype=float)
+    satellite = np.asarray(satellite, dtype=float)
+    both = np.isfinite(ground) & np.isfinite(satellite)
+    n = int(both.sum())
+    if n == 0:
+        return {'pairs': 0, 'mean_bias': None, 'mean_abs_error': None, 'rmse': None,
+                'correlation': None}
+
+    ground, satellite = ground[both], satellite[both]
+    diff = satellite - ground
+    correlation = None
+    if n >= MIN_CORRELATION_PAIRS and ground.std() > 0 and satellite.std() > 0:
+        correlation = round(float(np.corrcoef(ground, satellite)[0, 1]), 3)
+    return {
+        'pairs': n,
+        'mean_bias': round(float(diff.mean()), 2),
+        'mean_abs_error': round(float(np.abs(diff).mean()), 2),
+        'rmse': round(float(np.sqrt((diff ** 2).mean())), 2),
+        'correlation': correlation,
+    }
+
+
+def _finite_or_none(value, digits=None):
+    if not math.isfinite(value):
+        return None
+    return round(value, digits) if digits is not None else value
+
+
+class StationCollocation:
+    """
+    Station -> TEMPO pixel and neighbourhood mapping for one granule
+
+    Rows are keyed by station key and position; a new granule (by
+    granule_key, so stale copies of one granule share a mapping) starts
+    a fresh mapping.
+    """
+
+    def __init__(self, radius_km=COLLOCATION_RADIUS_KM):
+        self.radius_km = radius_km
+        self._granule = None
+        self._rows = {}
+        self._columns = _empty_columns()
+        self._lock = threading.Lock()
+
+    def _collocate(self, tempo_data, lats, lons):
+        """Mapping columns for new stations, all vectorized"""
+        pixel, distance = tempo_data['pixel_locator'].nearest(lats, lons)
+        distance_km = distance * KM_PER_DEGREE_LAT
+        pixel = np.where(distance_km <= MAX_PIXEL_DISTANCE_KM, pixel, -1)
+        found = pixel >= 0
+        safe = np.where(found, pixel, 0)
+
+        no2 = np.ma.filled(np.ma.asarray(tempo_data['no2_column'], dtype=float), np.nan).ravel()
+        valid = np.asarray(tempo_data['quality_valid'], dtype=bool).ravel()
+        pixel_lat = np.ma.filled(np.ma.asarray(tempo_data['latitude'], dtype=float), np.nan).ravel()
+        pixel_lon = np.ma.filled(np.ma.asarray(tempo_data['longitude'], dtype=float), np.nan).ravel()
+
+        area = tempo_data['area_grid'].radii_stats(lats, lons, self.radius_km)
+        return {
+            'pixel': pixel,
+            'distance_km': np.where(found, distance_km, np.nan),
+            'pixel_lat': np.where(found, pixel_lat[safe], np.nan),
+            'pixel_lon': np.where(found, pixel_lon[safe], np.nan),
+            'pixel_no2': np.where(found & valid[safe], no2[safe], np.nan),
+            'area_no2': np.where(found, area['mean'], np.nan),
+            'area_std': np.where(found, area['std'], np.nan),
+            'area_count': np.where(found, area['count'], 0).astype(np.int64),
+        }
+
+    def rows_for(self, tempo_data, stations):
+        """Mapping row of each station, collocating any not seen yet"""
+        keys = [(station_key(s), s['lat'], s['lng']) for s in stations]
+        with self._lock:
+            if granule_key(tempo_data) != self._granule:
+                self._granule = granule_key(tempo_data)
+                self._rows = {}
+                self._columns = _empty_columns()
+
+            new = list(dict.fromkeys(k for k in keys if k not in self._rows))
+            if new:
+                lats = np.array([k[1] for k in new], dtype=float)
+                lons = np.array([k[2] for k in new], dtype=float)
+                added = self._collocate(tempo_data, lats, lons)
+                start = len(self._rows)
+                for offset, key in enumerate(new):
+                    self._rows[key] = start + offset
+                for name in _COLUMNS:
+                    self._columns[name] = np.concatenate((self._columns[name], added[name]))
+                log.info("Collocated stations", extra={'new': len(new), 'total': len(self._rows)})
+
+            rows = np.array([self._rows[k] for k in keys], dtype=np.int64)
+            return rows, {name: column[rows] for name, column in self._columns.items()}
+
+    def pairs(self, stations):
+        """Ground vs TEMPO pairs for stations plus bias statistics, or None without a granule"""
+        tempo_data = read_tempo_netcdf()
+        if not tempo_data or tempo_data.get('pixel_locator') is None:
+            return None
+
+        _, mapped = self.rows_for(tempo_data, stations)
+        ground = np.array([np.nan if s.get('aqi') is None else s['aqi'] for s in stations], dtype=float)
+        pixel_aqi = convert_no2_to_aqi_array(mapped['pixel_no2'])
+        area_aqi = convert_no2_to_aqi_array(mapped['area_no2'])
+
+        pairs = []
+        for i, station in enumerate(stations):
+            if mapped['pixel'][i] < 0:
+                continue
+            pairs.append({
+                'id': station.get('id'),
+                'name': station.get('name'),
+                'lat': station['lat'],
+                'lng': station['lng'],
+                'ground_aqi': station.get('aqi'),
+                'pixel_lat': round(float(mapped['pixel_lat'][i]), 4),
+                'pixel_lon': round(float(mapped['pixel_lon'][i]), 4),
+                'pixel_distance_km': round(float(mapped['distance_km'][i]), 2),
+                'tempo_no2': _finite_or_none(float(mapped['pixel_no2'][i])),
+                'tempo_aqi': _finite_or_none(float(pixel_aqi[i])),
+                'area_no2': _finite_or_none(float(mapped['area_no2'][i])),
+                'area_no2_std': _finite_or_none(float(mapped['area_std'][i])),
+                'area_count': int(mapped['area_count'][i]),
+                'area_aqi': _finite_or_none(float(area_aqi[i])),
+                'bias': _finite_or_none(float(pixel_aqi[i] - ground[i]), 1),
+            })
+
+        collocated = mapped['pixel'] >= 0
+        return {
+            'pairs': pairs,
+            'stations': len(stations),
+            'collocated': int(collocated.sum()),
+            'stats': {
+                'pixel': bias_stats(ground[collocated], pixel_aqi[collocated]),
+                'area': bias_stats(ground[collocated], area_aqi[collocated]),
+            },
+            'radius_km': self.radius_km,
+            'source': 'NASA TEMPO',
+            'stale': tempo_data.get('stale', False),
+            'freshness': get_data_freshness(),
+            'metadata': dict(get_tempo_metadata(), max_quality_flag=MAX_QUALITY_FLAG)
+        }
+
+
+collocation = StationCollocation()
@@ -0,0 +1,190 @@
+import csv
+import io
+from datetime import timezone
+
+import numpy as np
+
+from api.tempo import TEMPO_BLOB_URL, TEMPO_OBSERVATION_TIME, read_tempo_netcdf
+from models.history import history_store
+from utils.log import get_logger
+from utils.serialization import NDJSON_MIMETYPE, format_ndjson
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+log = get_logger('export')
+
+# ========================================
+# Bulk export
+# ========================================
+# Datasets are read in chunks of EXPORT_CHUNK_ROWS rows (an SQLite
+# fetchmany, or a slice of the TEMPO swath) and encoded chunk by chunk,
+# so an export of any size holds at most one chunk (one row group for
+# Parquet) in memory.
+
+EXPORT_CHUNK_ROWS = 5000
+PARQUET_ROW_GROUP_ROWS = 50000
+
+# Widest time range per export (seconds)
+MAX_EXPORT_RANGE = 31 * 86400
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': (NDJSON_MIMETYPE, 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# dataset -> [(column, Parquet type)]
+EXPORT_COLUMNS = {
+    'readings': [('station', 'string'), ('ts', 'int64'), ('lat', 'float64'), ('lng', 'float64'),
+                 ('aqi', 'int64'), ('pm25', 'float64'), ('no2', 'float64'), ('o3', 'float64')],
+    'forecasts': [('cell', 'string'), ('lat', 'float64'), ('lon', 'float64'), ('target', 'int64'),
+                  ('issued', 'int64'), ('horizon', 'int64'), ('aqi', 'int64')],
+    'tempo': [('granule', 'string'), ('observed_at', 'int64'), ('lat', 'float64'),
+              ('lon', 'float64'), ('no2_column', 'float64'), ('qa_pass', 'bool')],
+}
+
+
+def reading_chunks(bbox, start, end):
+    """Raw station readings in bbox with ts in [start, end], oldest first"""
+    return history_store.iter_readings_in_bbox(bbox, start, end, EXPORT_CHUNK_ROWS)
+
+
+def forecast_chunks(bbox, start, end):
+    """Issued forecasts for cells in bbox with targets in [start, end]"""
+    return history_store.iter_forecasts_in_bbox(bbox, start, end, EXPORT_CHUNK_ROWS)
+
+
+def tempo_chunks(bbox, start, end):
+    """
+    Pixels of the current granule inside bbox, if it was observed in
+    [start, end]; fill pixels are skipped, flagged ones have qa_pass false
+    """
+    observed_at = int(TEMPO_OBSERVATION_TIME.replace(tzinfo=timezone.utc).timestamp())
+    if not start <= observed_at <= end:
+        return
+    tempo_data = read_tempo_netcdf()
+    if not tempo_data:
+        return
+
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lat = np.ma.filled(np.ma.asarray(tempo_data['latitude'], dtype=float), np.nan).ravel()
+    lon = np.ma.filled(np.ma.asarray(tempo_data['longitude'], dtype=float), np.nan).ravel()
+    no2 = np.ma.filled(np.ma.asarray(tempo_data['no2_column'], dtype=float), np.nan).ravel()
+    qa_pass = np.asarray(tempo_data['quality_valid'], dtype=bool).ravel()
+    selected = np.flatnonzero((lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) &
+                              (lon <= max_lon) & np.isfinite(no2))
+
+    granule = tempo_data.get('granule_id', TEMPO_BLOB_URL).rsplit('/', 1)[-1]
+    for offset in range(0, len(selected), EXPORT_CHUNK_ROWS):
+        index = selected[offset:offset + EXPORT_CHUNK_ROWS]
+        yield [(granule, observed_at, la, lo, value, ok) for la, lo, value, ok in zip(
+            lat[index].tolist(), lon[index].tolist(), no2[index].tolist(), qa_pass[index].tolist())]
+
+
+EXPORT_DATASETS = {
+    'readings': reading_chunks,
+    'forecasts': forecast_chunks,
+    'tempo': tempo_chunks,
+}
+
+
+# ========================================
+# Encoders: row chunks in, bytes out
+# ========================================
+def encode_csv(columns, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow([name for name, _ in columns])
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for an empty export
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def encode_ndjson(columns, chunks):
+    names = [name for name, _ in columns]
+    for rows in chunks:
+        yield b''.join(format_ndjson(dict(zip(names, row))) for row in rows)
+
+
+class _DrainableSink:
+    """Write-only file for ParquetWriter whose contents are taken as they come"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def encode_parquet(columns, chunks, row_group_rows=PARQUET_ROW_GROUP_ROWS):
+    schema = pa.schema([(name, getattr(pa, kind)()) for name, kind in columns])
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+
+    pending, pending_rows = [], 0
+
+    def row_group():
+        values = zip(*(row for rows in pending for row in rows))
+        table = pa.Table.from_arrays([pa.array(column, type=field.type)
+                                      for column, field in zip(values, schema)], schema=schema)
+        writer.write_table(table, row_group_size=row_group_rows)
+
+    for rows in chunks:
+        pending.append(rows)
+        pending_rows += len(rows)
+        if pending_rows >= row_group_rows:
+            row_group()
+            pending, pending_rows = [], 0
+            yield sink.drain()
+    if pending:
+        row_group()
+    writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {'csv': encode_csv, 'ndjson': encode_ndjson, 'parquet': encode_parquet}
+
+
+def export_stream(dataset, fmt, bbox, start, end):
+    """Bytes of the export, produced a chunk at a time"""
+    columns = EXPORT_COLUMNS[dataset]
+    rows = [0]
+
+    def counted(chunks):
+        for chunk in chunks:
+            rows[0] += len(chunk)
+            yield chunk
+
+    try:
+        yield from ENCODERS[fmt](columns, counted(EXPORT_DATASETS[dataset](bbox, start, end)))
+    finally:
+        log.info("Export finished", extra={'dataset': dataset, 'format': fmt, 'rows': rows[0]})
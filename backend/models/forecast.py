@@ -1,5 +1,94 @@
+import json
+import os
 from datetime import datetime, timedelta
 
+from models.records import ForecastPoint
+from utils.log import get_logger
+
+log = get_logger('forecast')
+
+# ========================================
+# Forecast rules
+# ========================================
+# Each rule scales the running AQI by its multiplier when active for an
+# hour; 'decay' is applied when one hour's prediction seeds the next.
+# models/backtest.py scores and refits this table against history.
+WIND_STRONG_MPH = 15
+WIND_MODERATE_MPH = 10
+WIND_LIGHT_MPH = 5
+HEAT_F = 85
+WARM_F = 75
+HUMID_PERCENT = 80
+RUSH_HOURS = ((7, 9), (16, 19))
+NIGHT_START_HOUR = 22
+NIGHT_END_HOUR = 5
+
+FORECAST_RULES = ('wind_strong', 'wind_moderate', 'wind_light', 'heat', 'warm',
+                  'rain', 'humid', 'rush_hour', 'night')
+
+DEFAULT_MULTIPLIERS = {
+    'wind_strong': 0.75,    # strong winds disperse pollution
+    'wind_moderate': 0.85,
+    'wind_light': 0.92,
+    'heat': 1.20,           # heat creates ground-level ozone
+    'warm': 1.10,
+    'rain': 0.65,           # rain washes out particulates
+    'humid': 1.05,
+    'rush_hour': 1.15,      # traffic
+    'night': 0.95,
+    'decay': 0.90,
+}
+
+
+def load_multipliers(path=None):
+    """Default multipliers, overridden by a fitted JSON table if configured"""
+    multipliers = dict(DEFAULT_MULTIPLIERS)
+    path = path or os.getenv('AIRCAST_FORECAST_MULTIPLIERS')
+    if path:
+        try:
+            with open(path) as f:
+                fitted = json.load(f)
+            multipliers.update({k: float(v) for k, v in fitted.items() if k in multipliers})
+            log.info("Loaded forecast multipliers from %s", path)
+        except (OSError, ValueError) as e:
+            log.warning("Could not load forecast multipliers from %s: %s", path, e)
+    return multipliers
+
+
+FORECAST_MULTIPLIERS = load_multipliers()
+
+
+def active_rules(weather, hour):
+    """Names of the forecast rules that apply to one forecast hour"""
+    rules = []
+
+    wind_speed = weather.get('wind_speed', 0)
+    if wind_speed > WIND_STRONG_MPH:
+        rules.append('wind_strong')
+    elif wind_speed > WIND_MODERATE_MPH:
+        rules.append('wind_moderate')
+    elif wind_speed > WIND_LIGHT_MPH:
+        rules.append('wind_light')
+
+    temp = weather.get('temperature', 70)
+    if temp > HEAT_F:
+        rules.append('heat')
+    elif temp > WARM_F:
+        rules.append('warm')
+
+    if weather.get('precipitation', 0) > 0:
+        rules.append('rain')
+
+    if weather.get('humidity', 50) > HUMID_PERCENT:
+        rules.append('humid')
+
+    if any(start <= hour <= end for start, end in RUSH_HOURS):
+        rules.append('rush_hour')
+    elif hour >= NIGHT_START_HOUR or hour <= NIGHT_END_HOUR:
+        rules.append('night')
+
+    return rules
+
 
 def get_forecast_reasoning(predicted_aqi, base_aqi, weather, hour):
     """Generate human-readable reason for AQI prediction"""
@@ -127,14 +216,15 @@ def generate_weather_impacts(weather_forecast):
     return impacts
 
 
-def forecast_air_quality(current_aqi, weather_forecast, hours_ahead=6):
+def forecast_air_quality(current_aqi, weather_forecast, hours_ahead=6, multipliers=None):
     """
     Predict future AQI based on current conditions and weather
     Returns: {
-        'predictions': [...],
+        'predictions': [ForecastPoint, ...],
         'weather_impacts': [...]
     }
     """
+    multipliers = multipliers or FORECAST_MULTIPLIERS
     predictions = []
     base_aqi = current_aqi
 
@@ -142,38 +232,9 @@ def forecast_air_quality(current_aqi, weather_forecast, hours_ahead=6):
         weather = weather_forecast[i]
         predicted_aqi = base_aqi
 
-        # Wind effect: disperses pollution (STRONGER IMPACT)
-        wind_speed = weather.get('wind_speed', 0)
-        if wind_speed > 15:
-            predicted_aqi *= 0.75  # 25% reduction
-        elif wind_speed > 10:
-            predicted_aqi *= 0.85  # 15% reduction
-        elif wind_speed > 5:
-            predicted_aqi *= 0.92  # 8% reduction
-
-        # Temperature effect: heat creates ozone
-        temp = weather.get('temperature', 70)
-        if temp > 85:
-            predicted_aqi *= 1.20  # 20% increase
-        elif temp > 75:
-            predicted_aqi *= 1.10  # 10% increase
-
-        # Rain effect: cleans air
-        precip = weather.get('precipitation', 0)
-        if precip > 0:
-            predicted_aqi *= 0.65  # 35% reduction
-
-        # Humidity effect
-        humidity = weather.get('humidity', 50)
-        if humidity > 80:
-            predicted_aqi *= 1.05  # slight increase
-
-        # Time of day effect (traffic patterns)
         hour = (datetime.now().hour + i + 1) % 24
-        if 7 <= hour <= 9 or 16 <= hour <= 19:  # Rush hour
-            predicted_aqi *= 1.15  # 15% increase
-        elif 22 <= hour or hour <= 5:  # Night time
-            predicted_aqi *= 0.95  # 5% decrease
+        for rule in active_rules(weather, hour):
+            predicted_aqi *= multipliers[rule]
 
         # Add some natural variation
         import random
@@ -185,16 +246,16 @@ def forecast_air_quality(current_aqi, weather_forecast, hours_ahead=6):
         # Generate reasoning
         reason = get_forecast_reasoning(final_aqi, base_aqi, weather, hour)
 
-        predictions.append({
-            'hour': i + 1,
-            'time': weather.get('time', ''),
-            'aqi': final_aqi,
-            'level': get_aqi_level(final_aqi),
-            'reason': reason
-        })
+        predictions.append(ForecastPoint(
+            hour=i + 1,
+            time=weather.get('time', ''),
+            aqi=final_aqi,
+            level=get_aqi_level(final_aqi),
+            reason=reason
+        ))
 
         # Use this prediction as base for next hour (creates trending)
-        base_aqi = predicted_aqi * 0.9  # Slight decay factor
+        base_aqi = predicted_aqi * multipliers['decay']
 
     # Generate weather impacts
     weather_impacts = generate_weather_impacts(weather_forecast)
@@ -205,6 +266,44 @@ def forecast_air_quality(current_aqi, weather_forecast, hours_ahead=6):
     }
 
 
+# Stations within the same cell (decimal degrees, ~11 km) share one
+# weather fetch in forecast_for_stations
+WEATHER_CELL_PRECISION = 1
+
+STATION_FORECAST_HOURS = 4
+
+
+def forecast_for_stations(stations, get_weather, hours_ahead=STATION_FORECAST_HOURS):
+    """
+    Attach a short-horizon forecast to every station in one pass
+
+    get_weather(lat, lon) is called once per weather cell, not once per
+    station. Returns copies of the station dicts with a 'forecast' list
+    of {hour, aqi, level}.
+    """
+    weather_by_cell = {}
+    results = []
+
+    for station in stations:
+        if station.get('aqi') is None or station.get('lat') is None or station.get('lng') is None:
+            results.append(station)
+            continue
+
+        cell = (round(station['lat'], WEATHER_CELL_PRECISION),
+                round(station['lng'], WEATHER_CELL_PRECISION))
+        if cell not in weather_by_cell:
+            weather_by_cell[cell] = get_weather(*cell) or []
+
+        forecast_result = forecast_air_quality(
+            station['aqi'], weather_by_cell[cell][:hours_ahead], hours_ahead=hours_ahead)
+        results.append(dict(station, forecast=[
+            {'hour': p['hour'], 'aqi': p['aqi'], 'level': p['level']}
+            for p in forecast_result['predictions']
+        ]))
+
+    return results
+
+
 def get_aqi_level(aqi):
     if aqi <= 50:
         return "Good"
@@ -0,0 +1,301 @@
+import csv
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from api.geocode import geocode_upstream, reverse_geocode_upstream
+from utils.geo import EARTH_RADIUS_KM, cell_id
+from utils.log import get_logger
+from utils.metrics import count_cache
+from utils.sqlite_store import DATA_DIR, SQLiteStore
+
+log = get_logger('geocoding')
+
+# ========================================
+# Geocoding settings
+# ========================================
+GEOCODE_DB = os.getenv('AIRCAST_GEOCODE_DB', os.path.join(DATA_DIR, 'geocode.sqlite3'))
+
+# Bundled gazetteer; AIRCAST_GAZETTEER may point at a larger one in the
+# same CSV layout or a GeoNames cities*.txt dump
+GAZETTEER_PATH = os.getenv('AIRCAST_GAZETTEER', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'gazetteer.csv'))
+
+MEMORY_CACHE_SIZE = 4096
+FORWARD_TTL = 30 * 86400
+NOT_FOUND_TTL = 86400
+REVERSE_TTL = 90 * 86400
+
+# Reverse lookups are memoized per ~100 m cell
+REVERSE_PRECISION = 3
+
+AUTOCOMPLETE_LIMIT = 8
+
+# Upstream lookups always fetch (and cache) this many results; a smaller
+# limit is a slice of the cached list
+MAX_GEOCODE_RESULTS = 10
+
+# Nearest-place fallback for reverse geocoding without an upstream
+NEAREST_PLACE_MAX_KM = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS forward (
+    key TEXT PRIMARY KEY,       -- normalized query
+    value TEXT NOT NULL,        -- JSON results
+    expires INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS reverse (
+    key TEXT PRIMARY KEY,       -- cell id
+    value TEXT NOT NULL,
+    expires INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+COORDINATE_PATTERN = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+def normalize_query(query):
+    """Case-, accent-, punctuation- and whitespace-insensitive cache key"""
+    text = unicodedata.normalize('NFKD', query)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    text = re.sub(r"[^\w\s,]", ' ', text)
+    parts = [' '.join(part.split()) for part in text.split(',')]
+    return ', '.join(part for part in parts if part)
+
+
+# ========================================
+# Gazetteer + prefix trie
+# ========================================
+class GazetteerTrie:
+    """
+    Prefix trie over place names
+
+    Every node keeps the ids of its best places (by population), so an
+    autocomplete lookup is one walk down the prefix, independent of how
+    many places share it. Exact lookups use a separate name index, which
+    keeps every place rather than only the best per node.
+    """
+
+    def __init__(self, places, per_node=AUTOCOMPLETE_LIMIT):
+        self.places = places
+        self.root = {}
+        self.by_name = {}
+        order = sorted(range(len(places)), key=lambda i: -places[i]['population'])
+        for i in order:
+            name = normalize_query(places[i]['name'])
+            self.by_name.setdefault(name, []).append(i)
+            node = self.root
+            for char in name:
+                node = node.setdefault(char, {})
+                top = node.setdefault('', [])
+                if len(top) < per_node:
+                    top.append(i)
+
+        self.lat = np.radians([p['lat'] for p in places])
+        self.lng = np.radians([p['lng'] for p in places])
+
+    def complete(self, prefix, limit=AUTOCOMPLETE_LIMIT):
+        """Top places whose name starts with prefix ('name, region' filters by region)"""
+        name, _, region = normalize_query(prefix).partition(', ')
+        node = self.root
+        for char in name:
+            node = node.get(char)
+            if node is None:
+                return []
+        matches = [self.places[i] for i in node.get('', [])]
+        if region:
+            matches = [p for p in matches if normalize_query(p['region']).startswith(region)
+                       or normalize_query(p['country']).startswith(region)]
+        return matches[:limit]
+
+    def exact(self, query):
+        """Places whose full name (and region, if given) match the query"""
+        name, _, region = normalize_query(query).partition(', ')
+        matches = [self.places[i] for i in self.by_name.get(name, ())]
+        if region:
+            matches = [p for p in matches if normalize_query(p['region']) == region
+                       or normalize_query(p['country']) == region]
+        return matches
+
+    def nearest(self, lat, lon, max_km=NEAREST_PLACE_MAX_KM):
+        """Closest gazetteer place within max_km, or None"""
+        if not self.places:
+            return None
+        lat1, lon1 = np.radians(lat), np.radians(lon)
+        a = (np.sin((self.lat - lat1) / 2) ** 2 +
+             np.cos(lat1) * np.cos(self.lat) * np.sin((self.lng - lon1) / 2) ** 2)
+        dist = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+        i = int(np.argmin(dist))
+        if dist[i] > max_km:
+            return None
+        return dict(self.places[i], distance_km=round(float(dist[i]), 1))
+
+
+def load_gazetteer(path=GAZETTEER_PATH):
+    """Places from a gazetteer CSV or a GeoNames cities dump"""
+    places = []
+    try:
+        with open(path, encoding='utf-8') as f:
+            if path.endswith('.txt'):
+                # GeoNames: name=1, lat=4, lon=5, country=8, admin1=10, population=14
+                for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+                    places.append({'name': row[1], 'region': row[10], 'country': row[8],
+                                   'lat': float(row[4]), 'lng': float(row[5]),
+                                   'population': int(row[14] or 0)})
+            else:
+                for row in csv.DictReader(f):
+                    places.append({'name': row['name'], 'region': row['region'],
+                                   'country': row['country'], 'lat': float(row['lat']),
+                                   'lng': float(row['lon']), 'population': int(row['population'])})
+        log.info("Loaded %d gazetteer places from %s", len(places), path)
+    except (OSError, KeyError, IndexError, ValueError) as e:
+        log.warning("Could not load gazetteer %s: %s", path, e)
+    return places
+
+
+def place_result(place):
+    """Gazetteer place in the same shape as an upstream geocode result"""
+    return {
+        'name': f"{place['name']}, {place['region']}, {place['country']}",
+        'lat': place['lat'],
+        'lng': place['lng'],
+        'type': 'city',
+        'country': place['country'],
+        'source': 'gazetteer'
+    }
+
+
+# ========================================
+# Two-level cache: in-memory LRU over SQLite
+# ========================================
+class GeocodeCache:
+    """Persistent geocode results ('forward' and 'reverse' tables) with TTLs"""
+
+    def __init__(self, path=GEOCODE_DB, memory_size=MEMORY_CACHE_SIZE):
+        self._db = SQLiteStore(path, SCHEMA)
+        self._memory = OrderedDict()
+        self._memory_size = memory_size
+        self._lock = threading.Lock()
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+
+    def get(self, table, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get((table, key))
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end((table, key))
+                self.hits['memory'] += 1
+                count_cache('geocode', True)
+                return entry[0]
+
+        row = self._db.connection().execute(
+            f'SELECT value, expires FROM {table} WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] <= now:
+            with self._lock:
+                self.misses += 1
+            count_cache('geocode', False)
+            return None
+
+        value = json.loads(row[0])
+        self._remember(table, key, value, row[1])
+        with self._lock:
+            self.hits['disk'] += 1
+        count_cache('geocode', True)
+        return value
+
+    def put(self, table, key, value, ttl):
+        expires = int(time.time() + ttl)
+        with self._db.transaction() as conn:
+            conn.execute(f'INSERT OR REPLACE INTO {table} VALUES (?, ?, ?)',
+                         (key, json.dumps(value), expires))
+        self._remember(table, key, value, expires)
+
+    def _remember(self, table, key, value, expires):
+        with self._lock:
+            self._memory[(table, key)] = (value, expires)
+            self._memory.move_to_end((table, key))
+            while len(self._memory) > self._memory_size:
+                self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'memory_entries': len(self._memory), 'hits': dict(self.hits),
+                    'misses': self.misses}
+
+
+geocode_cache = GeocodeCache()
+gazetteer = GazetteerTrie(load_gazetteer())
+
+
+def geocode(query, limit=5):
+    """
+    Forward geocode a free-text query
+
+    Coordinates are parsed locally; otherwise the normalized query is
+    served from the cache, then an exact gazetteer match, and only then
+    from OpenCage. Returns (results, source).
+    """
+    match = COORDINATE_PATTERN.match(query)
+    if match:
+        lat, lng = float(match.group(1)), float(match.group(2))
+        return [{'name': f"{lat}, {lng}", 'lat': lat, 'lng': lng, 'type': 'coordinates',
+                 'country': '', 'source': 'coordinates'}], 'coordinates'
+
+    key = normalize_query(query)
+    if not key:
+        return [], 'empty'
+
+    cached = geocode_cache.get('forward', key)
+    if cached is not None:
+        return cached[:limit], 'cache'
+
+    places = gazetteer.exact(key)
+    if places:
+        return [place_result(p) for p in places[:limit]], 'gazetteer'
+
+    results = geocode_upstream(query, MAX_GEOCODE_RESULTS)
+    if results is None:
+        # Upstream unavailable: best effort from the gazetteer, not cached
+        return [place_result(p) for p in gazetteer.complete(key, limit)], 'gazetteer'
+
+    geocode_cache.put('forward', key, results, FORWARD_TTL if results else NOT_FOUND_TTL)
+    return results[:limit], 'opencage'
+
+
+def autocomplete(prefix, limit=AUTOCOMPLETE_LIMIT):
+    """Prefix suggestions from the local gazetteer (never calls upstream)"""
+    return [place_result(p) for p in gazetteer.complete(prefix, limit)]
+
+
+def reverse_geocode(lat, lon):
+    """
+    Place for a coordinate, memoized per ~100 m cell. Returns (result, source)
+
+    A cell where the upstream found no place is cached as {} for
+    NOT_FOUND_TTL and answered from the gazetteer meanwhile.
+    """
+    cell = cell_id(lat, lon, REVERSE_PRECISION)
+    cached = geocode_cache.get('reverse', cell)
+    if cached:
+        return cached, 'cache'
+
+    if cached is None:
+        result = reverse_geocode_upstream(lat, lon)
+        if result is not None:
+            geocode_cache.put('reverse', cell, result, REVERSE_TTL if result else NOT_FOUND_TTL)
+        if result:
+            return result, 'opencage'
+
+    place = gazetteer.nearest(lat, lon)
+    if place is None:
+        return None, 'gazetteer'
+    return dict(place_result(place), name=f"Near {place['name']}, {place['region']}",
+                distance_km=place['distance_km']), 'gazetteer'
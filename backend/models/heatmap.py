@@ -0,0 +1,289 @@
+import base64
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from api.tempo import convert_no2_to_aqi_array, granule_key, read_tempo_netcdf
+from models.stations import station_index
+
+# ========================================
+# Interpolation settings
+# ========================================
+# Grid cells live on a global lattice of `res` degrees and are computed
+# in square tiles, so overlapping viewports reuse the same tiles.
+TILE_CELLS = 32
+DEFAULT_RES = 0.05
+MIN_RES = 0.01
+MAX_CELLS = 250_000
+
+IDW_POWER = 2
+IDW_NEIGHBORS = 8
+INFLUENCE_RADIUS_KM = 50.0
+
+# TEMPO enters the blend as one virtual observation this far away, so
+# nearby stations dominate and the satellite field fills the gaps
+SATELLITE_EQUIVALENT_KM = 15.0
+
+NODATA = 65535
+TILE_CACHE_SIZE = 4096
+
+KM_PER_DEG_LAT = 110.57
+
+
+class NeighborIndex:
+    """Uniform bucket grid over station positions for radius lookups"""
+
+    def __init__(self, stations, bucket_degrees):
+        self.bucket = bucket_degrees
+        self.lat = np.array([s['lat'] for s in stations], dtype=float)
+        self.lng = np.array([s['lng'] for s in stations], dtype=float)
+        self.aqi = np.array([s['aqi'] for s in stations], dtype=float)
+        self.keys = [(s.get('id'), s['aqi']) for s in stations]
+        self._buckets = {}
+        bx = np.floor(self.lng / bucket_degrees).astype(int)
+        by = np.floor(self.lat / bucket_degrees).astype(int)
+        for i, cell in enumerate(zip(bx.tolist(), by.tolist())):
+            self._buckets.setdefault(cell, []).append(i)
+
+    def candidates(self, bbox):
+        """Indices of stations in buckets touching bbox"""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        found = []
+        for x in range(int(math.floor(min_lon / self.bucket)), int(math.floor(max_lon / self.bucket)) + 1):
+            for y in range(int(math.floor(min_lat / self.bucket)), int(math.floor(max_lat / self.bucket)) + 1):
+                found.extend(self._buckets.get((x, y), ()))
+        return np.array(sorted(found), dtype=int)
+
+
+def _radius_degrees(lat):
+    dlat = INFLUENCE_RADIUS_KM / KM_PER_DEG_LAT
+    dlon = dlat / max(math.cos(math.radians(min(abs(lat), 85))), 0.05)
+    return dlat, dlon
+
+
+def clamp_res(res):
+    """Cell size actually used for a requested res (at least MIN_RES degrees)"""
+    res = float(res)
+    if not math.isfinite(res):
+        raise ValueError("res must be a finite number")
+    return max(res, MIN_RES)
+
+
+def _tile_bbox(tx, ty, res):
+    size = TILE_CELLS * res
+    return (tx * size, ty * size, (tx + 1) * size, (ty + 1) * size)
+
+
+def _idw_tile(lat_c, lon_c, index, candidates):
+    """IDW of station AQI at cell centers; returns (weighted_sum, weight_sum)"""
+    shape = lat_c.shape
+    if len(candidates) == 0:
+        return np.zeros(shape), np.zeros(shape)
+
+    lat = lat_c.reshape(-1, 1)
+    lon = lon_c.reshape(-1, 1)
+    s_lat = index.lat[candidates][None, :]
+    s_lng = index.lng[candidates][None, :]
+    s_aqi = index.aqi[candidates]
+
+    dy = (lat - s_lat) * KM_PER_DEG_LAT
+    dx = (lon - s_lng) * KM_PER_DEG_LAT * np.cos(np.radians(lat))
+    dist = np.sqrt(dx * dx + dy * dy)
+
+    k = min(IDW_NEIGHBORS, dist.shape[1])
+    nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+    d = np.take_along_axis(dist, nearest, axis=1)
+    a = s_aqi[nearest]
+
+    within = d <= INFLUENCE_RADIUS_KM
+    w = np.where(within, 1.0 / np.maximum(d, 0.1) ** IDW_POWER, 0.0)
+    return (w * a).sum(axis=1).reshape(shape), w.sum(axis=1).reshape(shape)
+
+
+def _satellite_tile(tempo, tile_bbox, res):
+    """Mean TEMPO AQI per cell from the pixels falling in each cell"""
+    grid = np.full(TILE_CELLS * TILE_CELLS, np.nan)
+    if tempo is None:
+        return grid.reshape(TILE_CELLS, TILE_CELLS)
+
+    # Only the pixels bucketed near the tile, never the whole swath
+    min_lon, min_lat, _, _ = tile_bbox
+    locator = tempo['locator']
+    pixels = locator.in_box(min_lat, min_lon, min_lat + TILE_CELLS * res, min_lon + TILE_CELLS * res)
+    no2 = tempo['no2'][pixels]
+    finite = np.isfinite(no2)
+    if not finite.any():
+        return grid.reshape(TILE_CELLS, TILE_CELLS)
+
+    pixels, no2 = pixels[finite], no2[finite]
+    col = ((locator.lon[pixels] - min_lon) / res).astype(int).clip(0, TILE_CELLS - 1)
+    row = ((locator.lat[pixels] - min_lat) / res).astype(int).clip(0, TILE_CELLS - 1)
+    cell = row * TILE_CELLS + col
+    sums = np.bincount(cell, weights=no2, minlength=grid.size)
+    counts = np.bincount(cell, minlength=grid.size)
+    has = counts > 0
+    grid[has] = convert_no2_to_aqi_array(sums[has] / counts[has])
+    return grid.reshape(TILE_CELLS, TILE_CELLS)
+
+
+class HeatmapEngine:
+    """
+    Fuses station AQI (IDW) with the TEMPO NO2-derived AQI field
+
+    Tiles are cached with a fingerprint of their inputs (the stations
+    within reach plus the TEMPO granule), so a refresh only recomputes
+    tiles whose inputs actually changed. Tiles compute outside the
+    engine lock; concurrent requests for one tile wait on its own lock.
+    """
+
+    def __init__(self):
+        self._tiles = OrderedDict()
+        self._tile_locks = {}
+        self._lock = threading.Lock()
+        self._index = None
+        self._index_version = None
+        self._tempo = None
+        self.computed = 0
+        self.reused = 0
+
+    def _neighbor_index(self):
+        version = station_index.version
+        if self._index is None or self._index_version != version:
+            stations = [s for s in station_index.all_stations() if s.get('aqi') is not None]
+            self._index = NeighborIndex(stations, INFLUENCE_RADIUS_KM / KM_PER_DEG_LAT)
+            self._index_version = version
+        return self._index
+
+    def _tempo_field(self, tempo_data):
+        if not tempo_data or tempo_data.get('pixel_locator') is None:
+            return None
+        key = granule_key(tempo_data)
+        if self._tempo is None or self._tempo['id'] != key:
+            no2 = np.ma.filled(np.ma.asarray(tempo_data['no2_column'], dtype=float), np.nan).ravel()
+            self._tempo = {'id': key, 'locator': tempo_data['pixel_locator'], 'no2': no2}
+        return self._tempo
+
+    def _tile(self, tx, ty, res, index, tempo):
+        tile_bbox = _tile_bbox(tx, ty, res)
+        dlat, dlon = _radius_degrees((tile_bbox[1] + tile_bbox[3]) / 2)
+        candidates = index.candidates((tile_bbox[0] - dlon, tile_bbox[1] - dlat,
+                                       tile_bbox[2] + dlon, tile_bbox[3] + dlat))
+
+        digest = hashlib.sha1(repr((
+            tempo['id'] if tempo else None,
+            [index.keys[i] for i in candidates.tolist()]
+        )).encode()).hexdigest()
+
+        key = (res, tx, ty)
+        with self._lock:
+            cached = self._cached_tile(key, digest)
+            if cached is not None:
+                return cached
+            lock = self._tile_locks.setdefault(key, threading.Lock())
+
+        with lock:
+            with self._lock:
+                cached = self._cached_tile(key, digest)
+            if cached is not None:
+                return cached
+            try:
+                values = self._compute_tile(tile_bbox, res, index, candidates, tempo)
+                with self._lock:
+                    self._tiles[key] = (digest, values)
+                    self._tiles.move_to_end(key)
+                    while len(self._tiles) > TILE_CACHE_SIZE:
+                        self._tiles.popitem(last=False)
+                    self.computed += 1
+            finally:
+                with self._lock:
+                    if self._tile_locks.get(key) is lock:
+                        del self._tile_locks[key]
+            return values
+
+    def _cached_tile(self, key, digest):
+        cached = self._tiles.get(key)
+        if cached and cached[0] == digest:
+            self._tiles.move_to_end(key)
+            self.reused += 1
+            return cached[1]
+        return None
+
+    @staticmethod
+    def _compute_tile(tile_bbox, res, index, candidates, tempo):
+        offsets = (np.arange(TILE_CELLS) + 0.5) * res
+        lat_c, lon_c = np.meshgrid(tile_bbox[1] + offsets, tile_bbox[0] + offsets, indexing='ij')
+
+        weighted, weights = _idw_tile(lat_c, lon_c, index, candidates)
+        satellite = _satellite_tile(tempo, tile_bbox, res)
+
+        sat_weight = np.where(np.isfinite(satellite), 1.0 / SATELLITE_EQUIVALENT_KM ** IDW_POWER, 0.0)
+        total = weights + sat_weight
+        values = np.where(
+            total > 0,
+            (weighted + np.nan_to_num(satellite) * sat_weight) / np.where(total > 0, total, 1),
+            np.nan)
+        return values
+
+    def grid(self, bbox, res=DEFAULT_RES):
+        """
+        AQI grid for bbox as a (rows, cols) float array, row 0 = south
+
+        Returns (values, grid_bbox, res) where grid_bbox is bbox snapped
+        out to the cell lattice and res is the cell size used (clamp_res).
+        """
+        res = clamp_res(res)
+        min_lon, min_lat, max_lon, max_lat = bbox
+        c0, c1 = int(math.floor(min_lon / res)), int(math.ceil(max_lon / res))
+        r0, r1 = int(math.floor(min_lat / res)), int(math.ceil(max_lat / res))
+        if (c1 - c0) * (r1 - r0) > MAX_CELLS:
+            raise ValueError(f"bbox too large for res={res}; at most {MAX_CELLS} cells")
+
+        tempo_data = read_tempo_netcdf()
+        with self._lock:
+            index = self._neighbor_index()
+            tempo = self._tempo_field(tempo_data)
+
+        out = np.full((r1 - r0, c1 - c0), np.nan)
+        for ty in range(r0 // TILE_CELLS, (r1 - 1) // TILE_CELLS + 1):
+            for tx in range(c0 // TILE_CELLS, (c1 - 1) // TILE_CELLS + 1):
+                tile = self._tile(tx, ty, res, index, tempo)
+                # Overlap of this tile with the requested cell range
+                rs, re_ = max(r0, ty * TILE_CELLS), min(r1, (ty + 1) * TILE_CELLS)
+                cs, ce = max(c0, tx * TILE_CELLS), min(c1, (tx + 1) * TILE_CELLS)
+                out[rs - r0:re_ - r0, cs - c0:ce - c0] = \
+                    tile[rs - ty * TILE_CELLS:re_ - ty * TILE_CELLS,
+                         cs - tx * TILE_CELLS:ce - tx * TILE_CELLS]
+
+        return out, (c0 * res, r0 * res, c1 * res, r1 * res), res
+
+
+heatmap_engine = HeatmapEngine()
+
+
+def encode_raster(values):
+    """Pack an AQI grid as little-endian uint16 bytes (NODATA for gaps)"""
+    raster = np.where(np.isfinite(values), np.clip(np.rint(values), 0, 500), NODATA)
+    return raster.astype('<u2').tobytes()
+
+
+def build_heatmap(bbox, res=DEFAULT_RES, binary=False):
+    """Heatmap payload for bbox; raster is base64 unless binary"""
+    values, grid_bbox, res = heatmap_engine.grid(bbox, res)
+    raster = encode_raster(values)
+    return {
+        'bbox': list(grid_bbox),
+        'res': res,
+        'width': values.shape[1],
+        'height': values.shape[0],
+        'dtype': 'uint16',
+        'byte_order': 'little',
+        'row_order': 'south_to_north',
+        'nodata': NODATA,
+        'encoding': 'raw' if binary else 'base64',
+        'raster': raster if binary else base64.b64encode(raster).decode('ascii'),
+        'tiles_computed': heatmap_engine.computed,
+        'tiles_reused': heatmap_engine.reused
+    }
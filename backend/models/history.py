@@ -0,0 +1,523 @@
+import atexit
+import math
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from models.forecast import WEATHER_CELL_PRECISION, get_aqi_level
+from utils.geo import cell_id
+from utils.log import get_logger
+from utils.sqlite_store import DATA_DIR, SQLiteStore
+
+log = get_logger('history')
+
+# ========================================
+# Time-series history store (SQLite, WAL)
+# ========================================
+# readings         raw station readings, one row per (station, ts)
+# readings_hourly  hourly rollups, readings_daily  daily rollups
+# forecasts        issued forecasts per (cell, target, issued)
+# weather          observed hourly weather per ~11 km cell
+# station_names    latest display name per station
+#
+# Every table is WITHOUT ROWID and clustered on its key, so a range
+# query for one station is a single contiguous index scan.
+
+HISTORY_DB = os.getenv('AIRCAST_HISTORY_DB', os.path.join(DATA_DIR, 'history.sqlite3'))
+
+# Retention per resolution, in seconds
+RETENTION = {
+    'raw': 14 * 86400,
+    'hour': 180 * 86400,
+    'day': 5 * 365 * 86400,
+    'forecasts': 30 * 86400,
+    'weather': 180 * 86400,
+}
+RETENTION_INTERVAL = 3600
+
+# Last second of year 9999; larger epoch times are rejected as invalid
+MAX_EPOCH = 253402300799
+
+ROLLUP_TABLES = {'hour': ('readings_hourly', 3600), 'day': ('readings_daily', 86400)}
+
+# Station source -> series key prefix; other sources (sample data) aren't recorded
+SERIES_PREFIXES = {'OpenAQ': 'openaq', 'AirNow': 'airnow', 'PurpleAir': 'purpleair', 'Local': 'local'}
+SERIES_SOURCES = {prefix: source for source, prefix in SERIES_PREFIXES.items()}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    station TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    aqi INTEGER,
+    pm25 REAL,
+    no2 REAL,
+    o3 REAL,
+    lat REAL,
+    lng REAL,
+    PRIMARY KEY (station, ts)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS readings_hourly (
+    station TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    aqi_sum INTEGER NOT NULL,
+    aqi_min INTEGER NOT NULL,
+    aqi_max INTEGER NOT NULL,
+    pm25_sum REAL NOT NULL,
+    pm25_n INTEGER NOT NULL,
+    PRIMARY KEY (station, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS readings_daily (
+    station TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    aqi_sum INTEGER NOT NULL,
+    aqi_min INTEGER NOT NULL,
+    aqi_max INTEGER NOT NULL,
+    pm25_sum REAL NOT NULL,
+    pm25_n INTEGER NOT NULL,
+    PRIMARY KEY (station, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS forecasts (
+    cell TEXT NOT NULL,
+    target INTEGER NOT NULL,
+    issued INTEGER NOT NULL,
+    horizon INTEGER NOT NULL,
+    aqi INTEGER NOT NULL,
+    PRIMARY KEY (cell, target, issued)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS weather (
+    cell TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    wind_speed REAL,
+    temperature REAL,
+    precipitation REAL,
+    humidity REAL,
+    PRIMARY KEY (cell, ts)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS station_names (
+    station TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS readings_ts ON readings (ts);
+"""
+
+# Cell ids are "lat,lon"; unpacked in SQL so the bbox filter runs there
+FORECASTS_IN_BBOX = """
+SELECT cell, lat, lon, target, issued, horizon, aqi FROM (
+    SELECT cell, target, issued, horizon, aqi,
+           CAST(substr(cell, 1, instr(cell, ',') - 1) AS REAL) AS lat,
+           CAST(substr(cell, instr(cell, ',') + 1) AS REAL) AS lon
+    FROM forecasts WHERE target BETWEEN ? AND ?
+) WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?
+"""
+
+ROLLUP_UPSERT = """
+INSERT INTO {table} (station, bucket, n, aqi_sum, aqi_min, aqi_max, pm25_sum, pm25_n)
+VALUES (?, ?, 1, ?, ?, ?, ?, ?)
+ON CONFLICT (station, bucket) DO UPDATE SET
+    n = n + 1,
+    aqi_sum = aqi_sum + excluded.aqi_sum,
+    aqi_min = MIN(aqi_min, excluded.aqi_min),
+    aqi_max = MAX(aqi_max, excluded.aqi_max),
+    pm25_sum = pm25_sum + excluded.pm25_sum,
+    pm25_n = pm25_n + excluded.pm25_n
+"""
+
+
+def parse_time(value, default=None):
+    """Epoch seconds from an epoch number or ISO-8601 string; ValueError if it is neither"""
+    if value is None or value == '':
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        pass
+    else:
+        if not math.isfinite(number) or abs(number) > MAX_EPOCH:
+            raise ValueError(f"time out of range: {value!r}")
+        return int(number)
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def station_series_key(station):
+    """
+    Series key for a station dict: '<source>:<id>' (ids that already
+    carry their source's prefix are used as they are), or 'name:<name>'
+    """
+    if station.get('id') is None:
+        return f"name:{station.get('name')}"
+    prefix = SERIES_PREFIXES.get(station.get('source'), 'openaq')
+    station_id = str(station['id'])
+    if station_id.startswith(prefix + ':'):
+        return station_id
+    return f"{prefix}:{station_id}"
+
+
+def reading_rows(stations):
+    """
+    (readings rows, {series key: name}) for the live readings among
+    stations (recorded sources only, no stale replays)
+    """
+    rows = []
+    names = {}
+    now = int(time.time())
+    for station in stations:
+        aqi = station.get('aqi')
+        if station.get('source') not in SERIES_PREFIXES or station.get('stale') \
+                or aqi is None or not math.isfinite(aqi):
+            continue
+        try:
+            ts = parse_time(station.get('timestamp'), now)
+        except ValueError:
+            ts = now
+        key = station_series_key(station)
+        measurements = station.get('measurements') or {}
+        if station.get('name'):
+            names[key] = station['name']
+        rows.append((key, ts, int(aqi),
+                     measurements.get('pm25'), measurements.get('no2'), measurements.get('o3'),
+                     station.get('lat'), station.get('lng')))
+    return rows, names
+
+
+def station_from_series_key(key):
+    """(id, source) for a series key written by station_series_key"""
+    prefix, _, station_id = key.partition(':')
+    if prefix == 'openaq':
+        return int(station_id), 'OpenAQ'
+    return key, SERIES_SOURCES[prefix]
+
+
+class HistoryStore:
+    """Append-only readings/forecast store with rollups and retention"""
+
+    def __init__(self, path=HISTORY_DB):
+        self._db = SQLiteStore(path, SCHEMA)
+        self._last_retention = 0.0
+        self._retention_lock = threading.Lock()
+
+    def _connection(self):
+        return self._db.connection()
+
+    # ========================================
+    # Writes
+    # ========================================
+    def record_readings(self, stations):
+        """Append live station readings; duplicates are ignored"""
+        return self.write_readings(*reading_rows(stations))
+
+    def write_readings(self, rows, names):
+        """Append reading rows from reading_rows(); returns how many were new"""
+        if not rows:
+            return 0
+
+        inserted = 0
+        renamed = {}
+        with self._db.transaction() as conn:
+            for row in rows:
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO readings VALUES (?, ?, ?, ?, ?, ?, ?, ?)', row)
+                if cursor.rowcount != 1:
+                    continue
+                inserted += 1
+                station, ts, aqi, pm25 = row[0], row[1], row[2], row[3]
+                if station in names:
+                    renamed[station] = names[station]
+                for table, size in ROLLUP_TABLES.values():
+                    conn.execute(ROLLUP_UPSERT.format(table=table), (
+                        station, ts - ts % size, aqi, aqi, aqi,
+                        pm25 or 0.0, 1 if pm25 is not None else 0))
+            conn.executemany('INSERT OR REPLACE INTO station_names VALUES (?, ?)', renamed.items())
+
+        self._maybe_apply_retention()
+        return inserted
+
+    def record_forecast(self, cell, predictions, issued=None):
+        """Store an issued forecast ({hour, aqi} per step) for a cell"""
+        issued = int(issued or time.time())
+        base = issued - issued % 3600
+        rows = [(cell, base + p['hour'] * 3600, issued, p['hour'], int(p['aqi']))
+                for p in predictions]
+        if not rows:
+            return 0
+        with self._db.transaction() as conn:
+            conn.executemany('INSERT OR REPLACE INTO forecasts VALUES (?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def record_weather(self, lat, lon, weather):
+        """Store an observed weather reading in its hourly slot"""
+        if not weather.get('observed_at') or weather.get('stale'):
+            return 0
+        ts = int(weather['observed_at'])
+        cell = cell_id(lat, lon, WEATHER_CELL_PRECISION)
+        with self._db.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO weather VALUES (?, ?, ?, ?, ?, ?)', (
+                cell, ts - ts % 3600, weather.get('wind_speed'), weather.get('temperature'),
+                weather.get('precipitation', 0), weather.get('humidity')))
+        return 1
+
+    def _maybe_apply_retention(self):
+        now = time.time()
+        if now - self._last_retention < RETENTION_INTERVAL:
+            return
+        with self._retention_lock:
+            if now - self._last_retention < RETENTION_INTERVAL:
+                return
+            self._last_retention = now
+        self.apply_retention(now)
+
+    def apply_retention(self, now=None):
+        """Drop rows older than each resolution's retention window (all tables or none)"""
+        now = int(now or time.time())
+        with self._db.transaction() as conn:
+            conn.execute('DELETE FROM readings WHERE ts < ?', (now - RETENTION['raw'],))
+            conn.execute('DELETE FROM readings_hourly WHERE bucket < ?', (now - RETENTION['hour'],))
+            conn.execute('DELETE FROM readings_daily WHERE bucket < ?', (now - RETENTION['day'],))
+            conn.execute('DELETE FROM forecasts WHERE issued < ?', (now - RETENTION['forecasts'],))
+            conn.execute('DELETE FROM weather WHERE ts < ?', (now - RETENTION['weather'],))
+
+    # ========================================
+    # Range queries
+    # ========================================
+    def query_readings(self, station, start, end, resolution='raw'):
+        """Readings for a station between start and end (epoch seconds)"""
+        conn = self._connection()
+        if resolution == 'raw':
+            cursor = conn.execute(
+                'SELECT ts, aqi, pm25, no2, o3 FROM readings '
+                'WHERE station = ? AND ts BETWEEN ? AND ? ORDER BY ts', (station, start, end))
+            return [{'ts': ts, 'aqi': aqi, 'pm25': pm25, 'no2': no2, 'o3': o3}
+                    for ts, aqi, pm25, no2, o3 in cursor]
+
+        table, _ = ROLLUP_TABLES[resolution]
+        cursor = conn.execute(
+            f'SELECT bucket, n, aqi_sum, aqi_min, aqi_max, pm25_sum, pm25_n FROM {table} '
+            'WHERE station = ? AND bucket BETWEEN ? AND ? ORDER BY bucket', (station, start, end))
+        return [{
+            'ts': bucket,
+            'count': n,
+            'aqi_mean': round(aqi_sum / n, 1),
+            'aqi_min': aqi_min,
+            'aqi_max': aqi_max,
+            'pm25_mean': round(pm25_sum / pm25_n, 2) if pm25_n else None
+        } for bucket, n, aqi_sum, aqi_min, aqi_max, pm25_sum, pm25_n in cursor]
+
+    def query_forecasts(self, cell, start, end):
+        """Issued forecasts for a cell whose target falls in [start, end]"""
+        conn = self._connection()
+        cursor = conn.execute(
+            'SELECT target, issued, horizon, aqi FROM forecasts '
+            'WHERE cell = ? AND target BETWEEN ? AND ? ORDER BY target, issued', (cell, start, end))
+        return [{'target': target, 'issued': issued, 'horizon': horizon, 'aqi': aqi}
+                for target, issued, horizon, aqi in cursor]
+
+    # ========================================
+    # Bulk scans (exports), chunk by chunk
+    # ========================================
+    @staticmethod
+    def _chunks(cursor, size):
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                return
+            yield rows
+
+    def iter_readings_in_bbox(self, bbox, start, end, chunk_rows):
+        """Lists of (station, ts, lat, lng, aqi, pm25, no2, o3) rows in bbox, by ts"""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        cursor = self._connection().execute(
+            'SELECT station, ts, lat, lng, aqi, pm25, no2, o3 FROM readings '
+            'WHERE ts BETWEEN ? AND ? AND lat BETWEEN ? AND ? AND lng BETWEEN ? AND ? ORDER BY ts',
+            (start, end, min_lat, max_lat, min_lon, max_lon))
+        return self._chunks(cursor, chunk_rows)
+
+    def iter_forecasts_in_bbox(self, bbox, start, end, chunk_rows):
+        """Lists of (cell, lat, lon, target, issued, horizon, aqi) rows for cells in bbox"""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        cursor = self._connection().execute(
+            FORECASTS_IN_BBOX, (start, end, min_lat, max_lat, min_lon, max_lon))
+        return self._chunks(cursor, chunk_rows)
+
+    def station_positions(self):
+        """{series key: (lat, lng)} for every station with raw readings"""
+        conn = self._connection()
+        cursor = conn.execute('SELECT station, AVG(lat), AVG(lng) FROM readings '
+                              'WHERE lat IS NOT NULL GROUP BY station')
+        return {station: (lat, lng) for station, lat, lng in cursor}
+
+    def hourly_series(self, start, end):
+        """(station, hour bucket, mean AQI) rows between start and end"""
+        conn = self._connection()
+        return conn.execute(
+            'SELECT station, bucket, aqi_sum * 1.0 / n FROM readings_hourly '
+            'WHERE bucket BETWEEN ? AND ?', (start, end)).fetchall()
+
+    def weather_series(self, start, end):
+        """(cell, hour, wind, temperature, precipitation, humidity) rows"""
+        conn = self._connection()
+        return conn.execute(
+            'SELECT cell, ts, wind_speed, temperature, precipitation, humidity FROM weather '
+            'WHERE ts BETWEEN ? AND ?', (start, end)).fetchall()
+
+    def latest_readings(self, since):
+        """Each station's most recent reading since `since`, as station dicts"""
+        conn = self._connection()
+        cursor = conn.execute(
+            'SELECT r.station, r.ts, r.aqi, r.pm25, r.no2, r.o3, r.lat, r.lng, n.name '
+            'FROM readings r '
+            'JOIN (SELECT station, MAX(ts) AS ts FROM readings WHERE ts >= ? GROUP BY station) l '
+            'USING (station, ts) '
+            'LEFT JOIN station_names n USING (station) '
+            "WHERE r.station NOT LIKE 'name:%' AND r.lat IS NOT NULL", (since,))
+        stations = []
+        for station, ts, aqi, pm25, no2, o3, lat, lng, name in cursor:
+            try:
+                station_id, source = station_from_series_key(station)
+            except (KeyError, ValueError):
+                continue
+            measurements = {k: v for k, v in (('pm25', pm25), ('no2', no2), ('o3', o3)) if v is not None}
+            stations.append({
+                'id': station_id,
+                'name': name or f"Station {station_id}",
+                'lat': lat,
+                'lng': lng,
+                'aqi': aqi,
+                'level': get_aqi_level(aqi),
+                'timestamp': datetime.fromtimestamp(ts, timezone.utc).isoformat().replace('+00:00', 'Z'),
+                'measurements': measurements,
+                'source': source,
+                'stale': True
+            })
+        return stations
+
+    def stations(self):
+        """Series keys with their latest reading time"""
+        conn = self._connection()
+        cursor = conn.execute('SELECT station, MAX(bucket) FROM readings_daily GROUP BY station')
+        return [{'station': station, 'last_day': last} for station, last in cursor]
+
+
+history_store = HistoryStore()
+
+
+# ========================================
+# Background writer
+# ========================================
+# Request threads only enqueue; one writer thread per process applies
+# the writes and the hourly retention pass, so neither waits on SQLite's
+# single writer lock. Readings queued together are written in one
+# transaction. When the queue is full, new writes are dropped.
+
+WRITE_QUEUE_SIZE = 1000
+
+
+class HistoryWriter:
+    """Queue plus writer thread in front of a HistoryStore"""
+
+    def __init__(self, store, max_queue=WRITE_QUEUE_SIZE):
+        self.store = store
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, kind, *args):
+        """Queue a write ('readings', 'forecast' or 'weather'); never blocks"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((kind, args))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                log.warning("History write queue full, dropping writes", extra={'dropped': self.dropped})
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        rows, names = [], {}
+        for kind, args in batch:
+            if kind == 'readings':
+                rows.extend(args[0])
+                names.update(args[1])
+                continue
+            try:
+                if kind == 'forecast':
+                    self.store.record_forecast(*args)
+                else:
+                    self.store.record_weather(*args)
+            except Exception as e:
+                log.warning("Could not record %s history: %s", kind, e)
+        try:
+            self.store.write_readings(rows, names)
+        except Exception as e:
+            log.warning("Could not record history: %s", e)
+
+    def flush(self):
+        """Wait until everything queued so far is written"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def reset(self):
+        # The writer thread does not survive a fork, and the queue's lock
+        # may have been held at the time; start afresh in the child
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+
+history_writer = HistoryWriter(history_store)
+
+atexit.register(history_writer.flush)
+os.register_at_fork(after_in_child=history_writer.reset)
+
+
+def record_readings_safely(stations):
+    """Queue live readings for the background writer; never fails the calling request"""
+    try:
+        rows, names = reading_rows(stations)
+    except Exception as e:
+        log.warning("Could not record history: %s", e)
+        return
+    if rows:
+        history_writer.submit('readings', rows, names)
+
+
+def record_forecast_safely(cell, predictions):
+    history_writer.submit('forecast', cell, list(predictions), int(time.time()))
+
+
+def record_weather_safely(lat, lon, weather):
+    history_writer.submit('weather', lat, lon, dict(weather))
@@ -0,0 +1,114 @@
+import threading
+import time
+
+from utils.data_context import DataContext
+from utils.geo import parse_cell_id
+from utils.log import get_logger
+from utils.pubsub import pubsub
+from utils.rate_limit import background_priority
+
+log = get_logger('live_updates')
+
+# Seconds between background refreshes of subscribed cells
+REFRESH_INTERVAL = 60
+
+# Forecast changes smaller than this are model noise, not news
+FORECAST_DELTA_THRESHOLD = 10
+
+
+def cell_snapshot(context, lat, lon):
+    """Current values for a cell, the unit clients subscribe to"""
+    locations = context.stations(lat, lon)
+    nearest = locations[0] if locations else {}
+    tempo = context.tempo(lat, lon)
+    forecast = context.forecast(lat, lon).get('predictions', [])
+
+    return {
+        'aqi': nearest.get('aqi'),
+        'level': nearest.get('level'),
+        'station': nearest.get('name'),
+        'measurements': nearest.get('measurements', {}),
+        'tempo_aqi': tempo.get('aqi'),
+        'forecast': [p['aqi'] for p in forecast],
+        'stale': bool(nearest.get('stale') or tempo.get('stale'))
+    }
+
+
+def snapshot_delta(old, new):
+    """Fields of new that differ from old (everything if old is None)"""
+    if old is None:
+        return dict(new)
+
+    delta = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if key == 'forecast':
+            if len(value) != len(previous or []) or any(
+                    abs(a - b) >= FORECAST_DELTA_THRESHOLD for a, b in zip(value, previous)):
+                delta[key] = value
+        elif value != previous:
+            delta[key] = value
+    return delta
+
+
+class LiveRefresher:
+    """
+    Background loop that refreshes every subscribed cell and publishes
+    only what changed; one refresh fans out to all of a cell's viewers
+    """
+
+    def __init__(self, interval=REFRESH_INTERVAL):
+        self.interval = interval
+        # Expire before the next round so each round refetches
+        self._context = DataContext('live-refresh', ttl=interval / 2, freshness=0,
+                                    track_traffic=False)
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def ensure_started(self):
+        """Start the refresh thread on first use (per worker process)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='live-refresher', daemon=True)
+                self._thread.start()
+
+    def snapshot(self, topic):
+        """Latest snapshot for a cell, computing it if never seen"""
+        with self._lock:
+            current = self._snapshots.get(topic)
+        if current is None:
+            current = cell_snapshot(self._context, *parse_cell_id(topic))
+            with self._lock:
+                self._snapshots.setdefault(topic, current)
+        return current
+
+    def refresh(self, topic):
+        new = cell_snapshot(self._context, *parse_cell_id(topic))
+        with self._lock:
+            old = self._snapshots.get(topic)
+            self._snapshots[topic] = new
+        delta = snapshot_delta(old, new)
+        if delta:
+            pubsub.publish(topic, delta)
+        return delta
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            topics = pubsub.topics()
+            with self._lock:
+                for topic in list(self._snapshots):
+                    if topic not in topics:
+                        del self._snapshots[topic]
+            # Refreshes yield the upstream budgets to user requests
+            with background_priority():
+                for topic in topics:
+                    try:
+                        self.refresh(topic)
+                    except Exception as e:
+                        log.error("Live refresh failed for %s: %s", topic, e)
+
+
+live_refresher = LiveRefresher()
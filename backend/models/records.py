@@ -0,0 +1,139 @@
+from dataclasses import dataclass
+from typing import Optional, Union
+
+# ========================================
+# Record types
+# ========================================
+# Frozen, slotted records for the objects built in bulk: forecast hours,
+# group safety entries and the stations held in the station index.
+# Being immutable they can sit in shared caches and be handed to any
+# number of requests. They read like the dicts they replace
+# (record['aqi'], record.get('reason')), and to_dict() is the one way
+# they are serialized (see utils.serialization.record_default).
+
+
+class Record:
+    """Read-only mapping access over a record's fields"""
+
+    __slots__ = ()
+
+    def to_dict(self):
+        return {name: self[name] for name in self.keys()}
+
+    def keys(self):
+        return self.__dataclass_fields__.keys()
+
+    def __getitem__(self, key):
+        if key not in self.__dataclass_fields__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__dataclass_fields__
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__dataclass_fields__ else default
+
+
+@dataclass(frozen=True, slots=True)
+class ForecastPoint(Record):
+    """One hour of forecast_air_quality's predictions"""
+    hour: int
+    time: str
+    aqi: int
+    level: str
+    reason: str
+
+    def to_dict(self):
+        return {'hour': self.hour, 'time': self.time, 'aqi': self.aqi,
+                'level': self.level, 'reason': self.reason}
+
+
+@dataclass(frozen=True, slots=True)
+class GroupSafety(Record):
+    """Safety status and advice for one user group at one AQI band"""
+    status: str
+    recommendation: str
+    icon: str
+    color: str
+
+    def to_dict(self):
+        return {'status': self.status, 'recommendation': self.recommendation,
+                'icon': self.icon, 'color': self.color}
+
+
+@dataclass(frozen=True, slots=True)
+class Measurement(Record):
+    """One pollutant reading at a station"""
+    parameter: str
+    value: float
+
+
+@dataclass(frozen=True, slots=True)
+class Station(Record):
+    """
+    A monitoring station and its latest reading
+
+    Built from the station dicts the station sources return; reading
+    station['measurements'] gives the {parameter: value} dict back.
+    """
+    id: Optional[Union[int, str]]
+    name: Optional[str]
+    lat: float
+    lng: float
+    aqi: Optional[int] = None
+    level: Optional[str] = None
+    timestamp: Optional[str] = None
+    measurements: tuple = ()
+    source: Optional[str] = None
+    stale: bool = False
+
+    @classmethod
+    def from_dict(cls, station):
+        return cls(
+            id=station.get('id'),
+            name=station.get('name'),
+            lat=station['lat'],
+            lng=station['lng'],
+            aqi=station.get('aqi'),
+            level=station.get('level'),
+            timestamp=station.get('timestamp'),
+            measurements=tuple(Measurement(parameter, value) for parameter, value
+                               in (station.get('measurements') or {}).items()),
+            source=station.get('source'),
+            stale=bool(station.get('stale')),
+        )
+
+    def measurement_dict(self):
+        return {m.parameter: m.value for m in self.measurements}
+
+    def keys(self):
+        # 'stale' only appears when set, as in the source dicts
+        fields = self.__dataclass_fields__.keys()
+        return fields if self.stale else [name for name in fields if name != 'stale']
+
+    def __getitem__(self, key):
+        if key == 'measurements':
+            return self.measurement_dict()
+        return Record.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key == 'measurements':
+            return self.measurement_dict()
+        return Record.get(self, key, default)
+
+    def to_dict(self):
+        station = {
+            'id': self.id,
+            'name': self.name,
+            'lat': self.lat,
+            'lng': self.lng,
+            'aqi': self.aqi,
+            'level': self.level,
+            'timestamp': self.timestamp,
+            'measurements': self.measurement_dict(),
+            'source': self.source,
+        }
+        if self.stale:
+            station['stale'] = True
+        return station
@@ -0,0 +1,300 @@
+import math
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from api.connectors import get_source_stations_in_bboxes
+from models.history import record_readings_safely
+from models.records import Station
+
+# ========================================
+# Clustering configuration
+# ========================================
+# At zoom z the world is split into (2^z * GRID_CELLS_PER_TILE) columns,
+# i.e. roughly one cluster per 64px of a 256px map tile.
+GRID_CELLS_PER_TILE = 4
+
+# From this zoom on, individual stations are returned instead of clusters
+CLUSTER_MAX_ZOOM = 12
+MIN_ZOOM = 0
+
+# Hard cap on features per response, whatever the station density
+MAX_FEATURES = 500
+
+# Stations are loaded from the station sources in fixed 1-degree tiles
+LOAD_TILE_DEGREES = 1.0
+LOAD_MAX_TILES = 16
+LOAD_REFRESH_SECONDS = 600
+
+
+def cell_size_degrees(zoom):
+    return 360.0 / (2 ** zoom * GRID_CELLS_PER_TILE)
+
+
+def parse_bbox(value):
+    """Parse 'min_lon,min_lat,max_lon,max_lat' into a tuple of floats"""
+    min_lon, min_lat, max_lon, max_lat = (float(v) for v in value.split(','))
+    if not all(math.isfinite(v) for v in (min_lon, min_lat, max_lon, max_lat)):
+        raise ValueError("bbox coordinates must be finite")
+    if min_lat > max_lat or min_lon > max_lon:
+        raise ValueError("bbox min must not exceed max")
+    return (max(min_lon, -180.0), max(min_lat, -90.0),
+            min(max_lon, 180.0), min(max_lat, 90.0))
+
+
+def snap_bbox(bbox, zoom):
+    """Expand a bbox outward to the cluster grid for zoom"""
+    size = cell_size_degrees(min(zoom, CLUSTER_MAX_ZOOM))
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return (math.floor(min_lon / size) * size, math.floor(min_lat / size) * size,
+            math.ceil(max_lon / size) * size, math.ceil(max_lat / size) * size)
+
+
+def station_key(station):
+    if station.get('id') is not None:
+        return station['id']
+    return (station.get('name'), round(station['lat'], 4), round(station['lng'], 4))
+
+
+class StationIndex:
+    """
+    In-memory table of every station we have seen
+
+    Keeps stations sorted by longitude for bbox range scans, and a
+    per-zoom grid of cluster aggregates. Both are updated in place for
+    just the stations that change in each upsert. Stations are held as
+    immutable Station records, so the lists handed out can be shared
+    without copying.
+    """
+
+    def __init__(self):
+        self._stations = {}
+        self._by_lon = []
+        self._lons = []
+        self._clusters = {zoom: {} for zoom in range(MIN_ZOOM, CLUSTER_MAX_ZOOM)}
+        self._version = 0
+        self._loaded_tiles = {}
+        self._loading_tiles = set()
+        self._lock = threading.RLock()
+
+    @property
+    def version(self):
+        return self._version
+
+    def upsert(self, stations):
+        """Add or update stations (dicts or Station records); returns how many changed"""
+        changed = 0
+        with self._lock:
+            for station in stations:
+                if station.get('lat') is None or station.get('lng') is None:
+                    continue
+                if not isinstance(station, Station):
+                    station = Station.from_dict(station)
+                key = station_key(station)
+                old = self._stations.get(key)
+                if old == station:
+                    continue
+                if old is not None:
+                    self._remove(key, old)
+                self._add(key, station)
+                self._stations[key] = station
+                changed += 1
+            if changed:
+                self._version += 1
+        return changed
+
+    def all_stations(self):
+        with self._lock:
+            return list(self._stations.values())
+
+    def _add(self, key, station):
+        pos = bisect_right(self._lons, station['lng'])
+        self._lons.insert(pos, station['lng'])
+        self._by_lon.insert(pos, station)
+
+        aqi = station.get('aqi')
+        for zoom, grid in self._clusters.items():
+            cell = _cell(station, zoom)
+            agg = grid.get(cell)
+            if agg is None:
+                agg = grid[cell] = {'members': {}, 'lat_sum': 0.0, 'lng_sum': 0.0,
+                                    'aqi_count': 0, 'aqi_sum': 0, 'aqi_max': None, 'aqi_values': {}}
+            agg['members'][key] = station
+            agg['lat_sum'] += station['lat']
+            agg['lng_sum'] += station['lng']
+            if aqi is not None:
+                agg['aqi_count'] += 1
+                agg['aqi_sum'] += aqi
+                agg['aqi_values'][aqi] = agg['aqi_values'].get(aqi, 0) + 1
+                agg['aqi_max'] = aqi if agg['aqi_max'] is None else max(agg['aqi_max'], aqi)
+
+    def _remove(self, key, station):
+        lo = bisect_left(self._lons, station['lng'])
+        hi = bisect_right(self._lons, station['lng'])
+        for pos in range(lo, hi):
+            if self._by_lon[pos] is station:
+                del self._lons[pos]
+                del self._by_lon[pos]
+                break
+
+        aqi = station.get('aqi')
+        for zoom, grid in self._clusters.items():
+            cell = _cell(station, zoom)
+            agg = grid[cell]
+            del agg['members'][key]
+            if not agg['members']:
+                del grid[cell]
+                continue
+            agg['lat_sum'] -= station['lat']
+            agg['lng_sum'] -= station['lng']
+            if aqi is not None:
+                agg['aqi_count'] -= 1
+                agg['aqi_sum'] -= aqi
+                values = agg['aqi_values']
+                values[aqi] -= 1
+                if not values[aqi]:
+                    del values[aqi]
+                    if aqi == agg['aqi_max']:
+                        agg['aqi_max'] = max(values) if values else None
+
+    def stations_in_bbox(self, bbox, limit=MAX_FEATURES):
+        """Individual stations inside bbox (longitude range scan)"""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        with self._lock:
+            lo = bisect_left(self._lons, min_lon)
+            hi = bisect_right(self._lons, max_lon)
+            found = []
+            for station in self._by_lon[lo:hi]:
+                if min_lat <= station['lat'] <= max_lat:
+                    found.append(station)
+                    if len(found) >= limit:
+                        break
+            return found
+
+    def clusters_in_bbox(self, bbox, zoom, limit=MAX_FEATURES):
+        """Precomputed clusters for zoom whose cells intersect bbox"""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        with self._lock:
+            grid = self._clusters[zoom]
+            size = cell_size_degrees(zoom)
+            x0, x1 = int(math.floor(min_lon / size)), int(math.floor(max_lon / size))
+            y0, y1 = int(math.floor(min_lat / size)), int(math.floor(max_lat / size))
+
+            if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(grid):
+                cells = ((x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+                aggregates = (grid[c] for c in cells if c in grid)
+            else:
+                aggregates = (agg for (x, y), agg in grid.items()
+                              if x0 <= x <= x1 and y0 <= y <= y1)
+
+            features = []
+            for agg in aggregates:
+                features.append(_cluster_feature(agg))
+                if len(features) >= limit:
+                    break
+            return features
+
+    def claim_tiles(self, bbox, max_tiles=LOAD_MAX_TILES):
+        """
+        1-degree tiles covering bbox that are missing or expired and not
+        already being loaded; empty if the bbox spans more than max_tiles
+        (zoomed too far out). The caller must release_tiles() them.
+        """
+        min_lon, min_lat, max_lon, max_lat = bbox
+        xs = range(int(math.floor(min_lon / LOAD_TILE_DEGREES)),
+                   int(math.floor(max_lon / LOAD_TILE_DEGREES)) + 1)
+        ys = range(int(math.floor(min_lat / LOAD_TILE_DEGREES)),
+                   int(math.floor(max_lat / LOAD_TILE_DEGREES)) + 1)
+        if len(xs) * len(ys) > max_tiles:
+            return []
+
+        now = time.monotonic()
+        tiles = []
+        with self._lock:
+            for x in xs:
+                for y in ys:
+                    loaded_at = self._loaded_tiles.get((x, y))
+                    if (loaded_at is None or now - loaded_at > LOAD_REFRESH_SECONDS) \
+                            and (x, y) not in self._loading_tiles:
+                        tiles.append((x, y))
+            self._loading_tiles.update(tiles)
+        return tiles
+
+    def release_tiles(self, tiles, loaded):
+        """Hand back claimed tiles, marking them fresh if they were loaded"""
+        now = time.monotonic()
+        with self._lock:
+            self._loading_tiles.difference_update(tiles)
+            if loaded:
+                self._loaded_tiles.update((tile, now) for tile in tiles)
+
+
+def _cell(station, zoom):
+    size = cell_size_degrees(zoom)
+    return (int(math.floor(station['lng'] / size)), int(math.floor(station['lat'] / size)))
+
+
+def _cluster_feature(agg):
+    count = len(agg['members'])
+    if count == 1:
+        station, = agg['members'].values()
+        return dict(station.to_dict(), type='station')
+    return {
+        'type': 'cluster',
+        'lat': agg['lat_sum'] / count,
+        'lng': agg['lng_sum'] / count,
+        'count': count,
+        'max_aqi': agg['aqi_max'],
+        'mean_aqi': round(agg['aqi_sum'] / agg['aqi_count']) if agg['aqi_count'] else None
+    }
+
+
+station_index = StationIndex()
+
+
+def load_stations(bbox):
+    """
+    Fill the index from every station source for the tiles under bbox, if
+    few enough. Tiles are fetched concurrently under one deadline; tiles
+    another request is already loading are left to it.
+    """
+    tiles = station_index.claim_tiles(bbox)
+    if not tiles:
+        return 0
+
+    try:
+        results = get_source_stations_in_bboxes([
+            (x * LOAD_TILE_DEGREES, y * LOAD_TILE_DEGREES,
+             (x + 1) * LOAD_TILE_DEGREES, (y + 1) * LOAD_TILE_DEGREES) for x, y in tiles])
+        stations = [station for tile_stations in results for station in tile_stations]
+        loaded = station_index.upsert(stations)
+        record_readings_safely(stations)
+    except BaseException:
+        station_index.release_tiles(tiles, loaded=False)
+        raise
+    station_index.release_tiles(tiles, loaded=True)
+    return loaded
+
+
+def query_stations(bbox, zoom):
+    """
+    Viewport query: clusters below CLUSTER_MAX_ZOOM, stations above
+
+    The number of features is bounded by the grid, not station density.
+    """
+    zoom = max(MIN_ZOOM, int(zoom))
+    load_stations(bbox)
+
+    if zoom >= CLUSTER_MAX_ZOOM:
+        features = station_index.stations_in_bbox(bbox, limit=MAX_FEATURES + 1)
+        features = [dict(s.to_dict(), type='station') for s in features]
+    else:
+        features = station_index.clusters_in_bbox(bbox, zoom, limit=MAX_FEATURES + 1)
+
+    truncated = len(features) > MAX_FEATURES
+    return {
+        'features': features[:MAX_FEATURES],
+        'clustered': zoom < CLUSTER_MAX_ZOOM,
+        'truncated': truncated,
+        'zoom': zoom
+    }
@@ -1,125 +1,215 @@
+from bisect import bisect_right
+
+import numpy as np
+
+from models.records import GroupSafety
+
+
+# ========================================
+# Group safety
+# ========================================
+# AQI at which each group moves from safe to caution and from caution
+# to unsafe
+SAFETY_THRESHOLDS = {
+    'children': (50, 100),
+    'adults': (100, 150),
+    'seniors': (50, 100),
+    'athletes': (75, 125),
+    'facilities': (45, 90),
+}
+SAFETY_STATUSES = ('safe', 'caution', 'unsafe')
+
+# Per group, the safe, caution and unsafe entries. They are immutable,
+# so every result shares them.
+GROUP_ENTRIES = {
+    # Children (< 12 years)
+    'children': (
+        GroupSafety(
+            status='safe',
+            recommendation='Safe for all outdoor activities',
+            icon='👶',
+            color='#00E400'
+        ),
+        GroupSafety(
+            status='caution',
+            recommendation='Limit outdoor play to 30-45 minutes, watch for symptoms',
+            icon='👶',
+            color='#FFFF00'
+        ),
+        GroupSafety(
+            status='unsafe',
+            recommendation='Keep children indoors, close windows',
+            icon='👶',
+            color='#FF0000'
+        ),
+    ),
+    # Adults (healthy 18-64)
+    'adults': (
+        GroupSafety(
+            status='safe',
+            recommendation='Safe for all outdoor activities',
+            icon='💪',
+            color='#00E400'
+        ),
+        GroupSafety(
+            status='caution',
+            recommendation='Reduce prolonged or heavy outdoor exertion',
+            icon='💪',
+            color='#FFFF00'
+        ),
+        GroupSafety(
+            status='unsafe',
+            recommendation='Avoid outdoor activities',
+            icon='💪',
+            color='#FF0000'
+        ),
+    ),
+    # Seniors (65+)
+    'seniors': (
+        GroupSafety(
+            status='safe',
+            recommendation='Safe for outdoor activities',
+            icon='👴',
+            color='#00E400'
+        ),
+        GroupSafety(
+            status='caution',
+            recommendation='Limit outdoor time, take frequent breaks',
+            icon='👴',
+            color='#FFFF00'
+        ),
+        GroupSafety(
+            status='unsafe',
+            recommendation='Stay indoors, keep windows closed',
+            icon='👴',
+            color='#FF0000'
+        ),
+    ),
+    # Athletes/Practice (schools, sports teams)
+    'athletes': (
+        GroupSafety(
+            status='safe',
+            recommendation='Normal practice and training intensity',
+            icon='⚽',
+            color='#00E400'
+        ),
+        GroupSafety(
+            status='caution',
+            recommendation='Reduce intensity, increase breaks, watch athletes closely',
+            icon='⚽',
+            color='#FFFF00'
+        ),
+        GroupSafety(
+            status='unsafe',
+            recommendation='Cancel outdoor practice, move indoors or reschedule',
+            icon='⚽',
+            color='#FF0000'
+        ),
+    ),
+    # Elderly Care/Childcare Facilities
+    'facilities': (
+        GroupSafety(
+            status='safe',
+            recommendation='Normal outdoor activities permitted',
+            icon='🏥',
+            color='#00E400'
+        ),
+        GroupSafety(
+            status='caution',
+            recommendation='Limit outdoor time for residents, monitor vulnerable individuals',
+            icon='🏥',
+            color='#FFFF00'
+        ),
+        GroupSafety(
+            status='unsafe',
+            recommendation='Keep all residents indoors, seal windows, run air filtration',
+            icon='🏥',
+            color='#FF0000'
+        ),
+    ),
+}
+
+
 def get_safety_by_user_group(aqi):
     """
     Determine safety status and recommendations for different user groups
 
-    Returns dict with status ('safe', 'caution', 'unsafe') and recommendation for each group
+    Returns a GroupSafety (status 'safe', 'caution' or 'unsafe' and a
+    recommendation) for each group
     """
+    return {group: GROUP_ENTRIES[group][bisect_right(bounds, aqi)]
+            for group, bounds in SAFETY_THRESHOLDS.items()}
 
-    groups = {}
 
-    # Children (< 12 years)
-    if aqi < 50:
-        groups['children'] = {
-            'status': 'safe',
-            'recommendation': 'Safe for all outdoor activities',
-            'icon': '👶',
-            'color': '#00E400'
-        }
-    elif aqi < 100:
-        groups['children'] = {
-            'status': 'caution',
-            'recommendation': 'Limit outdoor play to 30-45 minutes, watch for symptoms',
-            'icon': '👶',
-            'color': '#FFFF00'
-        }
-    else:
-        groups['children'] = {
-            'status': 'unsafe',
-            'recommendation': 'Keep children indoors, close windows',
-            'icon': '👶',
-            'color': '#FF0000'
-        }
+# ========================================
+# Vectorized evaluation
+# ========================================
+# The same thresholds applied to whole arrays of AQIs with numpy
+def safety_status_codes(aqi):
+    """Status index (0 safe, 1 caution, 2 unsafe) per group for an array of AQIs"""
+    aqi = np.asarray(aqi, dtype=float)
+    return np.stack([np.searchsorted(bounds, aqi, side='right')
+                     for bounds in SAFETY_THRESHOLDS.values()])
 
-    # Adults (healthy 18-64)
-    if aqi < 100:
-        groups['adults'] = {
-            'status': 'safe',
-            'recommendation': 'Safe for all outdoor activities',
-            'icon': '💪',
-            'color': '#00E400'
-        }
-    elif aqi < 150:
-        groups['adults'] = {
-            'status': 'caution',
-            'recommendation': 'Reduce prolonged or heavy outdoor exertion',
-            'icon': '💪',
-            'color': '#FFFF00'
-        }
-    else:
-        groups['adults'] = {
-            'status': 'unsafe',
-            'recommendation': 'Avoid outdoor activities',
-            'icon': '💪',
-            'color': '#FF0000'
-        }
 
-    # Seniors (65+)
-    if aqi < 50:
-        groups['seniors'] = {
-            'status': 'safe',
-            'recommendation': 'Safe for outdoor activities',
-            'icon': '👴',
-            'color': '#00E400'
-        }
-    elif aqi < 100:
-        groups['seniors'] = {
-            'status': 'caution',
-            'recommendation': 'Limit outdoor time, take frequent breaks',
-            'icon': '👴',
-            'color': '#FFFF00'
-        }
-    else:
-        groups['seniors'] = {
-            'status': 'unsafe',
-            'recommendation': 'Stay indoors, keep windows closed',
-            'icon': '👴',
-            'color': '#FF0000'
-        }
+def safety_reports(current_aqis, forecasts):
+    """
+    Safety for many locations at once: current_aqis[i] with forecasts[i]
+    (a list of {hour, aqi, ...} predictions)
 
-    # Athletes/Practice (schools, sports teams)
-    if aqi < 75:
-        groups['athletes'] = {
-            'status': 'safe',
-            'recommendation': 'Normal practice and training intensity',
-            'icon': '⚽',
-            'color': '#00E400'
-        }
-    elif aqi < 125:
-        groups['athletes'] = {
-            'status': 'caution',
-            'recommendation': 'Reduce intensity, increase breaks, watch athletes closely',
-            'icon': '⚽',
-            'color': '#FFFF00'
-        }
-    else:
-        groups['athletes'] = {
-            'status': 'unsafe',
-            'recommendation': 'Cancel outdoor practice, move indoors or reschedule',
-            'icon': '⚽',
-            'color': '#FF0000'
-        }
+    Every AQI is classified in one vectorized pass. Returns one dict per
+    location with current_safety, forecast_safety and best_worst_times.
+    """
+    groups = list(SAFETY_THRESHOLDS)
+    hours = max([len(f) for f in forecasts] + [1])
 
-    # Elderly Care/Childcare Facilities
-    if aqi < 45:
-        groups['facilities'] = {
-            'status': 'safe',
-            'recommendation': 'Normal outdoor activities permitted',
-            'icon': '🏥',
-            'color': '#00E400'
-        }
-    elif aqi < 90:
-        groups['facilities'] = {
-            'status': 'caution',
-            'recommendation': 'Limit outdoor time for residents, monitor vulnerable individuals',
-            'icon': '🏥',
-            'color': '#FFFF00'
-        }
-    else:
-        groups['facilities'] = {
-            'status': 'unsafe',
-            'recommendation': 'Keep all residents indoors, seal windows, run air filtration',
-            'icon': '🏥',
-            'color': '#FF0000'
-        }
-
-    return groups
+    # Pad the ragged forecasts so best/worst hours are found per row
+    forecast_aqi = np.full((len(forecasts), hours), np.nan)
+    for row, forecast in enumerate(forecasts):
+        forecast_aqi[row, :len(forecast)] = [f['aqi'] for f in forecast]
+    valid = ~np.isnan(forecast_aqi)
+
+    current_codes = safety_status_codes(current_aqis)
+    codes = safety_status_codes(np.nan_to_num(forecast_aqi))
+
+    # Best: lowest AQI among safe hours, else lowest overall; worst: highest
+    lowest = np.where(valid, forecast_aqi, np.inf)
+    safe_lowest = np.where(codes == 0, lowest, np.inf)
+    best = np.where(np.isfinite(safe_lowest).any(axis=2),
+                    safe_lowest.argmin(axis=2), lowest.argmin(axis=1))
+    worst = np.where(valid, forecast_aqi, -np.inf).argmax(axis=1)
+
+    reports = []
+    for row, (current_aqi, forecast) in enumerate(zip(current_aqis, forecasts)):
+        forecast_safety = [{
+            'hour': f['hour'],
+            'aqi': f['aqi'],
+            'groups': {group: GROUP_ENTRIES[group][codes[g, row, h]] for g, group in enumerate(groups)}
+        } for h, f in enumerate(forecast)]
+
+        best_worst_times = {}
+        for g, group in enumerate(groups):
+            if not forecast:
+                # No forecast available
+                best_worst_times[group] = {
+                    'best': {'hour': 0, 'aqi': current_aqi, 'status': 'caution'},
+                    'worst': {'hour': 0, 'aqi': current_aqi, 'status': 'caution'}
+                }
+                continue
+            best_worst_times[group] = {
+                time_name: {
+                    'hour': forecast[h]['hour'],
+                    'aqi': forecast[h]['aqi'],
+                    'status': SAFETY_STATUSES[codes[g, row, h]]
+                }
+                for time_name, h in (('best', int(best[g, row])), ('worst', int(worst[row])))
+            }
+
+        reports.append({
+            'current_aqi': current_aqi,
+            'current_safety': {group: GROUP_ENTRIES[group][current_codes[g, row]]
+                               for g, group in enumerate(groups)},
+            'forecast_safety': forecast_safety,
+            'best_worst_times': best_worst_times
+        })
+    return reports
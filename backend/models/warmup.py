@@ -0,0 +1,180 @@
+import csv
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from utils.data_context import DataContext, cell_traffic
+from utils.geo import cell_id, snap_to_cell
+from utils.log import get_logger
+from utils.rate_limit import background_priority, quota
+
+log = get_logger('warmup')
+
+# ========================================
+# Cache warm-up settings
+# ========================================
+# Cells to keep warm: the configured hot locations plus the busiest
+# cells from recent traffic. AIRCAST_WARMUP_INTERVAL=0 turns off the
+# scheduled refresh (the boot warm-up still runs with preload_app).
+HOT_LOCATIONS_PATH = os.getenv('AIRCAST_HOT_LOCATIONS', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'hot_locations.csv'))
+
+WARMUP_INTERVAL = float(os.getenv('AIRCAST_WARMUP_INTERVAL', '300'))
+WARMUP_TOP_N = int(os.getenv('AIRCAST_WARMUP_TOP_N', '20'))
+
+# The master waits this long for the boot warm-up before forking
+BOOT_WARMUP_TIMEOUT = 30
+
+# Rounds refetch anything past this fraction of its shared TTL, so
+# entries are replaced before requests would see them expire
+WARMUP_FRESHNESS = 0.5
+
+# Parallel warm-up fetches allowed per upstream
+UPSTREAM_CONCURRENCY = {'openaq': 2, 'openweather': 4, 'tempo': 1}
+
+# Raw sources first (in parallel), then what is derived from them
+SOURCE_UPSTREAMS = {
+    'stations': 'openaq',
+    'current_weather': 'openweather',
+    'weather_forecast': 'openweather',
+    'tempo': 'tempo',
+}
+DERIVED_SOURCES = ('forecast',)
+
+
+def load_hot_locations(path=HOT_LOCATIONS_PATH):
+    """Cells of the name,lat,lon rows in the hot locations CSV"""
+    cells = []
+    try:
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                try:
+                    cells.append(snap_to_cell(float(row['lat']), float(row['lon'])))
+                except (KeyError, TypeError, ValueError):
+                    log.warning("Skipping hot location row: %s", row)
+    except OSError as e:
+        log.warning("Could not read hot locations from %s: %s", path, e)
+    return cells
+
+
+class CacheWarmer:
+    """
+    Prefetches every source for the hot cells into the shared cache
+
+    Runs once in the gunicorn master before forking (so workers start
+    warm) and then on a schedule in each worker, refreshing entries
+    ahead of expiry so the request path rarely waits on an upstream.
+    """
+
+    def __init__(self, interval=WARMUP_INTERVAL, top_n=WARMUP_TOP_N):
+        self.interval = interval
+        self.top_n = top_n
+        self.hot_cells = load_hot_locations()
+        # No per-context memo: every fetch goes to the shared cache
+        self._context = DataContext('warmup', ttl=0, freshness=WARMUP_FRESHNESS,
+                                    track_traffic=False)
+        self._limits = {name: threading.Semaphore(n) for name, n in UPSTREAM_CONCURRENCY.items()}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.last_run = None
+
+    def cells(self):
+        """Hot cells followed by the busiest traffic cells, without repeats"""
+        cells = list(dict.fromkeys(self.hot_cells + cell_traffic.top(self.top_n)))
+        cell_traffic.decay()
+        return cells
+
+    def _warm_one(self, source, lat, lon):
+        """'warmed', 'deferred' (upstream budget low) or 'failed'"""
+        upstream = SOURCE_UPSTREAMS.get(source)
+        if upstream is not None and not quota.has_headroom(upstream):
+            return 'deferred'
+        limit = self._limits.get(upstream)
+        try:
+            # Warm-up yields the upstream budgets to user requests
+            with background_priority():
+                if limit is None:
+                    getattr(self._context, source)(lat, lon)
+                else:
+                    with limit:
+                        getattr(self._context, source)(lat, lon)
+            return 'warmed'
+        except Exception as e:
+            log.warning("Warm-up of %s for %s failed: %s", source, cell_id(lat, lon), e)
+            return 'failed'
+
+    def warm(self, cells=None, timeout=None):
+        """
+        Fetch every source for cells (default: self.cells()); returns a
+        summary. Fetches not started within timeout seconds are dropped,
+        but ones in flight are always waited for.
+        """
+        cells = self.cells() if cells is None else cells
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        outcomes = {'warmed': 0, 'deferred': 0, 'failed': 0}
+        skipped = 0
+
+        pool = ThreadPoolExecutor(max_workers=sum(UPSTREAM_CONCURRENCY.values()),
+                                  thread_name_prefix='warmup')
+        try:
+            for phase in (tuple(SOURCE_UPSTREAMS), DERIVED_SOURCES):
+                if deadline is not None and time.monotonic() >= deadline:
+                    skipped += len(cells) * len(phase)
+                    continue
+                futures = [pool.submit(self._warm_one, source, lat, lon)
+                           for lat, lon in cells for source in phase]
+                remaining = None if deadline is None else deadline - time.monotonic()
+                done, pending = wait(futures, timeout=remaining)
+                for future in pending:
+                    skipped += future.cancel()
+                for future in done:
+                    outcomes[future.result()] += 1
+        finally:
+            # Never leave fetches running (and holding cache locks) across a fork
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        summary = dict(outcomes, cells=len(cells), skipped=skipped,
+                       duration_ms=round((time.monotonic() - started) * 1000, 1))
+        with self._lock:
+            self.last_run = dict(summary, finished_at=time.time())
+        log.info("Cache warm-up finished", extra=summary)
+        return summary
+
+    def ensure_started(self, warm_first=False):
+        """Start the scheduled warm-up thread (per worker process)"""
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, args=(warm_first,), name='cache-warmer', daemon=True)
+                self._thread.start()
+
+    def _run(self, warm_first):
+        if warm_first:
+            self._warm_safely()
+        while True:
+            # Jitter keeps workers from refreshing in lockstep
+            time.sleep(self.interval * random.uniform(0.9, 1.1))
+            self._warm_safely()
+
+    def _warm_safely(self):
+        try:
+            self.warm(timeout=self.interval)
+        except Exception as e:
+            log.error("Cache warm-up failed: %s", e)
+
+    def status(self):
+        with self._lock:
+            return {
+                'hot_cells': len(self.hot_cells),
+                'interval': self.interval,
+                'running': self._thread is not None and self._thread.is_alive(),
+                'last_run': self.last_run,
+            }
+
+
+warmer = CacheWarmer()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('AIRCAST_DATA_DIR', tempfile.mkdtemp())
+
+import pytest
+
+from utils import admission as admission_module
+from utils.admission import TIER_COOLDOWN, AdmissionController, Overloaded, RouteLimit
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission_module.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def busy(controller, requests):
+    for _ in range(requests):
+        controller.request_started()
+
+
+def test_tier_follows_utilization(clock):
+    controller = AdmissionController(capacity=4)
+    assert controller.tier() == 0
+    busy(controller, 3)
+    assert controller.tier() == 1
+    busy(controller, 1)
+    assert controller.tier() == 2
+    busy(controller, 10)
+    assert controller.tier() == 2
+
+
+def test_slow_core_routes_raise_the_tier_until_they_age_out(clock):
+    controller = AdmissionController(capacity=4)
+    controller.request_started()
+    controller.request_finished('/api/stations', 3.0)
+    controller.request_started()
+    controller.request_finished('/api/ai-summary', 60.0)  # not a core route
+    assert controller.tier() == 2
+
+    clock[0] += admission_module.LATENCY_WINDOW
+    assert controller.tier() == 2  # held until the cooldown passes
+    clock[0] += TIER_COOLDOWN
+    assert controller.tier() == 1
+    assert controller.tier() == 1  # one step per cooldown
+    clock[0] += TIER_COOLDOWN
+    assert controller.tier() == 0
+
+
+def test_batch_requests_are_shed_at_tier_two(clock):
+    controller = AdmissionController(capacity=1)
+    busy(controller, 1)
+    with pytest.raises(Overloaded, match='degraded'):
+        controller.admit('batch')
+    controller.admit('standard')
+    controller.release('standard')
+
+
+def test_route_limit_queues_then_sheds():
+    limit = RouteLimit('test', concurrency=1, max_queue=1, max_wait=5.0)
+    limit.acquire()
+
+    admitted = threading.Event()
+    waiter = threading.Thread(target=lambda: (limit.acquire(), admitted.set()))
+    waiter.start()
+    while limit.waiting == 0:
+        time.sleep(0.001)
+    with pytest.raises(Overloaded, match='queue_full'):
+        limit.acquire()
+
+    limit.release()
+    waiter.join()
+    assert admitted.is_set() and limit.active == 1
+
+
+def test_route_limit_gives_up_after_max_wait():
+    limit = RouteLimit('test', concurrency=1, max_queue=1, max_wait=0.01)
+    limit.acquire()
+    with pytest.raises(Overloaded, match='queue_timeout'):
+        limit.acquire()
+    assert limit.waiting == 0
+
+
+def test_configure_splits_threads_between_streams_and_load():
+    controller = AdmissionController()
+    controller.configure(threads=8, max_streams=10)
+    assert controller.limits['stream'].concurrency == 4
+    assert controller.capacity == 4
@@ -0,0 +1,92 @@
+import os
+import random
+import tempfile
+from datetime import datetime
+
+os.environ.setdefault('AIRCAST_DATA_DIR', tempfile.mkdtemp())
+
+import numpy as np
+import pytest
+
+from models import forecast
+from models.backtest import WEATHER_FIELDS, evaluate_chunk, run_backtest, summarize
+from models.forecast import FORECAST_MULTIPLIERS, forecast_air_quality
+
+HORIZONS = 6
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """forecast_air_quality issued at clock.hour, without its random variation"""
+    class Clock(datetime):
+        hour_now = 0
+
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2025, 6, 1, cls.hour_now)
+
+    monkeypatch.setattr(forecast, 'datetime', Clock)
+    monkeypatch.setattr(random, 'uniform', lambda a, b: 0.0)
+    return Clock
+
+
+def make_dataset(locations, hours, seed=3):
+    rng = np.random.default_rng(seed)
+    return {
+        'aqi': rng.integers(10, 200, (locations, hours)).astype(float),
+        'wind_speed': rng.uniform(0, 25, (locations, hours)),
+        'temperature': rng.uniform(40, 100, (locations, hours)),
+        'precipitation': np.where(rng.random((locations, hours)) < 0.2, 0.1, 0.0),
+        'humidity': rng.uniform(20, 100, (locations, hours)),
+        'hour': (17 + np.arange(hours)) % 24,  # through rush hour and night
+    }
+
+
+def replayed_errors(dataset, clock):
+    """Errors per horizon from running forecast_air_quality at every origin"""
+    errors = [[] for _ in range(HORIZONS)]
+    locations, hours = dataset['aqi'].shape
+    for row in range(locations):
+        for t in range(hours - 1):
+            if not np.isfinite(dataset['aqi'][row, t]):
+                continue
+            clock.hour_now = int(dataset['hour'][t])
+            weather = [{field: float(dataset[field][row, t + i]) for field in WEATHER_FIELDS}
+                       for i in range(1, min(HORIZONS, hours - 1 - t) + 1)]
+            for point in forecast_air_quality(dataset['aqi'][row, t], weather, HORIZONS)['predictions']:
+                observed = dataset['aqi'][row, t + point.hour]
+                if np.isfinite(observed):
+                    errors[point.hour - 1].append(point.aqi - observed)
+    return [np.array(e) for e in errors]
+
+
+def test_chunk_errors_match_the_live_forecast(clock):
+    dataset = make_dataset(locations=30, hours=24)
+    dataset['aqi'][::4, 10] = np.nan
+    sums = evaluate_chunk(dataset, FORECAST_MULTIPLIERS, HORIZONS)
+
+    for h, errors in enumerate(replayed_errors(dataset, clock)):
+        assert sums['n'][h] == len(errors)
+        # exp(sum of logs) vs a running product can round a prediction
+        # that lands on a whole AQI to the integer below; allow a few
+        assert sums['err'][h] == pytest.approx(errors.sum(), abs=5)
+        assert sums['abs_err'][h] == pytest.approx(np.abs(errors).sum(), abs=5)
+        assert sums['sq_err'][h] == pytest.approx((errors * errors).sum(), rel=1e-3)
+
+
+def test_missing_weather_drops_the_windows_that_span_it():
+    dataset = make_dataset(locations=1, hours=10)
+    dataset['wind_speed'][0, 5] = np.nan
+    sums = evaluate_chunk(dataset, FORECAST_MULTIPLIERS, HORIZONS)
+    # Origins t whose window t+1..t+h avoids hour 5: t >= 5 (and t + h <= 9) or t + h < 5
+    expected = [sum(1 for t in range(10 - h) if not t < 5 <= t + h) for h in range(1, HORIZONS + 1)]
+    assert list(sums['n']) == expected
+
+
+def test_blocks_add_up_to_the_whole(monkeypatch):
+    dataset = make_dataset(locations=50, hours=30)
+    whole = evaluate_chunk(dataset, FORECAST_MULTIPLIERS, HORIZONS)
+    monkeypatch.setattr('models.backtest.CHUNK_LOCATIONS', 16)
+    report = run_backtest(dataset, horizons=HORIZONS, workers=1)
+    assert report['points'] == whole['n'].sum()
+    assert report['horizons'] == summarize(whole)
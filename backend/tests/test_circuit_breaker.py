@@ -0,0 +1,61 @@
+import asyncio
+import os
+import tempfile
+
+os.environ.setdefault('AIRCAST_DATA_DIR', tempfile.mkdtemp())
+
+import pytest
+
+from utils import circuit_breaker
+from utils.circuit_breaker import (HALF_OPEN, CircuitBreaker, CircuitOpenError, call_upstream,
+                                   call_upstream_async)
+from utils.rate_limit import RateLimitExceeded
+
+
+def _throttle(upstream):
+    raise RateLimitExceeded(upstream)
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker('test', min_calls=1, reset_timeout=0)
+    monkeypatch.setitem(circuit_breaker.BREAKERS, 'test', breaker)
+    breaker.record_failure()  # trips OPEN; reset_timeout=0 makes it HALF_OPEN at once
+    assert breaker.state == HALF_OPEN
+    return breaker
+
+
+def test_throttled_half_open_probe_gives_its_slot_back(breaker, monkeypatch):
+    monkeypatch.setattr(circuit_breaker.quota, 'acquire', _throttle)
+    with pytest.raises(RateLimitExceeded):
+        call_upstream('test', 'key', lambda: 'value')
+    assert breaker.state == HALF_OPEN
+
+    monkeypatch.setattr(circuit_breaker.quota, 'acquire', lambda upstream: None)
+    assert call_upstream('test', 'key', lambda: 'value') == ('value', False)
+    assert breaker.state == 'closed'
+
+
+def test_throttled_inside_func_gives_its_slot_back(breaker, monkeypatch):
+    monkeypatch.setattr(circuit_breaker.quota, 'acquire', lambda upstream: None)
+    with pytest.raises(RateLimitExceeded):
+        call_upstream('test', 'key', _throttle, 'test')
+    assert call_upstream('test', 'key', lambda: 'value') == ('value', False)
+
+
+def test_throttled_async_probe_gives_its_slot_back(breaker, monkeypatch):
+    monkeypatch.setattr(circuit_breaker.quota, 'acquire', _throttle)
+
+    async def fetch():
+        return 'value'
+
+    with pytest.raises(RateLimitExceeded):
+        asyncio.run(call_upstream_async('test', 'key', fetch))
+    monkeypatch.setattr(circuit_breaker.quota, 'acquire', lambda upstream: None)
+    assert asyncio.run(call_upstream_async('test', 'key', fetch)) == ('value', False)
+
+
+def test_half_open_admits_one_probe_at_a_time(breaker):
+    assert breaker.allow_request()
+    with pytest.raises(CircuitOpenError):
+        call_upstream('test', 'key', lambda: 'value')
@@ -0,0 +1,57 @@
+import os
+import random
+import tempfile
+
+os.environ.setdefault('AIRCAST_DATA_DIR', tempfile.mkdtemp())
+
+from api.connectors import DEDUP_DISTANCE_KM, merge_stations
+from utils.geo import haversine_km
+
+# ~50 m north, ~200 m north
+NEAR, FAR = 0.00045, 0.0018
+
+
+def station(name, lat, lng, **extra):
+    return dict(name=name, lat=lat, lng=lng, **extra)
+
+
+def names(stations):
+    return [s['name'] for s in stations]
+
+
+def test_duplicates_across_sources_keep_the_earlier_source():
+    openaq = [station('openaq-a', 40.0, -75.0), station('openaq-b', 40.1, -75.0)]
+    airnow = [station('airnow-a', 40.0 + NEAR, -75.0), station('airnow-c', 40.0 + FAR, -75.0)]
+    assert names(merge_stations([openaq, airnow])) == ['openaq-a', 'openaq-b', 'airnow-c']
+
+
+def test_fresh_station_wins_over_a_stale_one():
+    openaq = [station('openaq-a', 40.0, -75.0, stale=True)]
+    airnow = [station('airnow-a', 40.0 + NEAR, -75.0)]
+    assert names(merge_stations([openaq, airnow])) == ['airnow-a']
+
+
+def test_close_stations_of_one_source_are_all_kept():
+    openaq = [station('openaq-a', 40.0, -75.0), station('openaq-b', 40.0 + NEAR, -75.0)]
+    assert names(merge_stations([openaq, []])) == ['openaq-a', 'openaq-b']
+
+
+def test_unlocated_stations_pass_through():
+    openaq = [station('openaq-a', None, None)]
+    airnow = [station('airnow-a', 40.0, -75.0)]
+    assert names(merge_stations([openaq, airnow])) == ['openaq-a', 'airnow-a']
+
+
+def test_matches_pairwise_dedup_at_high_latitude():
+    rng = random.Random(11)
+    sources = [[station(f'{rank}-{i}', 64.0 + rng.uniform(0, 0.01), -147.7 + rng.uniform(0, 0.02))
+                for i in range(40)] for rank in range(3)]
+
+    kept = []
+    for rank, stations in enumerate(sources):
+        for s in stations:
+            if not any(other_rank != rank and
+                       haversine_km(s['lat'], s['lng'], other['lat'], other['lng']) <= DEDUP_DISTANCE_KM
+                       for other_rank, other in kept):
+                kept.append((rank, s))
+    assert names(merge_stations(sources)) == names(s for _, s in kept)
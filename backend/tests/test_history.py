@@ -0,0 +1,72 @@
+import os
+import tempfile
+import time
+
+os.environ.setdefault('AIRCAST_DATA_DIR', tempfile.mkdtemp())
+
+import pytest
+
+from models.history import RETENTION, HistoryStore, HistoryWriter, parse_time, reading_rows
+
+DAY = 86400
+# Yesterday, midnight UTC: recent enough to survive retention
+T0 = int(time.time()) // DAY * DAY - DAY
+
+
+def reading(station_id, ts, aqi, pm25=None):
+    return {'id': station_id, 'source': 'OpenAQ', 'name': f'Station {station_id}', 'aqi': aqi,
+            'timestamp': ts, 'measurements': {'pm25': pm25}, 'lat': 40.0, 'lng': -75.0}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / 'history.sqlite3'))
+
+
+def test_parse_time_accepts_epoch_and_iso():
+    assert parse_time(None, default=7) == 7
+    assert parse_time('1700000000') == 1700000000
+    assert parse_time('2023-11-14T22:13:20Z') == 1700000000
+    assert parse_time('2023-11-14T22:13:20') == 1700000000
+
+
+@pytest.mark.parametrize('value', ['inf', '-inf', 'nan', '1e300', 'yesterday'])
+def test_parse_time_rejects_bad_values(value):
+    with pytest.raises(ValueError):
+        parse_time(value)
+
+
+def test_rollups_aggregate_each_new_reading_once(store):
+    readings = [reading(1, T0 + 60, 40, 10.0), reading(1, T0 + 1800, 60), reading(1, T0 + 3600, 80, 20.0)]
+    assert store.record_readings(readings) == 3
+    assert store.record_readings(readings) == 0  # duplicates leave the rollups alone
+
+    hourly = store.query_readings('openaq:1', T0, T0 + DAY, 'hour')
+    assert [(h['ts'], h['count'], h['aqi_mean'], h['aqi_min'], h['aqi_max'], h['pm25_mean'])
+            for h in hourly] == [(T0, 2, 50.0, 40, 60, 10.0), (T0 + 3600, 1, 80.0, 80, 80, 20.0)]
+
+    daily, = store.query_readings('openaq:1', T0, T0 + DAY, 'day')
+    assert (daily['count'], daily['aqi_mean'], daily['pm25_mean']) == (3, 60.0, 15.0)
+
+
+def test_unrecorded_and_non_finite_readings_are_skipped(store):
+    readings = [dict(reading(1, T0, 50), source='Sample'), dict(reading(2, T0, 50), stale=True),
+                reading(3, T0, float('inf')), reading(4, T0, None)]
+    assert store.record_readings(readings) == 0
+
+
+def test_retention_keeps_rollups_longer_than_raw_rows(store):
+    store.record_readings([reading(1, T0, 50)])
+    store.apply_retention(now=T0 + RETENTION['raw'] + DAY)
+    assert store.query_readings('openaq:1', T0 - DAY, T0 + DAY) == []
+    assert len(store.query_readings('openaq:1', T0 - DAY, T0 + DAY, 'day')) == 1
+
+
+def test_background_writer_applies_queued_writes(store):
+    writer = HistoryWriter(store)
+    writer.submit('readings', *reading_rows([reading(1, T0, 50)]))
+    writer.submit('forecast', '40.00,-75.00', [{'hour': 1, 'aqi': 42}], T0)
+    writer.flush()
+    assert len(store.query_readings('openaq:1', T0, T0)) == 1
+    assert store.query_forecasts('40.00,-75.00', T0, T0 + DAY)[0]['aqi'] == 42
+
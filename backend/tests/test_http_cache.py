@@ -0,0 +1,85 @@
+import os
+import tempfile
+
+os.environ.setdefault('AIRCAST_DATA_DIR', tempfile.mkdtemp())
+
+import pytest
+from flask import Flask, jsonify
+
+from utils import http_cache
+from utils.http_cache import ResponseCache, http_cached
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(http_cache, 'response_cache', ResponseCache())
+    app = Flask(__name__)
+    calls = []
+
+    @app.route('/stations')
+    @http_cached('stations')
+    def stations():
+        calls.append(1)
+        return jsonify({'status': 'success', 'stations': ['x' * 2000]})
+
+    @app.route('/broken')
+    @http_cached('stations')
+    def broken():
+        calls.append(1)
+        return jsonify({'status': 'error', 'message': 'upstream down'})
+
+    client = app.test_client()
+    client.calls = calls
+    return client
+
+
+def test_lru_evicts_oldest_and_expires_entries(monkeypatch):
+    cache = ResponseCache(max_entries=2)
+    cache.put('a', {'expires': float('inf')})
+    cache.put('b', {'expires': float('inf')})
+    cache.get('a')
+    cache.put('c', {'expires': float('inf')})
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+
+    cache.put('old', {'expires': 0})
+    assert cache.get('old') is None
+    assert cache.stats()['entries'] == 1
+
+
+def test_second_request_is_served_from_cache(client):
+    first = client.get('/stations?lat=40.71&lon=-74.0')
+    second = client.get('/stations?lat=40.712&lon=-74.001&session_id=abc')
+    assert first.headers['X-Cache'] == 'MISS'
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.data == first.data
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert 'max-age=600' in second.headers['Cache-Control']
+    assert len(client.calls) == 1
+
+
+def test_matching_etag_answers_304_without_body(client):
+    etag = client.get('/stations').headers['ETag']
+    response = client.get('/stations', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+    response = client.get('/stations', headers={'If-None-Match': '"other"'})
+    assert response.status_code == 200
+
+
+def test_gzip_variant_has_its_own_etag(client):
+    plain = client.get('/stations')
+    gzipped = client.get('/stations', headers={'Accept-Encoding': 'gzip'})
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzipped.headers['ETag'] != plain.headers['ETag']
+    assert client.get('/stations', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': gzipped.headers['ETag']}).status_code == 304
+
+
+def test_error_payloads_are_not_cached(client):
+    for _ in range(2):
+        response = client.get('/broken')
+        assert response.headers['Cache-Control'] == 'no-store'
+    assert len(client.calls) == 2
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from utils.raster import PixelLocator, SummedAreaGrid
+
+RES = 0.1
+
+
+@pytest.fixture
+def swath():
+    rng = np.random.default_rng(7)
+    lat = rng.uniform(30.0, 35.0, (60, 80))
+    lon = rng.uniform(-100.0, -92.0, (60, 80))
+    values = rng.normal(5e15, 1e15, (60, 80))
+    valid = rng.random((60, 80)) > 0.2
+    return lat, lon, values, valid
+
+
+def test_box_stats_match_the_pixels_in_the_covered_cells(swath):
+    lat, lon, values, valid = swath
+    grid = SummedAreaGrid(lat, lon, values, valid, RES, scale=1e15)
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        # Box edges inside cells: the box covers whole cells k0..k1
+        r0, c0 = rng.integers(0, 30), rng.integers(0, 40)
+        r1, c1 = r0 + rng.integers(0, 20), c0 + rng.integers(0, 30)
+        min_lat, max_lat = grid.lat0 + (r0 + 0.5) * RES, grid.lat0 + (r1 + 0.5) * RES
+        min_lon, max_lon = grid.lon0 + (c0 + 0.5) * RES, grid.lon0 + (c1 + 0.5) * RES
+
+        inside = ((lat >= grid.lat0 + r0 * RES) & (lat < grid.lat0 + (r1 + 1) * RES) &
+                  (lon >= grid.lon0 + c0 * RES) & (lon < grid.lon0 + (c1 + 1) * RES))
+        expected = values[inside & valid]
+        stats = grid.box_stats(min_lat, min_lon, max_lat, max_lon)
+
+        assert stats['pixels'] == inside.sum()
+        assert stats['count'] == len(expected)
+        if len(expected):
+            assert stats['mean'] == pytest.approx(expected.mean(), rel=1e-9)
+            assert stats['std'] == pytest.approx(expected.std(), rel=1e-6)
+        else:
+            assert stats['mean'] is None and stats['std'] is None
+
+
+def test_vectorized_queries_agree_with_single_ones(swath):
+    grid = SummedAreaGrid(*swath, RES, scale=1e15)
+    lats, lons = np.array([31.0, 33.3, 34.9]), np.array([-99.0, -95.5, -92.2])
+    many = grid.radii_stats(lats, lons, 15.0)
+    for i, (lat, lon) in enumerate(zip(lats, lons)):
+        one = grid.radius_stats(lat, lon, 15.0)
+        assert one['count'] == many['count'][i]
+        assert one['mean'] == pytest.approx(many['mean'][i])
+
+
+def test_boxes_off_the_grid_are_empty_and_masked_pixels_ignored(swath):
+    lat, lon, values, valid = swath
+    masked = np.ma.masked_array(values, mask=~valid)
+    grid = SummedAreaGrid(lat, lon, masked, np.ones_like(valid), RES, scale=1e15)
+    assert grid.box_stats(0.0, 0.0, 1.0, 1.0) == {'count': 0, 'pixels': 0, 'mean': None, 'std': None}
+
+    everything = grid.box_stats(-90, -180, 90, 180)
+    assert everything['pixels'] == lat.size
+    assert everything['count'] == valid.sum()
+    assert everything['mean'] == pytest.approx(values[valid].mean(), rel=1e-9)
+
+
+def test_swath_without_geolocation_is_rejected():
+    nan = np.full((2, 2), np.nan)
+    with pytest.raises(ValueError):
+        SummedAreaGrid(nan, nan, np.ones((2, 2)), np.ones((2, 2), bool), RES)
+
+
+def brute_nearest(lat, lon, lats, lons):
+    scale = np.cos(np.radians(lats))[:, None]
+    d2 = (lat.ravel()[None, :] - lats[:, None]) ** 2 + ((lon.ravel()[None, :] - lons[:, None]) * scale) ** 2
+    return d2.argmin(axis=1), np.sqrt(d2.min(axis=1))
+
+
+def test_nearest_matches_brute_force(swath):
+    lat, lon, _, _ = swath
+    locator = PixelLocator(lat, lon, RES)
+    rng = np.random.default_rng(3)
+    lats, lons = rng.uniform(30.2, 34.8, 300), rng.uniform(-99.8, -92.2, 300)
+
+    index, distance = locator.nearest(lats, lons)
+    expected_index, expected_distance = brute_nearest(lat, lon, lats, lons)
+    # Exact whenever the nearest pixel is within one cell (the lon side
+    # of a cell is the shorter); otherwise never closer than the truth
+    exact = expected_distance < RES * np.cos(np.radians(lats))
+    assert exact.mean() > 0.9
+    np.testing.assert_array_equal(index[exact], expected_index[exact])
+    np.testing.assert_allclose(distance[exact], expected_distance[exact])
+    assert (distance[~exact] >= expected_distance[~exact]).all()
+
+
+def test_points_far_from_the_swath_get_no_pixel(swath):
+    lat, lon, _, _ = swath
+    index, distance = PixelLocator(lat, lon, RES).nearest([10.0, 32.0], [-95.0, 0.0])
+    assert list(index) == [-1, -1]
+    assert np.isinf(distance).all()
+
+
+def test_in_box_picks_exactly_the_pixels_inside(swath):
+    lat, lon, _, _ = swath
+    locator = PixelLocator(lat, lon, RES)
+    picked = locator.in_box(31.23, -97.61, 32.05, -96.4)
+    expected = np.flatnonzero((lat.ravel() >= 31.23) & (lat.ravel() < 32.05) &
+                              (lon.ravel() >= -97.61) & (lon.ravel() < -96.4))
+    np.testing.assert_array_equal(np.sort(picked), expected)
+    assert len(locator.in_box(0.0, 0.0, 1.0, 1.0)) == 0
+
+
+def test_unlocated_pixels_are_never_picked():
+    lat = np.ma.masked_array([[30.0, 30.1], [30.2, 30.3]], mask=[[False, True], [False, False]])
+    lon = np.array([[-90.0, -90.0], [-90.0, -90.0]])
+    index, _ = PixelLocator(lat, lon, RES).nearest([30.1], [-90.0])
+    assert index[0] in (0, 2)
@@ -0,0 +1,74 @@
+import os
+import tempfile
+from types import SimpleNamespace
+
+os.environ.setdefault('AIRCAST_DATA_DIR', tempfile.mkdtemp())
+
+import pytest
+
+from utils import rate_limit
+from utils.rate_limit import QuotaManager, RateLimitExceeded, background_priority
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Frozen time.time(); time.sleep() records the wait instead of sleeping"""
+    clock = SimpleNamespace(now=1_000_000.0, sleeps=[])
+    monkeypatch.setattr(rate_limit.time, 'time', lambda: clock.now)
+    monkeypatch.setattr(rate_limit.time, 'sleep', clock.sleeps.append)
+    return clock
+
+
+@pytest.fixture
+def quota(tmp_path, clock):
+    return QuotaManager(str(tmp_path / 'quota.sqlite3'), budgets={'up': (1.0, 4)}, enabled=True)
+
+
+def test_burst_then_queue_in_arrival_order_then_refuse(quota, clock):
+    for _ in range(4):
+        quota.acquire('up')
+    assert clock.sleeps == []
+
+    quota.acquire('up')
+    quota.acquire('up')
+    assert clock.sleeps == [1.0, 2.0]
+    with pytest.raises(RateLimitExceeded):
+        quota.acquire('up')  # would wait 3s, past MAX_QUEUE_WAIT
+
+
+def test_tokens_refill_at_rate_up_to_burst(quota, clock):
+    for _ in range(4):
+        quota.acquire('up')
+    assert quota.remaining('up') == 0
+    clock.now += 2.5
+    assert quota.remaining('up') == 2.5
+    clock.now += 60
+    assert quota.remaining('up') == 4
+
+
+def test_background_work_never_waits_and_leaves_the_reserve(quota, clock):
+    with background_priority():
+        for _ in range(3):
+            quota.acquire('up')
+        with pytest.raises(RateLimitExceeded):
+            quota.acquire('up')
+    assert clock.sleeps == []
+    assert not quota.has_headroom('up')
+    quota.acquire('up')  # the reserve is still there for user requests
+
+
+def test_budget_is_shared_through_the_store(quota, tmp_path, clock):
+    other = QuotaManager(str(tmp_path / 'quota.sqlite3'), budgets={'up': (1.0, 4)}, enabled=True)
+    for _ in range(3):
+        quota.acquire('up')
+    assert other.remaining('up') == 1
+
+
+def test_unlimited_upstreams_and_disabled_limiter_pass_through(tmp_path, quota, clock):
+    quota.acquire('elsewhere')
+    assert quota.remaining('elsewhere') is None
+
+    disabled = QuotaManager(str(tmp_path / 'off.sqlite3'), budgets={'up': (1.0, 1)}, enabled=False)
+    for _ in range(5):
+        disabled.acquire('up')
+    assert clock.sleeps == []
@@ -0,0 +1,69 @@
+import os
+import random
+import tempfile
+
+os.environ.setdefault('AIRCAST_DATA_DIR', tempfile.mkdtemp())
+
+import pytest
+
+from models.stations import CLUSTER_MAX_ZOOM, StationIndex, parse_bbox
+
+WORLD = (-180.0, -90.0, 180.0, 90.0)
+
+
+def station(i, rng):
+    return {'id': i, 'name': f's{i}', 'lat': rng.uniform(25, 50), 'lng': rng.uniform(-125, -65),
+            'aqi': rng.choice([None, *range(300)])}
+
+
+def features(index, zoom):
+    def key(f):
+        return (f['type'], round(f['lat'], 6), round(f['lng'], 6), f.get('count'),
+                f.get('max_aqi'), f.get('mean_aqi'), f.get('id'))
+    return sorted(map(key, index.clusters_in_bbox(WORLD, zoom, limit=10 ** 6)))
+
+
+def test_incremental_upserts_match_a_fresh_index():
+    rng = random.Random(2)
+    index = StationIndex()
+    for _ in range(20):
+        index.upsert([station(rng.randrange(400), rng) for _ in range(100)])
+
+    fresh = StationIndex()
+    fresh.upsert(index.all_stations())
+    for zoom in range(CLUSTER_MAX_ZOOM):
+        assert features(index, zoom) == features(fresh, zoom)
+    assert [s['id'] for s in index.stations_in_bbox(WORLD, limit=10 ** 6)] == \
+        [s['id'] for s in fresh.stations_in_bbox(WORLD, limit=10 ** 6)]
+
+
+def test_moving_the_max_station_updates_its_old_cluster():
+    index = StationIndex()
+    index.upsert([{'id': 1, 'lat': 40.0, 'lng': -75.0, 'aqi': 150},
+                  {'id': 2, 'lat': 40.01, 'lng': -75.01, 'aqi': 40},
+                  {'id': 3, 'lat': 40.02, 'lng': -75.02, 'aqi': 60}])
+    cluster, = index.clusters_in_bbox((-76, 39, -74, 41), zoom=4)
+    assert (cluster['count'], cluster['max_aqi'], cluster['mean_aqi']) == (3, 150, 83)
+
+    assert index.upsert([{'id': 1, 'lat': 10.0, 'lng': 10.0, 'aqi': 150}]) == 1
+    cluster, = index.clusters_in_bbox((-76, 39, -74, 41), zoom=4)
+    assert (cluster['count'], cluster['max_aqi'], cluster['mean_aqi']) == (2, 60, 50)
+
+    index.upsert([{'id': 3, 'lat': 10.0, 'lng': 10.1, 'aqi': 60}])
+    single, = index.clusters_in_bbox((-76, 39, -74, 41), zoom=4)
+    assert (single['type'], single['id']) == ('station', 2)
+
+
+def test_unchanged_stations_do_not_bump_the_version():
+    index = StationIndex()
+    rows = [{'id': 1, 'lat': 40.0, 'lng': -75.0, 'aqi': 50}]
+    index.upsert(rows)
+    version = index.version
+    assert index.upsert(rows) == 0
+    assert index.version == version
+
+
+@pytest.mark.parametrize('value', ['1,2,3', 'a,b,c,d', '0,nan,1,1', '-inf,0,1,1', '5,0,1,1'])
+def test_parse_bbox_rejects_bad_input(value):
+    with pytest.raises(ValueError):
+        parse_bbox(value)
@@ -0,0 +1,44 @@
+import random
+
+from models.user_groups import SAFETY_STATUSES, SAFETY_THRESHOLDS, get_safety_by_user_group, safety_reports
+
+
+def expected_best_worst(group, forecast):
+    """best_worst_times for one group, one hour at a time"""
+    status = [get_safety_by_user_group(f['aqi'])[group].status for f in forecast]
+    safe = [h for h, s in enumerate(status) if s == 'safe']
+    best = min(safe or range(len(forecast)), key=lambda h: forecast[h]['aqi'])
+    worst = max(range(len(forecast)), key=lambda h: (forecast[h]['aqi'], -h))
+    return {name: {'hour': forecast[h]['hour'], 'aqi': forecast[h]['aqi'], 'status': status[h]}
+            for name, h in (('best', best), ('worst', worst))}
+
+
+def test_boundaries_follow_the_thresholds():
+    for group, (caution, unsafe) in SAFETY_THRESHOLDS.items():
+        reports = safety_reports([caution - 1, caution, unsafe], [[], [], []])
+        assert [r['current_safety'][group].status for r in reports] == list(SAFETY_STATUSES)
+        # Entries are shared, not rebuilt per result
+        assert reports[0]['current_safety'][group] is get_safety_by_user_group(caution - 1)[group]
+
+
+def test_vectorized_reports_match_the_scalar_rules():
+    rng = random.Random(5)
+    current = [rng.randrange(0, 250) for _ in range(40)]
+    forecasts = [[{'hour': h + 1, 'aqi': rng.randrange(0, 250)} for h in range(rng.randrange(1, 8))]
+                 for _ in current]
+
+    for aqi, forecast, report in zip(current, forecasts, safety_reports(current, forecasts)):
+        assert report['current_aqi'] == aqi
+        assert report['current_safety'] == get_safety_by_user_group(aqi)
+        assert [(f['hour'], f['aqi'], f['groups']) for f in report['forecast_safety']] == \
+            [(f['hour'], f['aqi'], get_safety_by_user_group(f['aqi'])) for f in forecast]
+        for group in SAFETY_THRESHOLDS:
+            assert report['best_worst_times'][group] == expected_best_worst(group, forecast)
+
+
+def test_missing_forecast_falls_back_to_the_current_aqi():
+    report, = safety_reports([80], [[]])
+    assert report['forecast_safety'] == []
+    assert report['best_worst_times']['adults'] == {
+        'best': {'hour': 0, 'aqi': 80, 'status': 'caution'},
+        'worst': {'hour': 0, 'aqi': 80, 'status': 'caution'}}
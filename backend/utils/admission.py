@@ -0,0 +1,244 @@
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from flask import g, jsonify, request
+
+from utils.log import get_logger
+from utils.metrics import ADMISSION_WAIT_SECONDS, DEGRADATION_TIER, REQUESTS_SHED
+
+log = get_logger('admission')
+
+# ========================================
+# Admission control
+# ========================================
+# Routes that hold a worker thread for long (LLM calls, batches, upstream
+# fetches) are admitted through their route class: a concurrency limit
+# plus a bounded queue, past which the request is shed with a 503 rather
+# than left to pile up. Core AQI lookups are never limited.
+#
+# Each worker also tracks its load and picks a degradation tier:
+#   0  normal
+#   1  AI summaries come from cache or a template, not a new generation
+#   2  also TEMPO and forecasts are served from cache only, and batch
+#      requests are shed
+# Tiers go up as soon as load crosses a threshold and step back down one
+# at a time after TIER_COOLDOWN seconds below it.
+
+# route class -> (concurrent requests, queued requests, max queue wait s)
+ROUTE_LIMITS = {
+    'ai': (2, 4, 5.0),
+    'batch': (1, 2, 10.0),
+    'standard': (6, 12, 2.0),
+    # An open /api/stream holds its thread until the client leaves; past
+    # the limit new streams are refused at once (configure() sets it)
+    'stream': (4, 0, 0.0),
+}
+
+# Route classes refused outright from this tier up
+SHED_AT_TIER = {'batch': 2}
+
+# In-flight requests per worker thread, and mean core-route latency (s),
+# at which each tier starts
+TIER_UTILIZATION = (0.75, 1.0)
+TIER_CORE_LATENCY = (1.0, 2.5)
+TIER_COOLDOWN = 15.0
+MAX_TIER = 2
+
+# Core-route latencies older than this don't count towards the load
+LATENCY_WINDOW = 10.0
+
+# Routes whose latency is the health signal (cheap, must stay fast)
+CORE_ROUTES = {'/api/air-quality', '/api/stations', '/api/weather'}
+
+# Long-lived or operational routes that don't count as load
+EXEMPT_ROUTES = {'/api/stream', '/metrics'}
+
+# gunicorn.conf.py threads less stream slots; post_worker_init sets the real value
+DEFAULT_CAPACITY = 8
+
+# At most this share of a worker's threads is held by open streams
+MAX_STREAM_SHARE = 0.5
+
+RETRY_AFTER_SECONDS = 5
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; args[0] is the reason"""
+
+
+class RouteLimit:
+    """Concurrency limit with a bounded, time-limited wait queue"""
+
+    def __init__(self, name, concurrency, max_queue, max_wait):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            if self.active < self.concurrency:
+                self.active += 1
+                return
+            if self.waiting >= self.max_queue:
+                raise Overloaded('queue_full')
+
+            started = time.perf_counter()
+            self.waiting += 1
+            try:
+                admitted = self._cond.wait_for(lambda: self.active < self.concurrency,
+                                               timeout=self.max_wait)
+            finally:
+                self.waiting -= 1
+            ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started, route_class=self.name)
+            if not admitted:
+                raise Overloaded('queue_timeout')
+            self.active += 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def snapshot(self):
+        return {'active': self.active, 'waiting': self.waiting,
+                'concurrency': self.concurrency, 'max_queue': self.max_queue}
+
+
+class AdmissionController:
+    """Per-worker route limits, load tracking and degradation tier"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.limits = {name: RouteLimit(name, *limit) for name, limit in ROUTE_LIMITS.items()}
+        self.in_flight = 0
+        self._latencies = deque(maxlen=200)
+        self._tier = 0
+        self._tier_changed_at = 0.0
+        self._lock = threading.Lock()
+
+    def configure(self, threads, max_streams):
+        """
+        Split a worker's threads between streams and everything else:
+        up to max_streams (and MAX_STREAM_SHARE of the threads) may be
+        held by open streams, and load is measured against the rest
+        """
+        streams = max(1, min(max_streams, int(threads * MAX_STREAM_SHARE)))
+        self.limits['stream'].concurrency = streams
+        self.capacity = max(1, threads - streams)
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, route, elapsed):
+        with self._lock:
+            self.in_flight -= 1
+            if route in CORE_ROUTES:
+                self._latencies.append((time.monotonic(), elapsed))
+
+    def _core_latency(self, now):
+        recent = [elapsed for at, elapsed in self._latencies if now - at < LATENCY_WINDOW]
+        return sum(recent) / len(recent) if recent else 0.0
+
+    def tier(self):
+        """Current degradation tier (0 = normal)"""
+        now = time.monotonic()
+        with self._lock:
+            utilization = self.in_flight / self.capacity
+            latency = self._core_latency(now)
+            target = sum(1 for u, l in zip(TIER_UTILIZATION, TIER_CORE_LATENCY)
+                         if utilization >= u or latency >= l)
+            target = min(target, MAX_TIER)
+
+            if target > self._tier:
+                log.warning("Degrading to tier %d", target, extra={
+                    'in_flight': self.in_flight, 'core_latency_ms': round(latency * 1000, 1)})
+                self._tier, self._tier_changed_at = target, now
+            elif target < self._tier and now - self._tier_changed_at >= TIER_COOLDOWN:
+                self._tier, self._tier_changed_at = self._tier - 1, now
+                log.info("Recovering to tier %d", self._tier)
+            DEGRADATION_TIER.set(self._tier)
+            return self._tier
+
+    def admit(self, route_class):
+        """Take a slot in route_class or raise Overloaded"""
+        shed_at = SHED_AT_TIER.get(route_class)
+        if shed_at is not None and self.tier() >= shed_at:
+            raise Overloaded('degraded')
+        self.limits[route_class].acquire()
+
+    def release(self, route_class):
+        self.limits[route_class].release()
+
+    def status(self):
+        return {
+            'tier': self.tier(),
+            'in_flight': self.in_flight,
+            'capacity': self.capacity,
+            'routes': {name: limit.snapshot() for name, limit in self.limits.items()}
+        }
+
+
+admission = AdmissionController()
+
+
+def current_tier():
+    return admission.tier()
+
+
+def admission_limited(route_class):
+    """
+    Admit the view through route_class, answering 503 when shed
+
+    Goes under @http_cached so cached responses never wait for a slot.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                admission.admit(route_class)
+            except Overloaded as e:
+                REQUESTS_SHED.inc(route_class=route_class, reason=e.args[0])
+                log.warning("Shed request", extra={'route': request.path, 'reason': e.args[0]})
+                response = jsonify({"status": "error", "message": "Server busy, please retry shortly"})
+                response.status_code = 503
+                response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+                return response
+            # Streamed responses keep the slot until the stream ends
+            g.setdefault('admitted', []).append(route_class)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    """Track in-flight load and release route slots when requests end"""
+
+    @app.before_request
+    def _track_request():
+        if request.path.startswith('/api/') and request.url_rule is not None \
+                and request.url_rule.rule not in EXEMPT_ROUTES:
+            g.admission_started = time.perf_counter()
+            admission.request_started()
+
+    @app.after_request
+    def _tier_header(response):
+        if g.get('admission_started') is not None:
+            tier = admission.tier()
+            if tier:
+                response.headers['X-Degradation-Tier'] = str(tier)
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        for route_class in g.pop('admitted', []):
+            admission.release(route_class)
+        started = g.pop('admission_started', None)
+        if started is not None:
+            admission.request_finished(request.url_rule.rule, time.perf_counter() - started)
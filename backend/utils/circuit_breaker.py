@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from utils.log import get_logger
+from utils.metrics import record_upstream
+from utils.rate_limit import RateLimitExceeded, quota
+
+log = get_logger('circuit_breaker')
+
+# ========================================
+# Circuit breaker states
+# ========================================
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# How many last-known-good values to keep per upstream
+LAST_KNOWN_GOOD_SIZE = 512
+
+
+class CircuitOpenError(Exception):
+    """Raised when an upstream breaker is open and nothing is cached"""
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker for a single upstream
+
+    Trips OPEN when the failure rate over the last `window_size` calls
+    reaches `failure_threshold` (once at least `min_calls` were made).
+    After `reset_timeout` seconds it goes HALF_OPEN and lets a limited
+    number of probe calls through; a successful probe closes it again.
+    """
+
+    def __init__(self, name, failure_threshold=0.5, window_size=20,
+                 min_calls=5, reset_timeout=30, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._outcomes = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+
+        self._last_known_good = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probes_in_flight = 0
+        log.warning("Circuit breaker '%s' OPEN", self.name)
+
+    def allow_request(self):
+        """Return True if a call to the upstream may proceed"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_max_calls:
+                self._probes_in_flight += 1
+                return True
+            return False
+
+    def release(self):
+        """Give back the slot of a call that ended with no outcome (throttled, cancelled)"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    def record_success(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._state = CLOSED
+                self._outcomes.clear()
+                log.info("Circuit breaker '%s' CLOSED", self.name)
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trip()
+                return
+            self._outcomes.append(False)
+            if self._state == CLOSED and len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.failure_threshold:
+                    self._trip()
+
+    def remember(self, key, value):
+        """Store a last-known-good value for key"""
+        if key is None:
+            return
+        with self._cache_lock:
+            self._last_known_good[key] = (value, time.time())
+            self._last_known_good.move_to_end(key)
+            while len(self._last_known_good) > LAST_KNOWN_GOOD_SIZE:
+                self._last_known_good.popitem(last=False)
+
+    def recall(self, key):
+        """Return (value, stored_at) for key, or None"""
+        if key is None:
+            return None
+        with self._cache_lock:
+            return self._last_known_good.get(key)
+
+    def snapshot(self):
+        """Breaker status for diagnostics"""
+        with self._lock:
+            self._maybe_half_open()
+            calls = len(self._outcomes)
+            failures = self._outcomes.count(False)
+            return {
+                'name': self.name,
+                'state': self._state,
+                'calls_in_window': calls,
+                'failure_rate': round(failures / calls, 2) if calls else 0.0,
+                'cached_values': len(self._last_known_good)
+            }
+
+
+# ========================================
+# One breaker per upstream
+# ========================================
+BREAKERS = {
+    'openaq': CircuitBreaker('openaq'),
+    'openweather': CircuitBreaker('openweather'),
+    'tempo': CircuitBreaker('tempo', min_calls=2, reset_timeout=120),
+    'openai': CircuitBreaker('openai', min_calls=3, reset_timeout=60),
+    'opencage': CircuitBreaker('opencage', min_calls=3, reset_timeout=60),
+    'airnow': CircuitBreaker('airnow', min_calls=3, reset_timeout=60),
+    'purpleair': CircuitBreaker('purpleair', min_calls=3, reset_timeout=60),
+}
+
+
+def get_breaker(upstream):
+    return BREAKERS[upstream]
+
+
+def mark_stale(value, stored_at=None):
+    """Copy a cached value and flag it as stale"""
+    if isinstance(value, dict):
+        stale = dict(value)
+        stale['stale'] = True
+        if stored_at is not None:
+            stale['cached_at'] = stored_at
+        return stale
+    if isinstance(value, list):
+        return [mark_stale(item, stored_at) for item in value]
+    return value
+
+
+def last_known_good(upstream, cache_key):
+    """Stale copy of the last good value for cache_key, or None"""
+    cached = get_breaker(upstream).recall(cache_key)
+    if cached is None:
+        return None
+    value, stored_at = cached
+    return mark_stale(value, stored_at)
+
+
+def call_upstream(upstream, cache_key, func, *args, **kwargs):
+    """
+    Call func through the upstream's circuit breaker
+
+    Returns (value, stale). When the breaker is open, the request budget
+    is exhausted, or the call fails, the last-known-good value for
+    cache_key is returned with stale=True instead of waiting on the
+    upstream. Raises CircuitOpenError, RateLimitExceeded (or the original
+    exception) when there is nothing cached to fall back to.
+
+    The call itself takes one token from the upstream's shared budget;
+    func takes its own (quota.acquire) for any further requests it makes.
+    """
+    breaker = get_breaker(upstream)
+
+    if not breaker.allow_request():
+        return _circuit_open(upstream, cache_key)
+
+    started = time.perf_counter()
+    try:
+        quota.acquire(upstream)
+        value = func(*args, **kwargs)
+    except RateLimitExceeded as e:
+        return _throttled(upstream, cache_key, e)
+    except Exception as e:
+        return _failed(upstream, cache_key, started, e)
+
+    return _succeeded(upstream, cache_key, started, value)
+
+
+async def call_upstream_async(upstream, cache_key, func, *args, **kwargs):
+    """
+    call_upstream for a coroutine function, awaited on an event loop
+
+    Same breaker, budget and last-known-good handling. The budget check
+    (which may queue for a token) runs in a worker thread so it never
+    blocks the loop.
+    """
+    breaker = get_breaker(upstream)
+
+    if not breaker.allow_request():
+        return _circuit_open(upstream, cache_key)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(quota.acquire, upstream)
+        value = await func(*args, **kwargs)
+    except RateLimitExceeded as e:
+        return _throttled(upstream, cache_key, e)
+    except asyncio.CancelledError:
+        # A source cut off at the hub's deadline says nothing either way
+        breaker.release()
+        raise
+    except Exception as e:
+        return _failed(upstream, cache_key, started, e)
+
+    return _succeeded(upstream, cache_key, started, value)
+
+
+def _circuit_open(upstream, cache_key):
+    cached = last_known_good(upstream, cache_key)
+    if cached is not None:
+        return cached, True
+    raise CircuitOpenError(f"{upstream} circuit is open")
+
+
+def _throttled(upstream, cache_key, error):
+    # Our own throttling says nothing about the upstream's health, but a
+    # half-open probe slot it took must be given back
+    get_breaker(upstream).release()
+    cached = last_known_good(upstream, cache_key)
+    if cached is not None:
+        return cached, True
+    raise error
+
+
+def _failed(upstream, cache_key, started, error):
+    get_breaker(upstream).record_failure()
+    record_upstream(upstream, time.perf_counter() - started, 'error')
+    log.warning("Upstream call failed", extra={
+        'upstream': upstream, 'ms': round((time.perf_counter() - started) * 1000, 1),
+        'error': str(error)})
+    cached = last_known_good(upstream, cache_key)
+    if cached is not None:
+        return cached, True
+    raise error
+
+
+def _succeeded(upstream, cache_key, started, value):
+    breaker = get_breaker(upstream)
+    breaker.record_success()
+    record_upstream(upstream, time.perf_counter() - started, 'ok')
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Upstream call", extra={
+            'upstream': upstream, 'ms': round((time.perf_counter() - started) * 1000, 1)})
+    breaker.remember(cache_key, value)
+    return value, False
+
+
+def breaker_status():
+    """Status of every upstream breaker"""
+    return [breaker.snapshot() for breaker in BREAKERS.values()]
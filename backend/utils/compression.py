@@ -0,0 +1,92 @@
+import gzip
+import mimetypes
+import os
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+# Level used for on-the-fly JSON compression (build time uses 9)
+JSON_GZIP_LEVEL = 6
+
+# Non-JSON API payload types that still compress well
+COMPRESSIBLE_MIMETYPES = {'application/msgpack'}
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Precompressed variant suffixes in order of preference
+ENCODING_SUFFIXES = [('br', '.br'), ('gzip', '.gz')]
+
+
+def gzip_bytes(data, level=JSON_GZIP_LEVEL):
+    """Deterministic gzip (mtime=0) so equal input gives equal output"""
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def brotli_bytes(data):
+    return brotli.compress(data, quality=11)
+
+
+def accepts_encoding(encoding):
+    """True if the current request accepts the content coding"""
+    return request.accept_encodings[encoding] > 0
+
+
+def compress_json_response(response):
+    """
+    after_request hook: gzip JSON (and other API payload) bodies for
+    clients that accept it
+
+    Responses that are already encoded, streamed or served from files
+    are left alone.
+    """
+    if (not (response.is_json or response.mimetype in COMPRESSIBLE_MIMETYPES)
+            or response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if not accepts_encoding('gzip'):
+        return response
+
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+
+    response.set_data(gzip_bytes(body))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def send_precompressed(directory, path, immutable=False):
+    """
+    Serve a file from directory, picking a .br/.gz sibling when the
+    client accepts it; falls back to the plain file
+    """
+    response = None
+    for encoding, suffix in ENCODING_SUFFIXES:
+        if accepts_encoding(encoding) and os.path.isfile(os.path.join(directory, path + suffix)):
+            response = send_from_directory(directory, path + suffix)
+            response.headers['Content-Encoding'] = encoding
+            # Keep the original file's type, not application/gzip
+            response.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            break
+
+    if response is None:
+        response = send_from_directory(directory, path)
+
+    response.vary.add('Accept-Encoding')
+    if immutable:
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
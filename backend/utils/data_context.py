@@ -0,0 +1,423 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from api.connectors import get_station_measurements
+from api.tempo import get_tempo_value_at_location
+from api.weather import generate_fallback_forecast, get_current_weather, get_weather_forecast
+from models.forecast import forecast_air_quality, forecast_for_stations
+from models.history import record_forecast_safely, record_readings_safely, record_weather_safely
+from models.stations import station_index
+from utils.admission import current_tier
+from utils.geo import cell_id, snap_to_cell
+from utils.metrics import count_cache, span
+from utils.rate_limit import is_background
+
+# How long a fetched source stays reusable within one session (seconds),
+# and how many fetches a session keeps (least recently used go first)
+DATA_CONTEXT_TTL = 60
+DATA_CONTEXT_MAX_ENTRIES = 256
+
+# Idle sessions are dropped after this long, oldest first past the cap
+SESSION_IDLE_TIMEOUT = 15 * 60
+MAX_SESSIONS = 1000
+
+DEFAULT_AQI = 65
+
+# How long a fetch stays reusable across sessions in this process
+# (seconds). Degraded values (sample data, fallbacks, stale replays) are
+# shared only briefly so an outage doesn't pin them.
+SHARED_TTL = {
+    'stations': 300,
+    'current_weather': 600,
+    'weather_forecast': 1800,
+    'tempo': 1800,
+    'forecast': 600,
+}
+DEGRADED_TTL = DATA_CONTEXT_TTL
+SHARED_MAX_ENTRIES = 20000
+
+# Under admission tier 2 these are only served from the shared cache;
+# a miss gets DEFERRED_VALUES (or, for derived sources, is computed from
+# cached inputs) and is not stored
+CACHED_ONLY_SOURCES = ('tempo', 'weather_forecast', 'forecast')
+CACHED_ONLY_TIER = 2
+
+# Cells tracked for traffic-based warm-up
+TRAFFIC_MAX_CELLS = 5000
+
+
+def is_degraded(value):
+    """True for sample, fallback, stale or unavailable source values"""
+    if isinstance(value, list):
+        return bool(value) and is_degraded(value[0])
+    if not isinstance(value, dict):
+        return False
+    return bool(value.get('stale') or value.get('fallback')
+                or value.get('source') == 'Sample Data'
+                or value.get('available') is False)
+
+
+class SharedSourceCache:
+    """
+    Process-wide (source, cell, args) -> value cache behind every DataContext
+
+    A session that misses its own memo reuses any other session's (or
+    the warm-up's) fetch of the same cell, and concurrent misses for one
+    key across sessions share a single upstream call.
+    """
+
+    def __init__(self, ttl=SHARED_TTL, max_entries=SHARED_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, key, freshness):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, fetched_at, ttl = entry
+        if time.monotonic() - fetched_at < ttl * freshness:
+            return entry
+        return None
+
+    def get_or_load(self, key, load, freshness=1.0):
+        """
+        Cached value for key, or load() it (once across threads)
+
+        freshness is the fraction of the TTL an entry may have used and
+        still be reused: 1.0 for requests, lower to refresh ahead of
+        expiry, 0 to always refetch.
+        """
+        with self._lock:
+            entry = self._fresh(key, freshness)
+            if entry is None:
+                lock = self._key_locks.setdefault(key, threading.Lock())
+        if entry is not None:
+            self._count(True)
+            return entry[0]
+
+        with lock:
+            try:
+                return self._load(key, load, freshness)
+            finally:
+                # A load that stored nothing (it failed, or was a background
+                # fallback) must not leave its lock behind
+                with self._lock:
+                    if key not in self._entries and self._key_locks.get(key) is lock:
+                        del self._key_locks[key]
+
+    def _load(self, key, load, freshness):
+        with self._lock:
+            entry = self._fresh(key, freshness)
+        if entry is not None:
+            self._count(True)
+            return entry[0]
+        self._count(False)
+        value = load()
+        if is_degraded(value):
+            with self._lock:
+                entry = self._entries.get(key)
+            # A fallback never replaces a good value that hasn't expired,
+            # and background refreshes don't cache fallbacks at all
+            if entry is not None and not is_degraded(entry[0]) and \
+                    time.monotonic() - entry[1] < entry[2]:
+                return entry[0]
+            if is_background():
+                return value
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        ttl = DEGRADED_TTL if is_degraded(value) else self.ttl.get(key[0], DATA_CONTEXT_TTL)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic(), ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._key_locks.pop(evicted, None)
+
+    def peek(self, key):
+        """Cached value for key at any age, or None; never loads"""
+        with self._lock:
+            entry = self._entries.get(key)
+        self._count(entry is not None)
+        return None if entry is None else entry[0]
+
+    def age(self, key):
+        """Seconds since key was fetched, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return None if entry is None else time.monotonic() - entry[1]
+
+    def _count(self, hit):
+        count_cache('shared_source', hit)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+shared_cache = SharedSourceCache()
+
+
+class CellTraffic:
+    """Decaying per-cell request counts, for warming the busiest cells"""
+
+    def __init__(self, max_cells=TRAFFIC_MAX_CELLS):
+        self.max_cells = max_cells
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, cell):
+        with self._lock:
+            self._counts[cell] = self._counts.get(cell, 0.0) + 1.0
+
+    def top(self, n):
+        with self._lock:
+            return sorted(self._counts, key=self._counts.get, reverse=True)[:n]
+
+    def decay(self, factor=0.5):
+        """Age the counts so the ranking follows recent traffic"""
+        with self._lock:
+            self._counts = {cell: count * factor for cell, count in self._counts.items()
+                            if count * factor >= 0.05}
+            if len(self._counts) > self.max_cells:
+                keep = sorted(self._counts, key=self._counts.get, reverse=True)[:self.max_cells]
+                self._counts = {cell: self._counts[cell] for cell in keep}
+
+
+cell_traffic = CellTraffic()
+
+
+def _deferred_tempo(lat, lon):
+    return {
+        'no2_column': None,
+        'aqi': None,
+        'latitude': lat,
+        'longitude': lon,
+        'source': 'NASA TEMPO (Deferred - server busy)',
+        'available': False,
+        'freshness': None,
+        'metadata': None
+    }
+
+
+DEFERRED_VALUES = {
+    'tempo': _deferred_tempo,
+    'weather_forecast': lambda lat, lon: generate_fallback_forecast(),
+}
+
+
+def _reset_after_fork():
+    # A lock held by another thread at fork time would never be released
+    shared_cache._lock = threading.Lock()
+    shared_cache._key_locks = {}
+    cell_traffic._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class DataContext:
+    """
+    Session-scoped memo of upstream fetches
+
+    Every source is fetched at most once per (source, cell) within
+    DATA_CONTEXT_TTL, so the overlapping calls a page load or chat
+    conversation makes reuse a single upstream round trip. Concurrent
+    requests for the same key wait on the first fetch instead of
+    starting their own.
+    """
+
+    def __init__(self, session_id, ttl=DATA_CONTEXT_TTL, freshness=1.0, track_traffic=True,
+                 max_entries=DATA_CONTEXT_MAX_ENTRIES):
+        self.session_id = session_id
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Shared-cache freshness (see SharedSourceCache.get_or_load);
+        # background refreshers lower it to refetch ahead of expiry
+        self.freshness = freshness
+        self.track_traffic = track_traffic
+        self.last_used = time.monotonic()
+        self._memo = OrderedDict()
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key):
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._memo.get(key)
+            if entry and time.monotonic() - entry[1] < self.ttl:
+                self._memo.move_to_end(key)
+                return entry
+        return None
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memo[key] = (value, time.monotonic())
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.max_entries:
+                evicted, _ = self._memo.popitem(last=False)
+                self._key_locks.pop(evicted, None)
+
+    def fetch(self, source, lat, lon, loader, *args):
+        """Return loader(cell_lat, cell_lon, *args), memoized by (source, cell)"""
+        cell = snap_to_cell(lat, lon)
+        key = (source, cell) + args
+        self.last_used = time.monotonic()
+
+        entry = self._lookup(key)
+        if entry:
+            count_cache('data_context', True)
+            return entry[0]
+
+        if source in CACHED_ONLY_SOURCES and current_tier() >= CACHED_ONLY_TIER:
+            value = shared_cache.peek(key)
+            if value is not None:
+                return value
+            deferred = DEFERRED_VALUES.get(source)
+            return deferred(*cell) if deferred else loader(cell[0], cell[1], *args)
+
+        with self._key_lock(key):
+            entry = self._lookup(key)
+            count_cache('data_context', entry is not None)
+            if entry:
+                return entry[0]
+            if self.track_traffic:
+                cell_traffic.record(cell)
+
+            def load():
+                with span(source):
+                    return loader(cell[0], cell[1], *args)
+
+            value = shared_cache.get_or_load(key, load, self.freshness)
+            self._remember(key, value)
+            return value
+
+    # ========================================
+    # Sources
+    # ========================================
+    def stations(self, lat, lon, radius_km=25):
+        def load(cell_lat, cell_lon, radius):
+            locations = get_station_measurements(cell_lat, cell_lon, radius_km=radius)
+            # Every fetch also feeds the viewport station index
+            station_index.upsert([s for s in locations if s.get('source') != 'Sample Data'])
+            record_readings_safely(locations)
+            return locations
+        return self.fetch('stations', lat, lon, load, radius_km)
+
+    def current_weather(self, lat, lon):
+        def load(cell_lat, cell_lon):
+            weather = get_current_weather(cell_lat, cell_lon)
+            record_weather_safely(cell_lat, cell_lon, weather)
+            return weather
+        return self.fetch('current_weather', lat, lon, load)
+
+    def weather_forecast(self, lat, lon):
+        return self.fetch('weather_forecast', lat, lon, get_weather_forecast)
+
+    def tempo(self, lat, lon):
+        return self.fetch('tempo', lat, lon, get_tempo_value_at_location)
+
+    def current_aqi(self, lat, lon):
+        locations = self.stations(lat, lon)
+        return locations[0]['aqi'] if locations else DEFAULT_AQI
+
+    def forecast(self, lat, lon, hours_ahead=6):
+        """AQI forecast for a cell, built from the memoized inputs"""
+        def build(cell_lat, cell_lon, hours):
+            weather_data = self.weather_forecast(cell_lat, cell_lon)
+            result = forecast_air_quality(
+                self.current_aqi(cell_lat, cell_lon),
+                weather_data[:hours] if weather_data else [],
+                hours_ahead=hours)
+            record_forecast_safely(cell_id(cell_lat, cell_lon), result.get('predictions', []))
+            return result
+        return self.fetch('forecast', lat, lon, build, hours_ahead)
+
+    def with_forecasts(self, stations):
+        """Stations with bundled short-horizon forecasts (shared weather)"""
+        return forecast_for_stations(stations, self.weather_forecast)
+
+    def location_summary(self, lat, lon):
+        """Everything the AI endpoints need to describe a location"""
+        locations = self.stations(lat, lon)
+        nearest = locations[0] if locations else {}
+        forecast_result = self.forecast(lat, lon)
+
+        return {
+            'current_aqi': nearest.get('aqi', DEFAULT_AQI),
+            'measurements': nearest.get('measurements', {}),
+            'location_name': nearest.get('name', 'your area'),
+            'weather_forecast': self.weather_forecast(lat, lon),
+            'current_weather': self.current_weather(lat, lon),
+            'forecast': forecast_result.get('predictions', []),
+            'tempo': self.tempo(lat, lon)
+        }
+
+
+# ========================================
+# Session registry
+# ========================================
+_contexts = OrderedDict()
+_contexts_lock = threading.Lock()
+
+
+def get_data_context(session_id):
+    """Return the DataContext for a session, creating it if needed"""
+    now = time.monotonic()
+    with _contexts_lock:
+        context = _contexts.get(session_id)
+        if context is None:
+            context = _contexts[session_id] = DataContext(session_id)
+        _contexts.move_to_end(session_id)
+
+        while _contexts:
+            oldest_id, oldest = next(iter(_contexts.items()))
+            if len(_contexts) <= MAX_SESSIONS and now - oldest.last_used < SESSION_IDLE_TIMEOUT:
+                break
+            if oldest is context:
+                break
+            del _contexts[oldest_id]
+
+        return context
+
+
+def get_request_context():
+    """
+    DataContext for the current Flask request
+
+    The session comes from the X-Session-Id header, a session_id query
+    or JSON field, or falls back to the client address.
+    """
+    from flask import g, request
+
+    context = g.get('data_context')
+    if context is None:
+        body = request.get_json(silent=True) if request.is_json else None
+        if not isinstance(body, dict):
+            body = {}
+        session_id = (request.headers.get('X-Session-Id')
+                      or request.args.get('session_id')
+                      or body.get('session_id')
+                      or request.remote_addr
+                      or 'default')
+        context = g.data_context = get_data_context(session_id)
+    return context
@@ -0,0 +1,11 @@
+from dotenv import load_dotenv
+
+_loaded = False
+
+
+def load_env():
+    """Load backend/.env into os.environ once per process"""
+    global _loaded
+    if not _loaded:
+        load_dotenv()
+        _loaded = True
@@ -0,0 +1,43 @@
+import math
+
+# Grid size used to snap coordinates into shared cache cells.
+# 2 decimal places is roughly a 1.1 km cell at mid latitudes.
+CELL_PRECISION = 2
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def snap_to_cell(lat, lon, precision=CELL_PRECISION):
+    """Snap a coordinate to the center of its cache cell"""
+    return round(float(lat), precision), round(float(lon), precision)
+
+
+def cell_id(lat, lon, precision=CELL_PRECISION):
+    """Stable string id for the cell containing a coordinate"""
+    cell_lat, cell_lon = snap_to_cell(lat, lon, precision)
+    return f"{cell_lat:.{precision}f},{cell_lon:.{precision}f}"
+
+
+def parse_cell_id(value):
+    """Parse a cell id back into (lat, lon)"""
+    lat, lon = value.split(',')
+    return float(lat), float(lon)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometers"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * \
+        math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def radius_bbox(lat, lon, radius_km):
+    """(min_lon, min_lat, max_lon, max_lat) enclosing a circle around a point"""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return (max(lon - dlon, -180.0), max(lat - dlat, -90.0),
+            min(lon + dlon, 180.0), min(lat + dlat, 90.0))
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import make_response, request
+
+from utils.admission import current_tier
+from utils.compression import MIN_COMPRESS_SIZE, accepts_encoding, gzip_bytes
+from utils.geo import snap_to_cell
+from utils.metrics import count_cache
+from utils.serialization import negotiate_format
+
+# ========================================
+# Per-route cache policies
+# ========================================
+# max_age is how long browsers/CDNs may reuse a response, swr how much
+# longer they may serve it while revalidating in the background.
+# A callable max_age is evaluated per request.
+
+FORECAST_RUN_HOURS = 3  # OpenWeather issues 3-hourly forecast steps
+
+
+def seconds_until_next_forecast_run():
+    """Seconds until the next forecast model run boundary (UTC)"""
+    period = FORECAST_RUN_HOURS * 3600
+    return max(60, int(period - time.time() % period))
+
+
+CACHE_POLICIES = {
+    'air-quality': {'max_age': 600, 'swr': 300},          # OpenAQ ~10 min
+    'weather': {'max_age': 600, 'swr': 600},
+    'tempo': {'max_age': 3600, 'swr': 3600},              # hourly granules
+    'forecast': {'max_age': seconds_until_next_forecast_run, 'swr': 1800},
+    'safety-groups': {'max_age': seconds_until_next_forecast_run, 'swr': 1800},
+    'ai-summary': {'max_age': 900, 'swr': 900},
+    'stations': {'max_age': 600, 'swr': 300},
+    'heatmap': {'max_age': 600, 'swr': 600},
+    'history': {'max_age': 300, 'swr': 300},
+    'geocode': {'max_age': 86400, 'swr': 86400},
+}
+
+# Stale (circuit breaker) and degraded (overload) payloads are only
+# reused briefly
+STALE_MAX_AGE = 30
+
+# Query args that never change the payload
+IGNORED_ARGS = {'session_id', '_'}
+
+RESPONSE_CACHE_SIZE = 2048
+
+
+# ========================================
+# Shared server-side response cache
+# ========================================
+class ResponseCache:
+    """Small thread-safe LRU of rendered responses with expiry"""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['expires'] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+response_cache = ResponseCache()
+
+
+def compute_etag(body):
+    """Strong ETag from a hash of the payload bytes"""
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def normalized_cache_key(policy_name, key_func=None):
+    """Route + geo-snapped coordinates + remaining sorted query args"""
+    if key_func is not None:
+        try:
+            return f"{policy_name}|{key_func()}|format={negotiate_format()}"
+        except (KeyError, ValueError):
+            return None
+
+    args = request.args.to_dict()
+    parts = [policy_name]
+
+    if 'lat' in args or 'lon' in args:
+        try:
+            lat = float(args.pop('lat', 39.9526))
+            lon = float(args.pop('lon', -75.1652))
+            parts.append('%.2f,%.2f' % snap_to_cell(lat, lon))
+        except ValueError:
+            return None
+
+    args.pop('format', None)
+    for name in sorted(args):
+        if name not in IGNORED_ARGS:
+            parts.append(f"{name}={args[name]}")
+
+    # ?format= and Accept both select the representation
+    parts.append(f"format={negotiate_format()}")
+
+    return '|'.join(parts)
+
+
+def _payload_is_cacheable(response):
+    if response.status_code != 200:
+        return False, False
+    status = getattr(response, 'payload_status', None)
+    if status is not None:
+        return status == 'success', response.payload_stale
+    if response.mimetype != 'application/json':
+        return False, False
+    try:
+        payload = json.loads(response.get_data())
+    except ValueError:
+        return False, False
+    if not isinstance(payload, dict) or payload.get('status') != 'success':
+        return False, False
+    return True, bool(payload.get('stale') or payload.get('degraded'))
+
+
+def _cache_control(policy, stale):
+    max_age = policy['max_age']
+    if callable(max_age):
+        max_age = max_age()
+    if stale:
+        return min(max_age, STALE_MAX_AGE), 0
+    return max_age, policy.get('swr', 0)
+
+
+def _select_variant(entry):
+    """(body, etag, encoding) for the client, gzipping once per entry"""
+    body = entry['body']
+    if len(body) < MIN_COMPRESS_SIZE or not accepts_encoding('gzip'):
+        return body, entry['etag'], None
+    if entry.get('gzip_body') is None:
+        entry['gzip_body'] = gzip_bytes(body)
+    # Each encoding is a different representation and needs its own tag
+    return entry['gzip_body'], entry['etag'] + '-gzip', 'gzip'
+
+
+def _finish(entry, cache_status):
+    """Build the response for a cache entry, answering 304 if possible"""
+    age = int(time.time() - entry['stored_at'])
+    body, etag, encoding = _select_variant(entry)
+
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(body)
+        response.mimetype = entry['mimetype']
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag)
+    response.vary.update(['Accept', 'Accept-Encoding'])
+    response.headers['Cache-Control'] = entry['cache_control']
+    response.headers['Age'] = str(age)
+    response.headers['X-Cache'] = cache_status
+    return response
+
+
+def http_cached(policy_name, key_func=None):
+    """
+    Cache a JSON GET route in the shared response cache and add
+    ETag / Cache-Control headers based on CACHE_POLICIES[policy_name]
+
+    key_func, if given, returns the normalized query part of the cache
+    key (raising KeyError or ValueError for missing or unparseable
+    input). Error and partial payloads are passed through with no-store.
+    """
+    policy = CACHE_POLICIES[policy_name]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = normalized_cache_key(policy_name, key_func)
+            entry = response_cache.get(key) if key else None
+            if key:
+                count_cache('response', entry is not None)
+            if entry is not None:
+                return _finish(entry, 'HIT')
+
+            response = make_response(view(*args, **kwargs))
+            cacheable, stale = _payload_is_cacheable(response)
+            # Anything built while degraded may rest on deferred sources
+            stale = stale or current_tier() > 0
+            if not cacheable:
+                response.headers['Cache-Control'] = 'no-store'
+                return response
+
+            max_age, swr = _cache_control(policy, stale)
+            cache_control = f"public, max-age={max_age}"
+            if swr:
+                cache_control += f", stale-while-revalidate={swr}"
+
+            body = response.get_data()
+            now = time.time()
+            entry = {
+                'body': body,
+                'mimetype': response.mimetype,
+                'etag': compute_etag(body),
+                'cache_control': cache_control,
+                'stored_at': now,
+                'expires': now + max_age
+            }
+            if key:
+                response_cache.put(key, entry)
+            return _finish(entry, 'MISS')
+        return wrapper
+    return decorator
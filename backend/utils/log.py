@@ -0,0 +1,200 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+# ========================================
+# Logging configuration
+# ========================================
+# LOG_LEVEL          DEBUG / INFO / WARNING / ... (default INFO)
+# LOG_FORMAT         json (default) or text
+# LOG_SAMPLE_RATE    fraction of requests whose INFO/DEBUG lines are kept
+# LOG_SAMPLE_RATES   per-route overrides, e.g. "/api/stations=0.1,/api/tempo=0.5"
+#
+# Warnings and errors are never sampled out. Records are formatted and
+# written by a background listener; request threads only enqueue.
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+DEFAULT_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
+
+# High-volume routes (map panning, polling) keep a tenth of their chatter
+ROUTE_SAMPLE_RATES = {
+    '/api/stations': 0.1,
+    '/api/heatmap': 0.1,
+    '/api/geocode/autocomplete': 0.1,
+}
+
+LOG_QUEUE_SIZE = 10000
+
+# Standard LogRecord attributes; anything else passed via extra= is a field
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+route_var = contextvars.ContextVar('route', default=None)
+sampled_var = contextvars.ContextVar('sampled', default=True)
+
+
+def _parse_sample_rates(value):
+    rates = {}
+    for item in (value or '').split(','):
+        route, _, rate = item.partition('=')
+        if route.strip() and rate.strip():
+            rates[route.strip()] = float(rate)
+    return rates
+
+
+ROUTE_SAMPLE_RATES.update(_parse_sample_rates(os.getenv('LOG_SAMPLE_RATES')))
+
+
+class RequestContextFilter(logging.Filter):
+    """Tags records with the request id/route and applies request sampling"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.route = route_var.get()
+        return record.levelno >= logging.WARNING or sampled_var.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with extra fields appended as key=value"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record):
+        if record.request_id is None:
+            record.request_id = '-'
+        line = super().format(record)
+        fields = [f"{key}={value}" for key, value in vars(record).items()
+                  if key not in _RECORD_ATTRS | {'request_id', 'route'} and value is not None]
+        return f"{line} {' '.join(fields)}" if fields else line
+
+
+class _EnqueueHandler(QueueHandler):
+    """QueueHandler that drops records rather than block when the queue is full"""
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread; only resolve args here
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+_listener = None
+
+
+def configure_logging():
+    """Install the queue handler on the 'aircast' logger (idempotent)"""
+    global _listener
+    root = logging.getLogger('aircast')
+    if _listener is not None:
+        return root
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(TextFormatter() if LOG_FORMAT == 'text' else JsonFormatter())
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = _EnqueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter())
+
+    root.handlers[:] = [handler]
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return root
+
+
+def _restart_after_fork():
+    """
+    The listener thread does not survive fork, and its queue's lock may
+    have been held at the time; give the child a fresh queue and listener
+    """
+    global _listener
+    if _listener is None:
+        return
+    atexit.unregister(_listener.stop)
+    _listener = None
+    configure_logging()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def get_logger(name):
+    """Logger under the 'aircast' hierarchy (configures logging on first use)"""
+    configure_logging()
+    return logging.getLogger(f'aircast.{name}')
+
+
+# ========================================
+# Flask integration
+# ========================================
+def begin_request(request):
+    """Bind a request id, route and sampling decision to this request"""
+    request_id = request.headers.get('X-Request-Id') or uuid.uuid4().hex[:16]
+    route = request.url_rule.rule if request.url_rule else request.path
+    rate = ROUTE_SAMPLE_RATES.get(route, DEFAULT_SAMPLE_RATE)
+
+    request_id_var.set(request_id)
+    route_var.set(route)
+    sampled_var.set(rate >= 1 or random.random() < rate)
+    return request_id
+
+
+def init_app(app):
+    """Request ids in and out, plus one access line per request"""
+    access_log = get_logger('access')
+
+    @app.before_request
+    def _start_request():
+        from flask import g, request
+        g.request_started = time.perf_counter()
+        g.request_id = begin_request(request)
+
+    @app.after_request
+    def _finish_request(response):
+        from flask import g, request
+        response.headers['X-Request-Id'] = g.get('request_id', '')
+        if access_log.isEnabledFor(logging.INFO):
+            access_log.info('request', extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'ms': round((time.perf_counter() - g.get('request_started', time.perf_counter())) * 1000, 1)
+            })
+        return response
@@ -0,0 +1,285 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from functools import wraps
+
+# ========================================
+# Metric types
+# ========================================
+# Per-process metrics in the Prometheus text format; each gunicorn
+# worker exposes its own series (scrape per worker or sum in queries).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('%s="%s"' % (n, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                     for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, '') for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def reset(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, '') for n in self.labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def reset(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ('le',)
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += n
+                    lines.append(f"{self.name}_bucket{_label_text(names, key + (bound,))} {cumulative}")
+                labels = _label_text(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {round(total, 6)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+# ========================================
+# Registry
+# ========================================
+REQUEST_SECONDS = Histogram(
+    'aircast_request_seconds', 'HTTP request latency', ('route', 'method', 'status'))
+RESPONSE_BYTES = Histogram(
+    'aircast_response_bytes', 'HTTP response body size', ('route',), SIZE_BUCKETS)
+STAGE_SECONDS = Histogram(
+    'aircast_stage_seconds', 'Time spent in a request stage', ('stage',))
+UPSTREAM_SECONDS = Histogram(
+    'aircast_upstream_seconds', 'Upstream call latency', ('upstream', 'outcome'))
+UPSTREAM_BYTES = Counter(
+    'aircast_upstream_bytes_total', 'Bytes received from upstreams', ('upstream',))
+CACHE_LOOKUPS = Counter(
+    'aircast_cache_lookups_total', 'Cache lookups by cache and result', ('cache', 'result'))
+OPENAI_TOKENS = Counter(
+    'aircast_openai_tokens_total', 'OpenAI tokens used', ('endpoint',))
+QUOTA_TOKENS = Gauge(
+    'aircast_upstream_quota_tokens', 'Requests left in the shared upstream budget', ('upstream',))
+QUOTA_WAIT_SECONDS = Histogram(
+    'aircast_upstream_quota_wait_seconds', 'Time queued for an upstream budget token', ('upstream',))
+UPSTREAM_THROTTLED = Counter(
+    'aircast_upstream_throttled_total', 'Upstream requests refused by the budget', ('upstream', 'priority'))
+REQUESTS_SHED = Counter(
+    'aircast_requests_shed_total', 'Requests refused by admission control', ('route_class', 'reason'))
+ADMISSION_WAIT_SECONDS = Histogram(
+    'aircast_admission_wait_seconds', 'Time queued for a route class slot', ('route_class',))
+DEGRADATION_TIER = Gauge(
+    'aircast_degradation_tier', 'Current degradation tier (0 = normal)')
+
+METRICS = [REQUEST_SECONDS, RESPONSE_BYTES, STAGE_SECONDS, UPSTREAM_SECONDS,
+           UPSTREAM_BYTES, CACHE_LOOKUPS, OPENAI_TOKENS, QUOTA_TOKENS, QUOTA_WAIT_SECONDS,
+           UPSTREAM_THROTTLED, REQUESTS_SHED, ADMISSION_WAIT_SECONDS, DEGRADATION_TIER]
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _reset_after_fork():
+    # Forked workers start from zero rather than each re-reporting
+    # whatever the parent (e.g. a preloading gunicorn master) recorded
+    for metric in METRICS:
+        metric.reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def count_cache(cache, hit):
+    """Cache lookup, also shown as 'cache-<name>' in Server-Timing"""
+    result = 'hit' if hit else 'miss'
+    CACHE_LOOKUPS.inc(cache=cache, result=result)
+    _note(f"cache-{cache}", result)
+
+
+def count_upstream_bytes(upstream, response):
+    """Count the body size of a requests response from an upstream"""
+    size = len(response.content)
+    UPSTREAM_BYTES.inc(size, upstream=upstream)
+    _note('upstream-bytes', size)
+
+
+def count_tokens(endpoint, tokens):
+    """OpenAI tokens used, also shown as 'tokens' in Server-Timing"""
+    OPENAI_TOKENS.inc(tokens, endpoint=endpoint)
+    _note('tokens', tokens)
+
+
+def record_upstream(upstream, elapsed, outcome):
+    """Upstream call latency, also shown as 'upstream-<name>' in Server-Timing"""
+    UPSTREAM_SECONDS.observe(elapsed, upstream=upstream, outcome=outcome)
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((f"upstream-{upstream}", elapsed))
+
+
+# ========================================
+# Request spans
+# ========================================
+_spans = contextvars.ContextVar('spans', default=None)
+# (name, value) facts about the current request: cache results, sizes
+_notes = contextvars.ContextVar('notes', default=None)
+
+
+def _note(name, value):
+    notes = _notes.get()
+    if notes is not None:
+        notes.append((name, value))
+
+
+class span:
+    """
+    Time a stage of the current request
+
+    Usable as a context manager or decorator. The duration feeds
+    aircast_stage_seconds and, inside a request, the Server-Timing header.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._started
+        STAGE_SECONDS.observe(elapsed, stage=self.stage)
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((self.stage, elapsed))
+        return False
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(self.stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def server_timing(spans, total, notes=()):
+    """
+    Server-Timing header value: one entry per stage, durations summed,
+    then duration-less entries for the request's notes (cache results
+    as hit/miss, byte and token counts summed)
+    """
+    by_stage = {}
+    for stage, elapsed in spans:
+        by_stage[stage] = by_stage.get(stage, 0.0) + elapsed
+    entries = [f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in by_stage.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+
+    by_name = {}
+    for name, value in notes:
+        if isinstance(value, str):
+            counts = by_name.setdefault(name, {})
+            counts[value] = counts.get(value, 0) + 1
+        else:
+            by_name[name] = by_name.get(name, 0) + value
+    for name, value in by_name.items():
+        if isinstance(value, dict):
+            # One result reads 'hit'; a mix reads "hit=2 miss=1"
+            value = next(iter(value)) if len(value) == 1 else \
+                '"%s"' % ' '.join(f"{result}={n}" for result, n in value.items())
+        entries.append(f"{name};desc={value}")
+    return ', '.join(entries)
+
+
+def init_app(app):
+    """Request latency/size histograms and the Server-Timing header"""
+
+    @app.before_request
+    def _start_timing():
+        from flask import g
+        g.metrics_started = time.perf_counter()
+        _spans.set([])
+        _notes.set([])
+
+    @app.after_request
+    def _record_timing(response):
+        from flask import g, request
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        total = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+
+        REQUEST_SECONDS.observe(total, route=route, method=request.method,
+                                status=response.status_code)
+        if response.content_length is not None:
+            RESPONSE_BYTES.observe(response.content_length, route=route)
+        response.headers['Server-Timing'] = server_timing(_spans.get() or [], total, _notes.get() or [])
+        return response
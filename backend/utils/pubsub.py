@@ -0,0 +1,89 @@
+import queue
+import threading
+
+# Messages buffered per subscriber before it is marked lagged
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Handed to a lagged subscriber in place of the messages it missed
+RESYNC = object()
+
+
+class Subscription:
+    """One subscriber's view of a set of topics"""
+
+    def __init__(self, topics):
+        self.topics = set(topics)
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.lagged = False
+        self._lock = threading.Lock()
+
+    def get(self, timeout=None):
+        """Next (topic, message), RESYNC if messages were dropped, or None on timeout"""
+        try:
+            item = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if item is RESYNC:
+            with self._lock:
+                self.lagged = False
+        return item
+
+    def deliver(self, topic, message):
+        # A consumer that falls a full queue behind loses its backlog for
+        # one RESYNC, and gets nothing more until it has taken it (so no
+        # stale delta can follow its resync); publishers never block
+        with self._lock:
+            if self.lagged:
+                return
+            try:
+                self.queue.put_nowait((topic, message))
+                return
+            except queue.Full:
+                pass
+            self.lagged = True
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(RESYNC)
+
+
+class PubSub:
+    """In-process topic fan-out; one publish reaches every subscriber"""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topics):
+        subscription = Subscription(topics)
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    def publish(self, topic, message):
+        """Deliver message to topic's subscribers; returns how many"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscription in subscribers:
+            subscription.deliver(topic, message)
+        return len(subscribers)
+
+    def topics(self):
+        """Topics that currently have at least one subscriber"""
+        with self._lock:
+            return list(self._subscribers)
+
+
+pubsub = PubSub()
@@ -0,0 +1,228 @@
+import math
+
+import numpy as np
+
+# ========================================
+# Regridded rasters with summed-area tables
+# ========================================
+# Swath pixels are binned onto a regular lat/lon grid, then prefix sums
+# (integral images) of value, value² and valid-pixel count are taken
+# over it. Any axis-aligned box of grid cells is then summed with four
+# lookups per table, so an area mean and spread cost the same whatever
+# the box size. PixelLocator buckets the same pixels to find the nearest
+# one to many points without scanning the swath per point.
+
+KM_PER_DEGREE_LAT = 111.32
+
+
+def _integral(values):
+    """Summed-area table with a leading row and column of zeros"""
+    table = np.zeros((values.shape[0] + 1, values.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(values, axis=0, dtype=np.float64), axis=1, out=table[1:, 1:])
+    return table
+
+
+class SummedAreaGrid:
+    """
+    Box statistics over a swath, O(1) per query
+
+    values are stored divided by `scale` so the value² table keeps its
+    precision for quantities like NO2 columns (~1e16).
+    """
+
+    def __init__(self, lat, lon, values, valid, resolution, scale=1.0):
+        lat = np.ma.filled(np.ma.asarray(lat, dtype=float), np.nan).ravel()
+        lon = np.ma.filled(np.ma.asarray(lon, dtype=float), np.nan).ravel()
+        values = np.ma.filled(np.ma.asarray(values, dtype=float), np.nan).ravel() / scale
+        valid = np.asarray(valid, dtype=bool).ravel() & np.isfinite(values)
+
+        located = np.isfinite(lat) & np.isfinite(lon)
+        if not located.any():
+            raise ValueError("swath has no geolocated pixels")
+
+        self.resolution = resolution
+        self.scale = scale
+        self.lat0 = math.floor(lat[located].min() / resolution) * resolution
+        self.lon0 = math.floor(lon[located].min() / resolution) * resolution
+        self.rows = int((lat[located].max() - self.lat0) // resolution) + 1
+        self.cols = int((lon[located].max() - self.lon0) // resolution) + 1
+
+        row = ((lat[located] - self.lat0) // resolution).astype(np.int64)
+        col = ((lon[located] - self.lon0) // resolution).astype(np.int64)
+        cell = row * self.cols + col
+        size = self.rows * self.cols
+        valid = valid[located]
+        good = np.where(valid, values[located], 0.0)
+
+        def binned(weights=None):
+            return np.bincount(cell, weights=weights, minlength=size).reshape(self.rows, self.cols)
+
+        self._pixels = _integral(binned())
+        self._count = _integral(binned(valid.astype(np.float64)))
+        self._sum = _integral(binned(good))
+        self._sum_sq = _integral(binned(good * good))
+
+    @property
+    def nbytes(self):
+        return sum(t.nbytes for t in (self._pixels, self._count, self._sum, self._sum_sq))
+
+    def _spans(self, low, high, origin, n):
+        start = np.clip(np.floor((np.asarray(low) - origin) / self.resolution), 0, n).astype(np.int64)
+        stop = np.clip(np.floor((np.asarray(high) - origin) / self.resolution) + 1, 0, n).astype(np.int64)
+        return start, np.maximum(start, stop)
+
+    @staticmethod
+    def _box_sum(table, r0, r1, c0, c1):
+        return table[r1, c1] - table[r0, c1] - table[r1, c0] + table[r0, c0]
+
+    def boxes_stats(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Vectorized box_stats: arrays of bounds in, a dict of arrays out
+        (mean/std NaN where count is 0)
+        """
+        r0, r1 = self._spans(min_lat, max_lat, self.lat0, self.rows)
+        c0, c1 = self._spans(min_lon, max_lon, self.lon0, self.cols)
+
+        count = np.rint(self._box_sum(self._count, r0, r1, c0, c1)).astype(np.int64)
+        pixels = np.rint(self._box_sum(self._pixels, r0, r1, c0, c1)).astype(np.int64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self._box_sum(self._sum, r0, r1, c0, c1) / count
+            variance = np.maximum(self._box_sum(self._sum_sq, r0, r1, c0, c1) / count - mean * mean, 0.0)
+        return {'count': count, 'pixels': pixels,
+                'mean': mean * self.scale, 'std': np.sqrt(variance) * self.scale}
+
+    def box_stats(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        {'count', 'pixels', 'mean', 'std'} of the valid pixels in the
+        grid cells overlapping the box (mean/std None when count is 0)
+        """
+        stats = self.boxes_stats(min_lat, min_lon, max_lat, max_lon)
+        count = int(stats['count'])
+        return {
+            'count': count,
+            'pixels': int(stats['pixels']),
+            'mean': float(stats['mean']) if count else None,
+            'std': float(stats['std']) if count else None,
+        }
+
+    @staticmethod
+    def _half_extent(lat, radius_km):
+        half_km = np.asarray(radius_km) * math.sqrt(math.pi) / 2
+        half_lat = half_km / KM_PER_DEGREE_LAT
+        half_lon = half_km / (KM_PER_DEGREE_LAT * np.maximum(np.cos(np.radians(lat)), 1e-6))
+        return half_lat, half_lon
+
+    def radius_stats(self, lat, lon, radius_km):
+        """
+        box_stats for the square with the same area as the circle of
+        radius_km around (lat, lon)
+
+        A disk isn't a sum of four lookups; its equal-area square is the
+        closest box and keeps the query O(1).
+        """
+        half_lat, half_lon = self._half_extent(lat, radius_km)
+        return self.box_stats(lat - half_lat, lon - half_lon, lat + half_lat, lon + half_lon)
+
+    def radii_stats(self, lats, lons, radius_km):
+        """Vectorized radius_stats"""
+        lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+        half_lat, half_lon = self._half_extent(lats, radius_km)
+        return self.boxes_stats(lats - half_lat, lons - half_lon, lats + half_lat, lons + half_lon)
+
+
+class PixelLocator:
+    """
+    Nearest swath pixel for many points at once
+
+    Pixels are bucketed on a regular grid; a point only compares against
+    the pixels in its own and the eight surrounding cells, so the cost
+    per point doesn't grow with the swath. in_box() uses the same buckets
+    to pick the pixels inside a box. The answer is exact for any
+    point whose nearest pixel is within about one cell; points with no
+    pixel that close get -1.
+    """
+
+    def __init__(self, lat, lon, resolution):
+        self.lat = np.ma.filled(np.ma.asarray(lat, dtype=float), np.nan).ravel()
+        self.lon = np.ma.filled(np.ma.asarray(lon, dtype=float), np.nan).ravel()
+        located = np.flatnonzero(np.isfinite(self.lat) & np.isfinite(self.lon))
+        if not len(located):
+            raise ValueError("swath has no geolocated pixels")
+
+        self.resolution = resolution
+        # Cells are counted from the pole/antimeridian (floor(lat / res))
+        # and shifted by an origin, so pixels and query points always land
+        # in the same cell. One empty cell of margin all round so
+        # neighbours never wrap.
+        self.row0 = math.floor(self.lat[located].min() / resolution) - 1
+        self.col0 = math.floor(self.lon[located].min() / resolution) - 1
+        self.rows = math.floor(self.lat[located].max() / resolution) - self.row0 + 2
+        self.cols = math.floor(self.lon[located].max() / resolution) - self.col0 + 2
+
+        cell = self._cells(self.lat[located], self.lon[located])
+        order = np.argsort(cell, kind='stable')
+        cell, located = cell[order], located[order]
+        counts = np.bincount(cell, minlength=self.rows * self.cols)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        # Dense (cell, slot) table of pixel indexes, -1 padded
+        self.per_cell = int(counts.max())
+        slot = np.arange(len(cell)) - starts[cell]
+        self._pixels = np.full((self.rows * self.cols, self.per_cell), -1, dtype=np.int32)
+        self._pixels[cell, slot] = located
+
+    @property
+    def nbytes(self):
+        return self._pixels.nbytes
+
+    def _cells(self, lat, lon):
+        row = np.floor(lat / self.resolution).astype(np.int64) - self.row0
+        col = np.floor(lon / self.resolution).astype(np.int64) - self.col0
+        return row * self.cols + col
+
+    def nearest(self, lats, lons):
+        """(pixel index or -1, distance in degrees) per point"""
+        lats = np.asarray(lats, dtype=float).ravel()
+        lons = np.asarray(lons, dtype=float).ravel()
+        row = np.floor(lats / self.resolution) - self.row0
+        col = np.floor(lons / self.resolution) - self.col0
+        inside = (row >= 1) & (row < self.rows - 1) & (col >= 1) & (col < self.cols - 1)
+
+        index = np.full(len(lats), -1, dtype=np.int64)
+        distance = np.full(len(lats), np.inf)
+        if not inside.any():
+            return index, distance
+
+        center = (row[inside] * self.cols + col[inside]).astype(np.int64)
+        offsets = np.array([dr * self.cols + dc for dr in (-1, 0, 1) for dc in (-1, 0, 1)])
+        candidates = self._pixels[center[:, None] + offsets[None, :]].reshape(len(center), -1)
+
+        present = candidates >= 0
+        safe = np.where(present, candidates, 0)
+        # Equirectangular distance; fine at the scale of a few cells
+        scale = np.cos(np.radians(lats[inside]))[:, None]
+        d2 = (self.lat[safe] - lats[inside][:, None]) ** 2 + \
+            ((self.lon[safe] - lons[inside][:, None]) * scale) ** 2
+        d2 = np.where(present, d2, np.inf)
+        best = d2.argmin(axis=1)
+        best_d2 = d2[np.arange(len(center)), best]
+
+        found = np.isfinite(best_d2)
+        picked = np.where(found, candidates[np.arange(len(center)), best], -1)
+        index[inside] = picked
+        distance[inside] = np.sqrt(best_d2)
+        return index, distance
+
+    def in_box(self, min_lat, min_lon, max_lat, max_lon):
+        """Indexes of the pixels with min_lat <= lat < max_lat and min_lon <= lon < max_lon"""
+        def span(low, high, origin, n):
+            start = int(np.clip(math.floor(low / self.resolution) - origin, 0, n - 1))
+            stop = int(np.clip(math.floor(high / self.resolution) - origin, 0, n - 1))
+            return np.arange(start, stop + 1)
+
+        rows = span(min_lat, max_lat, self.row0, self.rows)
+        cols = span(min_lon, max_lon, self.col0, self.cols)
+        candidates = self._pixels[(rows[:, None] * self.cols + cols[None, :]).ravel()].ravel()
+        candidates = candidates[candidates >= 0]
+        lat, lon = self.lat[candidates], self.lon[candidates]
+        return candidates[(lat >= min_lat) & (lat < max_lat) & (lon >= min_lon) & (lon < max_lon)]
@@ -0,0 +1,192 @@
+import contextvars
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from utils.log import get_logger
+from utils.metrics import QUOTA_TOKENS, QUOTA_WAIT_SECONDS, UPSTREAM_THROTTLED
+from utils.sqlite_store import DATA_DIR, SQLiteStore
+
+log = get_logger('rate_limit')
+
+# ========================================
+# Upstream budgets
+# ========================================
+# Token buckets shared by every worker process through one SQLite file:
+# each HTTP request to an upstream takes a token, tokens refill at
+# `rate` per second up to `burst`. AIRCAST_RATE_LIMITS=0 disables the
+# limiter; AIRCAST_RATE_LIMIT_<UPSTREAM>=rate,burst overrides a budget.
+
+QUOTA_DB = os.getenv('AIRCAST_QUOTA_DB', os.path.join(DATA_DIR, 'quota.sqlite3'))
+
+RATE_LIMITS_ENABLED = os.getenv('AIRCAST_RATE_LIMITS', '1') != '0'
+
+# (requests per second, burst); upstreams not listed are not limited
+DEFAULT_BUDGETS = {
+    'openaq': (0.5, 60),        # 60/min and 2,000/hour per key
+    'openweather': (1.0, 60),   # free tier: 60/min
+    'openai': (3.0, 30),
+    'opencage': (1.0, 1),       # free tier: 1/s
+    'airnow': (0.13, 30),       # 500/hour per key
+    'purpleair': (1.0, 10),
+}
+
+# Longest a user request queues for a token before giving up
+MAX_QUEUE_WAIT = 2.0
+
+# Background jobs never queue, and only spend tokens while the bucket is
+# fuller than this fraction of its burst, leaving the rest for users
+BACKGROUND_RESERVE = 0.25
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS buckets (
+    upstream TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+'''
+
+
+class RateLimitExceeded(Exception):
+    """Raised when an upstream's budget can't cover a request in time"""
+
+
+def load_budgets():
+    budgets = dict(DEFAULT_BUDGETS)
+    for upstream in DEFAULT_BUDGETS:
+        override = os.getenv(f'AIRCAST_RATE_LIMIT_{upstream.upper()}')
+        if override:
+            try:
+                rate, burst = (float(v) for v in override.split(','))
+                budgets[upstream] = (rate, burst)
+            except ValueError:
+                log.warning("Ignoring bad rate limit for %s: %s", upstream, override)
+    return budgets
+
+
+_background = contextvars.ContextVar('background_priority', default=False)
+
+
+@contextmanager
+def background_priority():
+    """Mark upstream calls in this block as deferrable background work"""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+def is_background():
+    return _background.get()
+
+
+class QuotaManager:
+    """
+    Cross-process token buckets, one per upstream
+
+    A request reserves a token even when the bucket is empty (it goes
+    negative) and sleeps until that token has refilled, so waiters are
+    served in arrival order; if the wait would exceed MAX_QUEUE_WAIT it
+    is refused instead.
+    """
+
+    def __init__(self, path=QUOTA_DB, budgets=None, enabled=RATE_LIMITS_ENABLED):
+        self.store = SQLiteStore(path, SCHEMA)
+        self.budgets = load_budgets() if budgets is None else budgets
+        self.enabled = enabled
+
+    def _refilled(self, conn, upstream, now):
+        rate, burst = self.budgets[upstream]
+        row = conn.execute('SELECT tokens, updated FROM buckets WHERE upstream = ?',
+                           (upstream,)).fetchone()
+        if row is None:
+            return burst
+        return min(burst, row[0] + (now - row[1]) * rate)
+
+    def _reserve(self, upstream, max_wait, floor):
+        """(seconds to wait, tokens left), or (None, tokens) if refused"""
+        rate, _ = self.budgets[upstream]
+        conn = self.store.connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            tokens = self._refilled(conn, upstream, now) - 1
+            wait = max(0.0, -tokens / rate)
+            if wait > max_wait or tokens < floor:
+                conn.execute('ROLLBACK')
+                return None, tokens + 1
+            conn.execute('INSERT OR REPLACE INTO buckets (upstream, tokens, updated) VALUES (?, ?, ?)',
+                         (upstream, tokens, now))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return wait, tokens
+
+    def acquire(self, upstream):
+        """
+        Take a token for one request to upstream, waiting if needed
+
+        Raises RateLimitExceeded when the budget is exhausted (for
+        background work: when it is down to the reserve).
+        """
+        if not self.enabled or upstream not in self.budgets:
+            return
+
+        background = is_background()
+        if background:
+            max_wait, floor = 0.0, self.budgets[upstream][1] * BACKGROUND_RESERVE
+        else:
+            max_wait, floor = MAX_QUEUE_WAIT, float('-inf')
+
+        try:
+            wait, tokens = self._reserve(upstream, max_wait, floor)
+        except sqlite3.Error as e:
+            # Never let the limiter take requests down with it
+            log.warning("Quota store unavailable, not limiting %s: %s", upstream, e)
+            return
+
+        QUOTA_TOKENS.set(round(max(tokens, 0), 3), upstream=upstream)
+        if wait is None:
+            UPSTREAM_THROTTLED.inc(upstream=upstream,
+                                   priority='background' if background else 'interactive')
+            raise RateLimitExceeded(f"{upstream} request budget exhausted")
+        if wait > 0:
+            QUOTA_WAIT_SECONDS.observe(wait, upstream=upstream)
+            time.sleep(wait)
+
+    def remaining(self, upstream):
+        """Tokens available to upstream now (None if it is not limited)"""
+        if not self.enabled or upstream not in self.budgets:
+            return None
+        try:
+            tokens = self._refilled(self.store.connection(), upstream, time.time())
+        except sqlite3.Error:
+            return None
+        QUOTA_TOKENS.set(round(max(tokens, 0), 3), upstream=upstream)
+        return tokens
+
+    def has_headroom(self, upstream):
+        """Whether background work may call upstream right now"""
+        tokens = self.remaining(upstream)
+        return tokens is None or tokens - 1 >= self.budgets[upstream][1] * BACKGROUND_RESERVE
+
+    def status(self):
+        """Budget and current tokens per limited upstream"""
+        if not self.enabled:
+            return {'enabled': False}
+        upstreams = []
+        for upstream, (rate, burst) in self.budgets.items():
+            tokens = self.remaining(upstream)
+            upstreams.append({
+                'upstream': upstream,
+                'rate_per_second': rate,
+                'burst': burst,
+                'tokens': None if tokens is None else round(tokens, 2)
+            })
+        return {'enabled': True, 'upstreams': upstreams}
+
+
+quota = QuotaManager()
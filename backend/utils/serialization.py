@@ -0,0 +1,172 @@
+import json
+import math
+
+import numpy as np
+from flask import make_response, request
+from flask.json.provider import DefaultJSONProvider
+
+from models.records import Record
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# ========================================
+# Response formats
+# ========================================
+# json      - the default nested records (unchanged)
+# columnar  - record lists become parallel arrays, one per field
+# msgpack   - columnar payload encoded as MessagePack
+#
+# Records (models.records) are written through their to_dict() in every
+# format, including plain jsonify.
+
+COLUMNAR_MIMETYPE = 'application/vnd.aircast.columnar+json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+ACCEPT_FORMATS = {
+    MSGPACK_MIMETYPE: 'msgpack',
+    'application/x-msgpack': 'msgpack',
+    COLUMNAR_MIMETYPE: 'columnar',
+}
+
+FORMATS = ('json', 'columnar', 'msgpack')
+
+
+def negotiate_format():
+    """Pick the response format from ?format= or the Accept header"""
+    requested = request.args.get('format', '').lower()
+    if requested in FORMATS:
+        return requested
+
+    best = request.accept_mimetypes.best_match(
+        ['application/json'] + list(ACCEPT_FORMATS))
+    return ACCEPT_FORMATS.get(best, 'json')
+
+
+def record_default(obj):
+    """Encoder fallback: records as their dicts, numpy values as Python ones, anything else as str"""
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return str(obj)
+
+
+def _finite(value):
+    """Copy of value with NaN/inf floats as None, as orjson writes them"""
+    if isinstance(value, (Record, np.generic, np.ndarray)):
+        value = record_default(value)
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+class RecordJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes records like dumps_json does"""
+
+    @staticmethod
+    def default(obj):
+        if isinstance(obj, Record):
+            return obj.to_dict()
+        return DefaultJSONProvider.default(obj)
+
+
+def to_columnar(records):
+    """
+    Convert a list of dicts (or records) into parallel arrays
+
+    Nested dicts (e.g. station measurements) are flattened one level
+    into dotted column names. Missing values become None.
+    """
+    columns = {}
+    for i, record in enumerate(records):
+        for name, value in _flatten(record):
+            values = columns.get(name)
+            if values is None:
+                values = columns[name] = [None] * len(records)
+            values[i] = value
+    return {'count': len(records), 'columns': columns}
+
+
+def _flatten(record):
+    if isinstance(record, Record):
+        record = record.to_dict()
+    for key, value in record.items():
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                yield f"{key}.{sub_key}", sub_value
+        else:
+            yield key, value
+
+
+def dumps_json(payload):
+    """Serialize to JSON bytes with the fastest encoder available"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(payload, default=record_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATACLASS)
+    try:
+        text = json.dumps(payload, separators=(',', ':'), default=record_default, allow_nan=False)
+    except ValueError:
+        # Bare NaN is not JSON; only payloads that hold one pay for the copy
+        text = json.dumps(_finite(payload), separators=(',', ':'), default=record_default, allow_nan=False)
+    return text.encode('utf-8')
+
+
+def render(payload, tables=(), status=200):
+    """
+    Build the response for payload in the negotiated format
+
+    tables names the top-level keys holding record lists that become
+    columnar in the compact formats.
+    """
+    fmt = negotiate_format()
+    if fmt == 'msgpack' and not MSGPACK_AVAILABLE:
+        fmt = 'columnar'
+
+    if fmt == 'json':
+        body, mimetype = dumps_json(payload), 'application/json'
+    else:
+        compact = dict(payload)
+        for name in tables:
+            if isinstance(compact.get(name), list):
+                compact[name] = to_columnar(compact[name])
+        compact['format'] = fmt
+
+        if fmt == 'msgpack':
+            body, mimetype = msgpack.packb(compact, use_bin_type=True, default=record_default), MSGPACK_MIMETYPE
+        else:
+            body, mimetype = dumps_json(compact), COLUMNAR_MIMETYPE
+
+    response = make_response(body, status)
+    response.mimetype = mimetype
+    response.vary.add('Accept')
+    # Lets the response cache judge cacheability without re-parsing
+    response.payload_status = payload.get('status')
+    response.payload_stale = bool(payload.get('stale') or payload.get('degraded'))
+    return response
+
+
+def format_sse(event, data):
+    """One Server-Sent Events frame with a JSON data line"""
+    return f"event: {event}\ndata: {dumps_json(data).decode('utf-8')}\n\n"
+
+
+def format_ndjson(record):
+    """One newline-delimited JSON line"""
+    return dumps_json(record) + b'\n'
@@ -0,0 +1,51 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Local SQLite files (history, geocode cache, ...) live here by default
+DATA_DIR = os.getenv('AIRCAST_DATA_DIR',
+                     os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data'))
+
+
+class SQLiteStore:
+    """
+    Per-thread SQLite connections to one WAL-mode database file
+
+    Connections are never shared between threads or across a fork, so
+    gunicorn workers and their threads each get their own.
+    """
+
+    def __init__(self, path, schema=''):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if self.schema:
+                conn.executescript(self.schema)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        This thread's connection inside one write transaction. Connections
+        are in autocommit mode, so `with conn:` would not open one and every
+        statement would commit (and sync) on its own.
+        """
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
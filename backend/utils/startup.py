@@ -0,0 +1,59 @@
+import gc
+import os
+import time
+
+from utils.log import get_logger
+
+log = get_logger('startup')
+
+# ========================================
+# Fork-safe preloading
+# ========================================
+# With preload_app (gunicorn.conf.py) the master imports the app once and
+# calls preload_shared_state() before forking, so every worker starts
+# with the warm read-only state (AQI breakpoint tables, gazetteer trie,
+# decoded TEMPO grid, station snapshot, warm source cache for the hot
+# locations) shared copy-on-write. Fork-unsafe
+# state is rebuilt in each child by os.register_at_fork hooks next to it:
+# the log listener thread, the OpenAI client and the metrics registry;
+# SQLite connections are already per process.
+
+PRELOAD_TEMPO = os.getenv('AIRCAST_PRELOAD_TEMPO', '1') != '0'
+WARMUP_AT_BOOT = os.getenv('AIRCAST_WARMUP_AT_BOOT', '1') != '0'
+
+# Stations read within this window seed the index before the first request
+STATION_SNAPSHOT_MAX_AGE = 6 * 3600
+
+
+def preload_shared_state():
+    """Warm immutable state in the parent process; returns timings"""
+    from api.tempo import read_tempo_netcdf
+    from models.history import history_store
+    from models.stations import station_index
+
+    timings = {}
+    started = time.perf_counter()
+    if PRELOAD_TEMPO:
+        read_tempo_netcdf()
+        timings['tempo_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    started = time.perf_counter()
+    try:
+        snapshot = history_store.latest_readings(int(time.time()) - STATION_SNAPSHOT_MAX_AGE)
+        station_index.upsert(snapshot)
+        timings['stations'] = len(snapshot)
+    except Exception as e:
+        log.warning("Could not load station snapshot: %s", e)
+    timings['stations_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    if WARMUP_AT_BOOT:
+        from models.warmup import BOOT_WARMUP_TIMEOUT, warmer
+        timings['warmup'] = warmer.warm(timeout=BOOT_WARMUP_TIMEOUT)
+
+    # Move everything allocated so far out of the collector's reach, so
+    # collections in the workers don't write to (and un-share) its pages
+    gc.collect()
+    gc.freeze()
+
+    log.info("Preloaded shared state", extra=timings)
+    return timings
@@ -9,6 +9,13 @@ let currentLocation = { lat: 39.9526, lng: -75.1652 };
 // Chat session management
 let chatSessionId = 'session_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9);
 
+// Fetch wrapper that tags requests with the session id so the backend
+// can reuse one upstream fetch per source across this page's calls
+function apiFetch(url, options = {}) {
+    const headers = Object.assign({ 'X-Session-Id': chatSessionId }, options.headers || {});
+    return fetch(url, Object.assign({}, options, { headers }));
+}
+
 // Initialize Map
 function initMap() {
     map = new google.maps.Map(document.getElementById('map'), {
@@ -73,7 +80,7 @@ async function searchLocation() {
         map.setZoom(11);
         
         // Add blue marker at location
-        new google.maps.Marker({
+        const marker = new google.maps.Marker({
             position: currentLocation,
             map: map,
             title: "Searched Location",
@@ -88,48 +95,83 @@ async function searchLocation() {
             animation: google.maps.Animation.DROP
         });
         
+        // Name the spot (memoized server-side per ~100 m)
+        apiFetch(`/api/geocode/reverse?lat=${lat}&lon=${lng}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'success' && data.result) marker.setTitle(data.result.name);
+            })
+            .catch(() => {});
+
         fetchAllData();
         console.log('📍 Moved to coordinates:', currentLocation);
     } else {
-        // Use Google Geocoding API
-        const geocoder = new google.maps.Geocoder();
-        
-        geocoder.geocode({ address: query }, (results, status) => {
-            if (status === 'OK' && results[0]) {
-                const location = results[0].geometry.location;
-                currentLocation = {
-                    lat: location.lat(),
-                    lng: location.lng()
-                };
-                
-                map.setCenter(currentLocation);
-                map.setZoom(11);
-                
-                // Add marker at searched location
-                new google.maps.Marker({
-                    position: currentLocation,
-                    map: map,
-                    title: results[0].formatted_address,
-                    icon: {
-                        path: google.maps.SymbolPath.CIRCLE,
-                        scale: 12,
-                        fillColor: '#4285F4',
-                        fillOpacity: 1,
-                        strokeColor: 'white',
-                        strokeWeight: 4
-                    },
-                    animation: google.maps.Animation.DROP
-                });
-                
-                fetchAllData();
-                console.log('📍 Moved to:', results[0].formatted_address);
-            } else {
+        // Backend geocoder: cached, gazetteer first, upstream only on a miss
+        try {
+            const response = await apiFetch(`/api/geocode?q=${encodeURIComponent(query)}`);
+            const data = await response.json();
+            const result = data.status === 'success' && data.results[0];
+
+            if (!result) {
                 alert('Location not found. Try: "New York, NY" or "40.7128, -74.0060"');
+                return;
             }
-        });
+
+            currentLocation = { lat: result.lat, lng: result.lng };
+            map.setCenter(currentLocation);
+            map.setZoom(11);
+
+            // Add marker at searched location
+            new google.maps.Marker({
+                position: currentLocation,
+                map: map,
+                title: result.name,
+                icon: {
+                    path: google.maps.SymbolPath.CIRCLE,
+                    scale: 12,
+                    fillColor: '#4285F4',
+                    fillOpacity: 1,
+                    strokeColor: 'white',
+                    strokeWeight: 4
+                },
+                animation: google.maps.Animation.DROP
+            });
+
+            fetchAllData();
+            console.log('📍 Moved to:', result.name, `(${data.source})`);
+        } catch (error) {
+            console.error('Geocoding failed:', error);
+            alert('Location search is unavailable right now. Try coordinates like "40.7128, -74.0060"');
+        }
     }
 }
 
+// Autocomplete suggestions from the backend gazetteer (no upstream calls)
+let suggestTimer = null;
+
+function suggestLocations(prefix) {
+    clearTimeout(suggestTimer);
+    if (prefix.trim().length < 2) return;
+
+    suggestTimer = setTimeout(async () => {
+        try {
+            const response = await apiFetch(`/api/geocode/autocomplete?q=${encodeURIComponent(prefix)}`);
+            const data = await response.json();
+            const list = document.getElementById('location-suggestions');
+            if (!list || data.status !== 'success') return;
+
+            list.innerHTML = '';
+            data.suggestions.forEach(place => {
+                const option = document.createElement('option');
+                option.value = place.name;
+                list.appendChild(option);
+            });
+        } catch (error) {
+            console.error('Autocomplete failed:', error);
+        }
+    }, 150);
+}
+
 // Get User Location
 function getUserLocation() {
     if (navigator.geolocation) {
@@ -209,7 +251,7 @@ async function fetchAISummary() {
     try {
         console.log('🤖 Fetching AI summary...');
         
-        const response = await fetch(
+        const response = await apiFetch(
             `/api/ai-summary?lat=${currentLocation.lat}&lon=${currentLocation.lng}`
         );
         
@@ -244,7 +286,7 @@ async function fetchAISummary() {
 // Fetch Air Quality Data
 async function fetchAirQualityData() {
     try {
-        const response = await fetch(`/api/air-quality?lat=${currentLocation.lat}&lon=${currentLocation.lng}`);
+        const response = await apiFetch(`/api/air-quality?lat=${currentLocation.lat}&lon=${currentLocation.lng}&include_forecast=1`);
 
         const data = await response.json();
         
@@ -262,6 +304,7 @@ async function fetchAirQualityData() {
             if (data.locations.length > 0) {
                 updateCurrentAQI(data.locations[0]);
                 updateHealthAlerts(data.locations[0].aqi);
+                startLiveUpdates(data.locations[0]);
             }
             
             console.log('✅ Air quality data loaded:', data.locations.length, 'stations');
@@ -271,10 +314,36 @@ async function fetchAirQualityData() {
     }
 }
 
+// Live AQI updates over Server-Sent Events (replaces polling)
+let liveUpdates = null;
+
+function startLiveUpdates(station) {
+    if (!window.EventSource) return;
+    if (liveUpdates) liveUpdates.close();
+
+    const cell = `${currentLocation.lat.toFixed(2)},${currentLocation.lng.toFixed(2)}`;
+    let current = Object.assign({}, station);
+
+    liveUpdates = new EventSource(`/api/stream?cells=${encodeURIComponent(cell)}`);
+    liveUpdates.addEventListener('delta', (event) => {
+        const changes = JSON.parse(event.data).changes;
+        if (changes.aqi === undefined && changes.level === undefined) return;
+
+        current = Object.assign(current, {
+            aqi: changes.aqi !== undefined ? changes.aqi : current.aqi,
+            level: changes.level !== undefined ? changes.level : current.level,
+            measurements: changes.measurements || current.measurements
+        });
+        updateCurrentAQI(current);
+        updateHealthAlerts(current.aqi);
+        console.log('📡 Live AQI update:', changes);
+    });
+}
+
 // Fetch Forecast Data
 async function fetchForecastData() {
     try {
-        const response = await fetch(`/api/forecast?lat=${currentLocation.lat}&lon=${currentLocation.lng}`);
+        const response = await apiFetch(`/api/forecast?lat=${currentLocation.lat}&lon=${currentLocation.lng}`);
 
         const data = await response.json();
         
@@ -291,7 +360,7 @@ async function fetchForecastData() {
 // Fetch Weather Data
 async function fetchWeatherData() {
     try {
-        const response = await fetch(`/api/weather?lat=${currentLocation.lat}&lon=${currentLocation.lng}`);
+        const response = await apiFetch(`/api/weather?lat=${currentLocation.lat}&lon=${currentLocation.lng}`);
 
         const data = await response.json();
         
@@ -359,15 +428,18 @@ async function showEnhancedInfoWindow(location, marker) {
     const aqiColor = getAQIColor(location.aqi);
     const healthRec = getHealthRecommendation(location.aqi);
     
-    // Fetch forecast for this specific location
+    // Use the forecast bundled with the station; fetch only if missing
     let forecastHTML = '';
     try {
-        const response = await fetch(`/api/forecast?lat=${location.lat}&lon=${location.lng}`);
-
-        const data = await response.json();
+        let forecast = location.forecast;
+        if (!forecast) {
+            const response = await apiFetch(`/api/forecast?lat=${location.lat}&lon=${location.lng}`);
+            const data = await response.json();
+            forecast = data.forecast;
+        }
         
-        if (data.forecast && data.forecast.length > 0) {
-            forecastHTML = data.forecast.slice(0, 4).map(f => `
+        if (forecast && forecast.length > 0) {
+            forecastHTML = forecast.slice(0, 4).map(f => `
                 <div class="forecast-point">
                     <div class="forecast-time">+${f.hour}h</div>
                     <div class="forecast-aqi" style="color: ${getAQIColor(f.aqi)}">${f.aqi}</div>
@@ -556,7 +628,7 @@ async function updateHealthAlerts(currentAqi) {
     
     try {
         // Fetch forecast data to find peaks and improvements
-        const response = await fetch(`/api/forecast?lat=${currentLocation.lat}&lon=${currentLocation.lng}`);
+        const response = await apiFetch(`/api/forecast?lat=${currentLocation.lat}&lon=${currentLocation.lng}`);
 
         const data = await response.json();
         
@@ -819,21 +891,50 @@ function updateLoadingStep(step) {
 }
 
 // Map Control Functions
-function toggleHeatmap() {
+async function toggleHeatmap() {
     if (heatmapLayer) {
         heatmapLayer.setMap(heatmapLayer.getMap() ? null : map);
-    } else {
-        const heatmapData = markers.map(marker => ({
-            location: marker.getPosition(),
-            weight: 50
-        }));
-        
+        return;
+    }
+
+    const bounds = map.getBounds();
+    if (!bounds) return;
+    const sw = bounds.getSouthWest();
+    const ne = bounds.getNorthEast();
+    const bbox = [sw.lng(), sw.lat(), ne.lng(), ne.lat()].map(v => v.toFixed(4)).join(',');
+
+    try {
+        // Server fuses station AQI with the TEMPO field onto a grid
+        const response = await apiFetch(`/api/heatmap?bbox=${bbox}`);
+        const data = await response.json();
+        if (data.status !== 'success') throw new Error(data.message);
+
+        const bytes = Uint8Array.from(atob(data.raster), c => c.charCodeAt(0));
+        const values = new Uint16Array(bytes.buffer);
+        const heatmapData = [];
+        for (let row = 0; row < data.height; row++) {
+            for (let col = 0; col < data.width; col++) {
+                const aqi = values[row * data.width + col];
+                if (aqi === data.nodata) continue;
+                heatmapData.push({
+                    location: new google.maps.LatLng(
+                        data.bbox[1] + (row + 0.5) * data.res,
+                        data.bbox[0] + (col + 0.5) * data.res
+                    ),
+                    weight: aqi
+                });
+            }
+        }
+
         heatmapLayer = new google.maps.visualization.HeatmapLayer({
             data: heatmapData,
-            radius: 50,
-            opacity: 0.6
+            radius: 20,
+            opacity: 0.6,
+            maxIntensity: 200
         });
         heatmapLayer.setMap(map);
+    } catch (error) {
+        console.error('❌ Error loading heatmap:', error);
     }
 }
 
@@ -858,7 +959,7 @@ function showChart(type) {
         }
         
         // You need to fetch weather data first
-        fetch(`/api/weather?lat=${currentLocation.lat}&lon=${currentLocation.lng}`)
+        apiFetch(`/api/weather?lat=${currentLocation.lat}&lon=${currentLocation.lng}`)
 
             .then(res => res.json())
             .then(data => {
@@ -920,7 +1021,7 @@ async function updateUserGroupSafety() {
     const container = document.getElementById('user-safety-guide');
     
     try {
-        const response = await fetch(`/api/safety-groups?lat=${currentLocation.lat}&lon=${currentLocation.lng}`);
+        const response = await apiFetch(`/api/safety-groups?lat=${currentLocation.lat}&lon=${currentLocation.lng}`);
 
         const data = await response.json();
         
@@ -1001,23 +1102,29 @@ async function createComparisonVisualization() {
     const container = document.getElementById('comparison-chart');
     
     try {
-        const tempoResponse = await fetch(`/api/tempo?lat=${currentLocation.lat}&lon=${currentLocation.lng}`);
-        const tempoData = await tempoResponse.json();
-        
-        if (!tempoData.tempo || !tempoData.tempo.available) {
+        // Station/TEMPO pairs around the location, collocated server-side
+        const span = 0.25;
+        const bbox = [currentLocation.lng - span, currentLocation.lat - span,
+                      currentLocation.lng + span, currentLocation.lat + span].join(',');
+        const response = await apiFetch(`/api/tempo/collocation?bbox=${bbox}`);
+        const collocation = await response.json();
+
+        if (collocation.status !== 'success') {
             container.innerHTML = `<p style="text-align: center; opacity: 0.6;">TEMPO data unavailable</p>`;
             return;
         }
-        
-        const tempo = tempoData.tempo;
-        const freshness = tempo.freshness;
-        
-        const groundResponse = await fetch(`/api/air-quality?lat=${currentLocation.lat}&lon=${currentLocation.lng}`);
-        const groundData = await groundResponse.json();
-        
-        if (groundData.locations && groundData.locations.length > 0) {
-            const tempoAQI = tempo.aqi;
-            const groundAQI = groundData.locations[0].aqi;
+
+        const freshness = collocation.freshness;
+        const distance = (p) => Math.hypot(p.lat - currentLocation.lat, p.lng - currentLocation.lng);
+        const pair = collocation.pairs
+            .filter(p => p.ground_aqi !== null && (p.area_aqi !== null || p.tempo_aqi !== null))
+            .sort((a, b) => distance(a) - distance(b))[0];
+        const areaStats = collocation.stats.area;
+
+        if (pair) {
+            // QA-filtered neighbourhood mean; the single pixel is noisier
+            const tempoAQI = pair.area_aqi !== null ? pair.area_aqi : pair.tempo_aqi;
+            const groundAQI = pair.ground_aqi;
             const difference = Math.abs(tempoAQI - groundAQI);
             const accuracy = 100 - (difference / Math.max(tempoAQI, groundAQI) * 100);
             
@@ -1079,7 +1186,8 @@ async function createComparisonVisualization() {
                         </div>
                     </div>
                     <div class="accuracy-info">
-                        <p><strong>Satellite vs Ground:</strong> ${difference} AQI point difference</p>
+                        <p><strong>Satellite vs Ground:</strong> ${difference} AQI point difference at ${pair.name || 'nearest station'}</p>
+                        ${areaStats.pairs > 1 ? `<p style="font-size: 11px; opacity: 0.7;">Across ${areaStats.pairs} nearby stations: mean bias ${areaStats.mean_bias > 0 ? '+' : ''}${areaStats.mean_bias} AQI</p>` : ''}
                         <p style="font-size: 11px; opacity: 0.7; margin-top: 8px;">
                             ${accuracy > 85 ? 'Excellent' : accuracy > 70 ? 'Good' : 'Moderate'} agreement between data sources
                         </p>
@@ -1142,7 +1250,7 @@ async function sendChatMessage() {
     if (sendBtn) sendBtn.disabled = true;
     
     try {
-        const response = await fetch('/api/ai-chat', {
+        const response = await apiFetch('/api/ai-chat', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -1282,5 +1390,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 searchLocation();
             }
         });
+        searchInput.addEventListener('input', function() {
+            suggestLocations(searchInput.value);
+        });
     }
 });
\ No newline at end of file
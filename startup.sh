@@ -1,3 +1,6 @@
 #!/bin/bash
 cd backend
-gunicorn --bind=0.0.0.0:8000 --timeout 600 app:app
\ No newline at end of file
+# Always rebuild: a dist/ left from an older deploy would serve stale assets
+python build_assets.py
+# Workers, threads and preloading are configured in backend/gunicorn.conf.py
+gunicorn --config gunicorn.conf.py app:app
\ No newline at end of file